@@ -1,17 +1,34 @@
 import streamlit as st
-import matplotlib.pyplot as plt
 import numpy as np
-from tqdm import tqdm
 import copy
 import time
 
 import source
+import models
+import data_layer
+import jobs
+import shared_cache
+import well_log
+import leaderboard
+import validation
+import uncertainty
+import gis_store
+import serving
+import dataset_cache
+import explain
+import stages
+
+
+# Запас (м) вокруг интервала керна при загрузке ГИС из хранилища на диске
+GIS_STORE_MARGIN = 20.0
 
 
 #################################################################################################################
 def run():
     random_state = 322
     metrics = source.Metrics()
+    # Этапы обработки данных: при перезапуске выполняются только этапы с изменившимися входами
+    graph = stages.StageGraph()
 
 
     st.set_page_config(
@@ -29,7 +46,7 @@ def run():
                         с использованием различных алгоритмов ML с управляемой \
                         настройкой основных гиперпараметров.")
     
-    st.sidebar.info(r"**Важно:** для осуществления прогноза $\lambda_{\bot}$ или $K$ сначала выполните прогноз $\lambda_{\parallel}$ и сохраните результат, а потом загрузите его в соответствующем окне.")
+    st.sidebar.info(r"**Важно:** при прогнозе $\lambda_{\bot}$ сначала автоматически выполняется прогноз $\lambda_{\parallel}$ по всему интервалу, который затем используется для прогноза $K$ и расчета $\lambda_{\bot} = \lambda_{\parallel} / K$.")
 
 
     # Создаем сессию
@@ -75,6 +92,17 @@ def run():
         st.session_state = {}
         st.session_state['begin'] = False
 
+    def show_lith_distribution(core_counts, gis_counts, stage):
+        # Доли типов пород в керне и ГИС по распределениям well_log.code_counts
+        coverage = well_log.code_coverage(core_counts, gis_counts)
+        coverage.index = coverage.index.map(lambda code: f'{code:g}')
+        st.write(f'Типы пород в {stage} с измерениями на керне и в {stage} ГИС, % строк:')
+        st.bar_chart(coverage[['Керн, %', 'ГИС, %']], stack=False, sort=False, x_label='Тип породы', y_label='%')
+        missing = coverage.index[coverage['Керн'] == 0]
+        if len(missing):
+            st.write(f"Нет в данных керна: {', '.join(missing)} "
+                     f"({coverage.loc[missing, 'ГИС'].sum()} строк ГИС)")
+
     if st.session_state['begin']:
         col2.button('Сброс', on_click=hide_data_0)
         st.sidebar.button('Сброс', on_click=hide_data_0, key=10)
@@ -114,22 +142,52 @@ def run():
 
             col1.info("Загрузите таблицу, содержазую колонку с глубиной, колонки с \
                     данными ГИС и (опционально) колонку с типами пород. Таблица \
-                    должна быть отсортирована по возрастанию глубины с приведенными \
-                    к одной глубине данными ГИС.")
+                    должна содержать приведенные к одной глубине данные ГИС. \
+                    Строки будут упорядочены по глубине, повторяющиеся глубины усреднены.")
             
             col1.info(r"**Пример конфигурации таблицы** \
                     Глубина | ГИС-1 | ГИС-2 | ... | ГИС-n| Тип пород (опционально)")
             
+            # Несколько файлов или книга Excel с данными по листам разбираются параллельно в одну таблицу
+            multi_gis = col1.checkbox('Несколько файлов / все листы книг Excel', value=False, key='multi_gis')
             uploaded_gis = col1.file_uploader("TC_par", 
                                             type=['csv', 'xlsx'], 
+                                            accept_multiple_files=multi_gis,
                                             label_visibility='collapsed')
-            ALL_GIS = source.load_file_to_st(uploaded_gis, 'с данными ГИС')
+
+            # Режим хранения ГИС на диске: в память загружается только интервал, покрытый керном
+            use_gis_store = col1.checkbox('Хранить данные ГИС на диске (для таблиц, не помещающихся в память)', 
+                                          value=False)
+            # Глубина остается в float64, кривые ГИС приводятся к float32
+            gis_depth_name = col1.text_input("Название колонки с глубиной в данных ГИС:", "DEPT")
+            if use_gis_store:
+                ready_stores = {manifest['name']: manifest['path'] for manifest in gis_store.list_stores()}
+                store_name = col1.selectbox("Хранилище ГИС:", ['Загруженный файл'] + list(ready_stores))
+                if store_name != 'Загруженный файл':
+                    store = gis_store.GisStore(ready_stores[store_name])
+                elif uploaded_gis:
+                    store = gis_store.store_uploaded_file(uploaded_gis, gis_depth_name)
+                else:
+                    store = None
+                    st.error("Пожалуйста, загрузите файл с данными ГИС.")
+                ALL_GIS = None
+                if store is not None:
+                    col1.write(f"Хранилище {store.name}: {store.n_rows} строк, {len(store.columns)} колонок, "
+                               f"{store.nbytes / 2**20:.1f} МБ на диске.")
+            else:
+                store = None
+                if multi_gis:
+                    ALL_GIS = shared_cache.load_files_shared(uploaded_gis, 'с данными ГИС', 'all_gis', 
+                                                             keep=[gis_depth_name])
+                else:
+                    ALL_GIS = shared_cache.load_file_shared(uploaded_gis, 'с данными ГИС', 'all_gis', 
+                                                            keep=[gis_depth_name])
 
             # Добавляем данные в сессию
             st.session_state['all_gis_input'] = ALL_GIS
 
             # Проверяем и выводим данные из сессии
-            if 'all_gis_input' in st.session_state and st.session_state['all_gis_input'] is not None:
+            if store is not None or st.session_state['all_gis_input'] is not None:
                 col1.write(f"Данные введены")
             else:
                 col1.write("No user input yet.")
@@ -146,13 +204,34 @@ def run():
                     2. Для прогноза $\lambda_{\bot}$ или $K$: \
                     Глубина | $\lambda_{\parallel}$ | $K$| Тип пород (опционально)")
 
+            multi_data = col2.checkbox('Несколько файлов / все листы книг Excel', value=False, key='multi_data')
             uploaded_data = col2.file_uploader("data", 
                                             type=['csv', 'xlsx'], 
+                                            accept_multiple_files=multi_data,
                                             label_visibility='collapsed')
-            data = source.load_file_to_st(uploaded_data, 'с результатами измерений на керне')
+            # Таблица керна (глубины и прогнозируемые величины) остается в float64
+            if multi_data:
+                data = shared_cache.load_files_shared(uploaded_data, 'с результатами измерений на керне', 'data', 
+                                                      float32=False)
+            else:
+                data = shared_cache.load_file_shared(uploaded_data, 'с результатами измерений на керне', 'data', 
+                                                     float32=False)
+
+            if store is not None and data is not None:
+                ALL_GIS = store.interval(data[gis_depth_name].min(), data[gis_depth_name].max(), 
+                                         pad=GIS_STORE_MARGIN)
+                st.session_state['all_gis_input'] = ALL_GIS
+                col1.write(f"В память загружен интервал керна (с запасом {GIS_STORE_MARGIN} м): {ALL_GIS.shape[0]} строк.")
 
             st.session_state['data_input'] = data
 
+            # Исходные таблицы этапов обработки (ключ - хеш содержимого загруженных файлов)
+            if ALL_GIS is not None and data is not None:
+                data_source = graph.source('data', data, key=shared_cache.slot_key('data'))
+                gis_source = graph.source('all_gis', ALL_GIS, 
+                                          key=shared_cache.slot_key('all_gis') if store is None 
+                                          else (store.path, gis_depth_name, GIS_STORE_MARGIN, data_source.key))
+
 
             # ! ПРОВЕРКА ЧТО ДАННЫЕ УСПЕШНО ЗАГРУЖЕНЫ
 
@@ -214,18 +293,15 @@ def run():
 
                 assert lith_name in ALL_GIS.columns.values, 'В данных нет такой колонки с типами пород'
 
-                fig, ax = plt.subplots(1, 2, figsize=(12,5))
-                
-                ax[0].hist(data.sort_values(by=lith_name)[lith_name].astype(int).astype(str), bins=20)
-                ax[1].hist(ALL_GIS.sort_values(by=lith_name)[lith_name].astype(int).astype(str), bins=20)
-                
-                ax[0].xaxis.set_tick_params(rotation=45)
-                ax[1].xaxis.set_tick_params(rotation=45)
+                # Категориальная колонка передается CatBoost (cat_features) и XGBoost (enable_categorical)
+                # без one-hot колонок, остальным моделям - в виде разреженной матрицы
+                lith_encoding = st.selectbox("Представление типов пород:",
+                                             ('One-hot (плотные колонки)', 'Категориальный признак'))
+                lith_ohe = lith_encoding == 'One-hot (плотные колонки)'
 
-                ax[0].set_title('Типы пород в исходных данных с измерениями на керне')
-                ax[1].set_title('Типы пород в исходных данных ГИС')
-
-                st.pyplot(fig)
+                core_lith_counts = shared_cache.code_counts_shared(data[lith_name], 'lith_counts_core')
+                gis_lith_counts = shared_cache.code_counts_shared(ALL_GIS[lith_name], 'lith_counts_gis')
+                show_lith_distribution(core_lith_counts, gis_lith_counts, 'исходных данных')
 
             else:
                 st.info("Типы пород не будут использованы.")
@@ -250,7 +326,11 @@ def run():
 
             if use_lith:
                 shape_before = ALL_GIS.shape
-                ALL_GIS = ALL_GIS[ALL_GIS[lith_name].isin(data[lith_name])].reset_index(drop=True)
+                gis_source = graph.run('filter_lith', 
+                                       lambda gis, core: gis[well_log.codes_mask(gis[lith_name], core[lith_name])]
+                                       .reset_index(drop=True), 
+                                       gis_source, data_source, depends=(lith_name,))
+                ALL_GIS = gis_source.value
                 shape_after = ALL_GIS.shape
                 st.write(f"Размер таблицы с данными ГИС до исключения не представленных \
                         образцами керна типов пород:")
@@ -258,18 +338,10 @@ def run():
                 st.write(f"Размер после исключения:")
                 st.write(shape_after)
 
-                fig, ax = plt.subplots(1, 2, figsize=(12,5))
-                
-                ax[0].hist(data.sort_values(by=lith_name)[lith_name].astype(int).astype(str), bins=20)
-                ax[1].hist(ALL_GIS.sort_values(by=lith_name)[lith_name].astype(int).astype(str), bins=20)
-                
-                ax[0].xaxis.set_tick_params(rotation=45)
-                ax[1].xaxis.set_tick_params(rotation=45)
-
-                ax[0].set_title('Типы пород в новых данных с измерениями на керне')
-                ax[1].set_title('Типы пород в новых данных ГИС')
-
-                st.pyplot(fig)
+                # Распределение после исключения - часть исходного распределения ГИС по кодам керна
+                show_lith_distribution(core_lith_counts,
+                                       gis_lith_counts[gis_lith_counts.index.isin(core_lith_counts.index)],
+                                       'новых данных')
 
 
         # if st.session_state['load_data'] and st.session_state['lith']:
@@ -303,30 +375,114 @@ def run():
 
 
             # ? На этом этапе есть названия колонок с признаками с или без литотипов
-            all_gis = ALL_GIS.copy()
-            if lith_name in ALL_GIS.columns.values: 
-                all_gis = all_gis.drop(lith_name, axis=1)
-            
-            final_list = {}
-            for col_name in all_gis.columns.values:
-                if col_name == depth_name:
-                    continue
-                else:
-                    final_list[col_name] = all_gis[[depth_name, col_name]]
-
+            # Колонки ГИС берутся как представления ALL_GIS, без копирования таблицы
+            gis_columns = [col_name for col_name in ALL_GIS.columns.values 
+                           if col_name not in (depth_name, lith_name)]
+
+            # Таблицы один раз сортируются по глубине, дальше интервалы выбираются бинарным поиском
+            gis_log_stage = graph.run('index_gis', lambda gis: well_log.DepthIndexedLog(gis, depth_name, duplicates='mean'), 
+                                      gis_source, depends=(depth_name,))
+            core_log_stage = graph.run('index_core', lambda core: well_log.DepthIndexedLog(core, depth_name, duplicates='keep'), 
+                                       data_source, depends=(depth_name,))
+            gis_log, core_log = gis_log_stage.value, core_log_stage.value
+            if not gis_log.was_sorted or gis_log.n_duplicates or gis_log.n_dropped:
+                st.info(f"Данные ГИС упорядочены по глубине. Усреднено повторяющихся глубин: {gis_log.n_duplicates}, "
+                        f"удалено строк без глубины: {gis_log.n_dropped}.")
+            ALL_GIS, data = gis_log.frame, core_log.frame
+
+            # * Привязка глубин керна к ГИС: подбор сдвига по максимуму корреляции с опорной кривой
+            use_depth_shift = st.checkbox('Подобрать сдвиг глубин керна относительно ГИС?', value=False)
+            if use_depth_shift:
+                core_numeric = [col_name for col_name in data.columns.values 
+                                if col_name not in (depth_name, lith_name) 
+                                and pd.api.types.is_numeric_dtype(data[col_name])]
+                col_a, col_b = st.columns(2)
+                shift_core_name = col_a.selectbox("Измерения на керне:", core_numeric)
+                shift_gis_name = col_b.selectbox("Опорная кривая ГИС:", gis_columns)
+                col_a, col_b = st.columns(2)
+                max_shift = col_a.number_input("Максимальный сдвиг, м:", min_value=0.1, value=3.0, step=0.1)
+                shift_interval = col_b.number_input("Длина интервала для отдельного сдвига, м (0 - один сдвиг на скважину):", 
+                                                    min_value=0.0, value=0.0, step=10.0)
 
-            df_new4 = data.copy()
-            min_depth, max_depth = ALL_GIS[depth_name].min(), ALL_GIS[depth_name].max()
-            df_new4 = df_new4[(df_new4[depth_name] >= min_depth) \
-                                & (df_new4[depth_name] <= max_depth)].reset_index(drop=True)
-            
-            for key in tqdm(final_list.keys()):
-                selected_b = final_list[key][(final_list[key]['DEPT'] >= data['DEPT'].min()) & (final_list[key]['DEPT'] <= data['DEPT'].max())]
-                new_y2 = np.interp(data['DEPT'], selected_b['DEPT'], selected_b[final_list[key].columns.values[1]])
-                result = pd.DataFrame({final_list[key].columns.values[1]: new_y2})
-                df_new4 = pd.concat([df_new4, result], axis=1)
+                def shift_core(core_log, gis_log):
+                    time_0 = time.time()
+                    core, gis = core_log.frame, gis_log.frame
+                    depth_shifts = well_log.find_depth_shifts(core[depth_name], core[shift_core_name], 
+                                                              gis_log.depth, gis[shift_gis_name], 
+                                                              max_shift=max_shift, interval=shift_interval or None)
+                    search_time = time.time() - time_0
+                    shifted = core.copy()
+                    shifted[depth_name] = well_log.apply_depth_shifts(core[depth_name], depth_shifts)
+                    return depth_shifts, search_time, well_log.DepthIndexedLog(shifted, depth_name, duplicates='keep')
+
+                shift_stage = graph.run('depth_shift', shift_core, core_log_stage, gis_log_stage, 
+                                        depends=(depth_name, shift_core_name, shift_gis_name, max_shift, shift_interval))
+                depth_shifts, search_time, core_log = shift_stage.value
+                core_log_stage = shift_stage.derive('core_log', core_log)
+                st.write(f"Подобранные сдвиги глубин керна (исправленная глубина = глубина + shift), "
+                         f"время поиска: {1000 * search_time:.1f} мс:")
+                st.write(depth_shifts)
+                data = core_log.frame
+
+            # * Признаки по окну глубин: скользящие статистики кривых ГИС по всему интервалу
+            use_window_features = st.checkbox('Добавить признаки по окну глубин (скользящие статистики ГИС)?', value=False)
+            if use_window_features and use_gis_store:
+                st.warning('Признаки по окну глубин недоступны при хранении данных ГИС на диске.')
+                use_window_features = False
+            if use_window_features:
+                col_a, col_b = st.columns(2)
+                feature_window = col_a.number_input("Размер окна, м:", min_value=0.1, value=1.0, step=0.1)
+                window_stats = col_b.multiselect("Статистики:", well_log.ROLLING_STATS,
+                                                 default=['mean', 'std', 'grad'])
+                window_curves = st.multiselect("Кривые ГИС:", gis_columns, default=gis_columns)
 
-            data_to_pred = df_new4.copy()
+                def add_window_features(gis_log):
+                    time_0 = time.time()
+                    gis_window_features = gis_log.window_features(window_curves, feature_window, window_stats)
+                    window_time = time.time() - time_0
+                    # Признаки рассчитываются по всему интервалу ГИС и затем переносятся на глубины керна
+                    gis = pd.concat([gis_log.frame, gis_window_features], axis=1)
+                    return gis_window_features.columns.tolist(), window_time, well_log.DepthIndexedLog(gis, depth_name)
+
+                window_stage = graph.run('window_features', add_window_features, gis_log_stage, 
+                                         depends=(depth_name, window_curves, feature_window, window_stats))
+                window_columns, window_time, gis_log = window_stage.value
+                gis_log_stage = window_stage.derive('gis_log', gis_log)
+                st.write(f"Добавлено признаков: {len(window_columns)}, "
+                         f"время расчета: {1000 * window_time:.1f} мс.")
+
+                ALL_GIS = gis_log.frame
+                gis_columns = gis_columns + window_columns
+                feature_names = feature_names + window_columns
+
+            # * Апскейлинг: осреднение кривых ГИС в окне, соответствующем вертикальному разрешению прибора
+            use_upscaling = st.checkbox('Осреднить данные ГИС в окне (апскейлинг)?', value=False)
+            upscaling_window, upscale_core = None, False
+            if use_upscaling:
+                upscaling_window = st.number_input("Размер окна осреднения, м:", min_value=0.0, value=0.6, step=0.1)
+                upscale_core = st.checkbox('Осреднить в том же окне значения измерений на керне?', value=False)
+                st.info(f"Значения ГИС осредняются в окне {upscaling_window} м вокруг глубин образцов керна.")
+
+            def interpolate(core_log, gis_log):
+                df_new4 = core_log.interval(gis_log.min_depth, gis_log.max_depth).reset_index(drop=True)
+                if use_upscaling:
+                    if upscale_core:
+                        core_columns = [col_name for col_name in df_new4.columns.values 
+                                        if col_name not in (depth_name, lith_name) 
+                                        and pd.api.types.is_float_dtype(df_new4[col_name])]
+                        df_new4[core_columns] = core_log.upscale(upscaling_window, core_columns, 
+                                                                 at=df_new4[depth_name]).to_numpy()
+                    gis_at_core = gis_log.upscale(upscaling_window, gis_columns, at=df_new4[depth_name])
+                else:
+                    gis_at_core = gis_log.interp(df_new4[depth_name], gis_columns)
+                return pd.concat([df_new4, gis_at_core], axis=1)
+
+            interp_stage = graph.run('interpolate', interpolate, core_log_stage, gis_log_stage, 
+                                     depends=(depth_name, lith_name, gis_columns, use_upscaling, 
+                                              upscaling_window, upscale_core))
+            # Этап ГИС по всему интервалу для предобработки (после сортировки и признаков по окну)
+            gis_source = gis_log_stage.derive('all_gis', ALL_GIS)
+            data_to_pred = interp_stage.value
             
 
 
@@ -386,7 +542,8 @@ def run():
             what_to_predict = st.selectbox("Предсказывать: ", 
                                             ("TC_par", 
                                             "TC_per",
-                                            "VHC"))
+                                            "VHC",
+                                            "TC_par + VHC + K"))
             
             st.info(f"Конфигурация прогноза: {what_to_predict}")
 
@@ -414,62 +571,66 @@ def run():
             elif what_to_predict == 'VHC':
                 vhc_name = st.text_input(r"Введите название колонки с $C_p$:", "VHC_ups")
                 st.info(f"Прогнозируемая величина: {vhc_name}")
+            elif what_to_predict == 'TC_par + VHC + K':
+                tc_par_name = st.text_input(r"Введите название колонки с $\lambda_{\parallel}$:", "TC_par_ups")
+                vhc_name = st.text_input(r"Введите название колонки с $C_p$:", "VHC_ups")
+                anisotropy_name = st.text_input(r"Введите название колонки с $K = \frac{\lambda_{\parallel}}{\lambda_{\bot}}$:", "Anisotropy_ups")
+                target_names = st.multiselect("Прогнозируемые величины:", 
+                                              [tc_par_name, vhc_name, anisotropy_name], 
+                                              default=[tc_par_name, vhc_name, anisotropy_name])
+                st.info(f"Совместный прогноз по одной выборке: {', '.join(target_names)}")
                 
             
+            # Строки с заполненными признаками и целевыми величинами; редкие типы пород дублируются
+            def balance(name, columns):
+                return graph.run(name, lambda table: source.training_rows(table, columns, lith_name if use_lith else None), 
+                                 interp_stage, depends=(columns, use_lith, lith_name))
+
             if what_to_predict == 'TC_par':
-                data_to_pred = data_to_pred[[depth_name] + feature_names + [tc_par_name]].dropna().reset_index(drop=True)
-                if use_lith:
-                    unique_value_counts = data_to_pred[lith_name].value_counts()
-                    need_to_replicate = unique_value_counts[unique_value_counts<=2].index.values
-                    for val in need_to_replicate:
-                        data_to_pred = pd.concat((data_to_pred, data_to_pred[data_to_pred[lith_name] == val]), axis=0).reset_index(drop=True)
-                y = data_to_pred[tc_par_name]
+                balance_stage = balance('balance', [depth_name] + feature_names + [tc_par_name])
+                data_to_pred = balance_stage.value
+                y_columns = tc_par_name
                 mode_pred = 'tc_par'
-                X = data_to_pred[feature_names]
+                X_columns = feature_names
 
             elif what_to_predict == 'TC_per':
-                data_to_tc_par = data_to_pred[[depth_name] + feature_names + [tc_par_name]].dropna().reset_index(drop=True)
-                if use_lith:
-                    unique_value_counts = data_to_tc_par[lith_name].value_counts()
-                    need_to_replicate = unique_value_counts[unique_value_counts<=2].index.values
-                    for val in need_to_replicate:
-                        data_to_tc_par = pd.concat((data_to_tc_par, data_to_tc_par[data_to_tc_par[lith_name] == val]), axis=0).reset_index(drop=True)
+                balance_tc_par_stage = balance('balance_tc_par', [depth_name] + feature_names + [tc_par_name])
+                data_to_tc_par = balance_tc_par_stage.value
                 y_to_tc_par = data_to_tc_par[tc_par_name]
                 X_to_tc_par = data_to_tc_par[feature_names]
-                Dept_to_tc_par = data_to_tc_par[depth_name]
 
-                data_to_pred = data_to_pred[[depth_name] + feature_names + [anisotropy_name] + [tc_par_name] + [tc_per_name]].dropna().reset_index(drop=True)
-                if use_lith:
-                    unique_value_counts = data_to_pred[lith_name].value_counts()
-                    need_to_replicate = unique_value_counts[unique_value_counts<=2].index.values
-                    for val in need_to_replicate:
-                        data_to_pred = pd.concat((data_to_pred, data_to_pred[data_to_pred[lith_name] == val]), axis=0).reset_index(drop=True)
-                y = data_to_pred[anisotropy_name]
+                balance_stage = balance('balance', [depth_name] + feature_names + [anisotropy_name] + [tc_par_name] + [tc_per_name])
+                data_to_pred = balance_stage.value
+                y_columns = anisotropy_name
                 mode_pred = 'anisotropy'
-                X = data_to_pred[feature_names + [tc_par_name]]
+                X_columns = feature_names + [tc_par_name]
 
             elif what_to_predict == 'VHC':
-                data_to_pred = data_to_pred[[depth_name] + feature_names + [vhc_name]].dropna().reset_index(drop=True)
-                if use_lith:
-                    unique_value_counts = data_to_pred[lith_name].value_counts()
-                    need_to_replicate = unique_value_counts[unique_value_counts<=2].index.values
-                    for val in need_to_replicate:
-                        data_to_pred = pd.concat((data_to_pred, data_to_pred[data_to_pred[lith_name] == val]), axis=0).reset_index(drop=True)
-                y = data_to_pred[vhc_name]
+                balance_stage = balance('balance', [depth_name] + feature_names + [vhc_name])
+                data_to_pred = balance_stage.value
+                y_columns = vhc_name
                 mode_pred = 'vhc'
-                X = data_to_pred[feature_names]
+                X_columns = feature_names
+
+            elif what_to_predict == 'TC_par + VHC + K':
+                # Общая выборка: образцы, для которых измерены все выбранные величины
+                balance_stage = balance('balance', [depth_name] + feature_names + target_names)
+                data_to_pred = balance_stage.value
+                y_columns = target_names
+                mode_pred = 'tc_par'
+                X_columns = feature_names
+
+            y = data_to_pred[y_columns]
+            X = data_to_pred[X_columns]
 
 
                 
             Dept = data_to_pred[depth_name]
 
             def df_to_csv(df, filename, button_text, add_key=''):
-                @st.cache_data
-                def convert_df(df):
-                    return df.to_csv(index=False).encode('utf-8')
-
-
-                csv = convert_df(df)
+                # Выгрузка - этап с входом df (ключ по хешу содержимого таблицы)
+                csv = graph.run(f'export_{filename}{add_key}', 
+                                lambda df: df.to_csv(index=False).encode('utf-8'), df).value
 
                 st.download_button(f"{button_text}", # label
                                     csv, # data
@@ -478,62 +639,78 @@ def run():
                                     key='download-csv'+add_key)
             
 
-            if use_lith:
-                X_train_orig, X_test_orig, \
-                    y_train_tc_par, y_test_tc_par, \
-                    Dept_train_tc_par, Dept_test_tc_par = train_test_split(X, y, Dept, test_size=0.3, 
-                                                                    random_state=random_state, 
-                                                                    shuffle=True, stratify=X[lith_name])
+            # float32: признаки масштабируются на месте и остаются float32 до прогноза (вдвое меньше памяти)
+            feature_precision = st.selectbox("Точность признаков:", tuple(source.FEATURE_DTYPES))
+            feature_dtype = source.FEATURE_DTYPES[feature_precision]
 
-                feature_names2 = copy.deepcopy(feature_names)
-                feature_names2.remove(lith_name)
+            def preprocess(X, y, Dept, gis_table, mode_pred):
+                """
+                Разбиение на обучающую и тестовую выборки и масштабирование признаков,
+                в том числе данных ГИС `gis_table` по всему интервалу.
+                Последний элемент результата - предобработка произвольной части данных ГИС (source.GisTransform).
+                """
+                if use_lith:
+                    X_train_orig, X_test_orig, \
+                        y_train_tc_par, y_test_tc_par, \
+                        Dept_train_tc_par, Dept_test_tc_par = train_test_split(X, y, Dept, test_size=0.3, 
+                                                                        random_state=random_state, 
+                                                                        shuffle=True, stratify=X[lith_name])
+
+                    feature_names2 = copy.deepcopy(feature_names)
+                    feature_names2.remove(lith_name)
+
+                    X_train_combined, X_test_combined, \
+                        ALL_GIS_combined, scaler = source.get_preprocessed_data(X_train_orig, X_test_orig, 
+                                                                                gis_table, mode='ss', do_ohe=lith_ohe,
+                                                                                lith_name=lith_name, mode_pred=mode_pred,
+                                                                                feature_names=feature_names2, 
+                                                                                tc_par_name=tc_par_name if mode_pred == 'anisotropy' else '',
+                                                                                dtype=feature_dtype)
+                    numeric_features = feature_names2 + [tc_par_name] if mode_pred == 'anisotropy' else feature_names2
+                    categories = None if lith_ohe else X_train_combined[lith_name].cat.categories
+                    train_columns = X_train_combined.columns if lith_ohe else numeric_features
+                    transform = source.GisTransform(scaler, numeric_features, lith_name=lith_name, 
+                                                    train_columns=train_columns, do_ohe=lith_ohe, 
+                                                    categories=categories, dtype=feature_dtype)
 
-                X_train_combined, X_test_combined, \
-                    ALL_GIS_combined, scaler = source.get_preprocessed_data(X_train_orig, X_test_orig, 
-                                                                            ALL_GIS, mode='ss', do_ohe=True,
-                                                                            lith_name=lith_name, mode_pred=mode_pred,
-                                                                            feature_names=feature_names2, 
-                                                                            tc_par_name=tc_par_name if what_to_predict != 'VHC' else '')
-                
-                if what_to_predict in ['TC_par', 'VHC']:
-                    pass
                 else:
-                    st.session_state['pred_all_tc_par'] = ALL_GIS_combined
-
-
+                    X_train_orig, X_test_orig, \
+                    y_train_tc_par, y_test_tc_par, \
+                    Dept_train_tc_par, Dept_test_tc_par = train_test_split(X, y, Dept, test_size=0.3, 
+                                                                    random_state=random_state, 
+                                                                    shuffle=True)#, stratify=X[lith_name])
+
+                    scaler = source.make_scaler('ss')
+                    columns = list(X.columns)
+                    X_train_combined = source.scale_columns(X_train_orig, columns, scaler, dtype=feature_dtype, fit=True)
+                    X_test_combined = source.scale_columns(X_test_orig, columns, scaler, dtype=feature_dtype)
+                    ALL_GIS_combined = source.scale_columns(gis_table, columns, scaler, dtype=feature_dtype)
+                    transform = source.GisTransform(scaler, columns, dtype=feature_dtype)
+
+                return X_train_orig, X_test_orig, y_train_tc_par, y_test_tc_par, \
+                    X_train_combined, X_test_combined, ALL_GIS_combined, transform
+
+            # Разбиение и предобработка зависят от выбранных колонок и представления типов пород
+            preprocess_depends = (use_lith, lith_name, use_lith and lith_ohe, tc_par_name if mode_pred == 'anisotropy' else '', 
+                                  random_state, feature_precision)
+
+            def preprocess_stage(name, balance_stage, X_columns, y_columns, mode_pred, *extra_inputs, gis_fn=None):
+                def run_preprocess(table, gis, *extra):
+                    gis_table = gis_fn(gis, *extra) if gis_fn is not None else gis
+                    return preprocess(table[X_columns], table[y_columns], table[depth_name], gis_table, mode_pred)
+
+                return graph.run(name, run_preprocess, balance_stage, gis_source, *extra_inputs, 
+                                 depends=(X_columns, y_columns, mode_pred) + preprocess_depends)
+
+            if what_to_predict in ['TC_par', 'VHC', 'TC_par + VHC + K']:
+                X_train_orig, X_test_orig, y_train_tc_par, y_test_tc_par, \
+                    X_train_combined, X_test_combined, ALL_GIS_combined, transform = \
+                    preprocess_stage('preprocess', balance_stage, X_columns, y_columns, mode_pred).value
             else:
-                X_train_orig, X_test_orig, \
-                y_train_tc_par, y_test_tc_par, \
-                Dept_train_tc_par, Dept_test_tc_par = train_test_split(X, y, Dept, test_size=0.3, 
-                                                                random_state=random_state, 
-                                                                shuffle=True)#, stratify=X[lith_name])
-
-                from sklearn.preprocessing import StandardScaler
-                scaler = StandardScaler()
-                scaler.fit(X_train_orig)
-                X_train_combined = scaler.transform(X_train_orig)
-                X_test_combined = scaler.transform(X_test_orig)
-                
-                if what_to_predict in ['TC_par', 'VHC']:
-                    ALL_GIS_combined = scaler.transform(ALL_GIS.drop(columns=[depth_name, lith_name]))
-                else:
-                    st.write(r"Для получения прогноза $\lambda_{\bot}$ на весь интервал, загрузите полученный ранее прогноз $\lambda_{\parallel}$ по всему интервалу:")
-
-                    if st.session_state['load_data'] \
-                        and st.session_state['lith'] \
-                        and st.session_state['what_to_pred']:# \
-                        # and st.session_state['load_tc_par']:
-
-
-                        uploaded_tc_par_pred = st.file_uploader("TC_par_pred", 
-                                                                type=['csv', 'xlsx'], 
-                                                                label_visibility='collapsed',
-                                                                key='0')
-                        
-                        st.session_state['pred_all_tc_par'] = source.load_file_to_st(uploaded_tc_par_pred, 'с ранее спрогнозированным значением $\lambda_{\parallel}$')
-                        
-                        if st.session_state['pred_all_tc_par'] is not None:
-                            ALL_GIS_combined = scaler.transform(pd.concat((ALL_GIS, st.session_state['pred_all_tc_par'].iloc[:,-1]), axis=1).rename(columns={'TC_par_pred': tc_par_name}).drop(columns=[depth_name, lith_name]))
+                # Цепочка TC_par -> K -> TC_per: сначала λ∥ прогнозируется по тем же данным ГИС,
+                # затем прогноз λ∥ по всему интервалу используется как признак модели K
+                prep_tc_par = preprocess_stage('preprocess_tc_par', balance_tc_par_stage, feature_names, tc_par_name, 
+                                               'tc_par').value
 
             # st.write(st.session_state)
             if what_to_predict != 'TC_per':
@@ -553,17 +730,11 @@ def run():
         if 'select_model' not in st.session_state:
             st.session_state['select_model'] = False
 
-        if st.session_state['load_data'] \
-            and st.session_state['lith'] \
-            and st.session_state['what_to_pred']:
-            if what_to_predict in ['TC_par', 'VHC']:
-                st.session_state['pred_all_tc_par'] = None
-
         # st.write(st.session_state['what_to_predict'], st.session_state['what_to_predict_prev'])
         if st.session_state['load_data'] \
             and st.session_state['lith'] \
             and st.session_state['what_to_pred']:
-            if st.session_state['what_to_predict'] != st.session_state['what_to_predict_prev'] and st.session_state['pred_all_tc_par'] is None:
+            if st.session_state['what_to_predict'] != st.session_state['what_to_predict_prev']:
                 st.session_state['select_model'] = False
                 st.session_state['predict'] = False
 
@@ -586,36 +757,33 @@ def run():
                             "Gradient Boosting", 
                             "XGBoost",
                             "CatBoost",
-                            "Stacking"))
+                            "Stacking",
+                            "Сравнить все модели"))
             
             st.info(f"Выбранная модель: {model_mode}")
 
-            def predictor(pred_name):
-                def display_title_metrics(pred_name):
-                    if pred_name == 'TC_par':
-                        st.write(r"Метрики для $\lambda_{\parallel}$")
-                    elif pred_name == 'TC_per':
-                        st.write(r"Метрики для $\lambda_{\bot}$")
-                    elif pred_name == 'Anisotropy':
-                        st.write(r"Метрики для $K$")
-                    elif pred_name == 'VHC':
-                        st.write(r"Метрики для $C_p$")
-                    elif pred_name is None:
-                        pass
+            def display_title_metrics(pred_name):
+                if pred_name == 'TC_par':
+                    st.write(r"Метрики для $\lambda_{\parallel}$")
+                elif pred_name == 'TC_per':
+                    st.write(r"Метрики для $\lambda_{\bot}$")
+                elif pred_name == 'Anisotropy':
+                    st.write(r"Метрики для $K$")
+                elif pred_name == 'VHC':
+                    st.write(r"Метрики для $C_p$")
+                elif pred_name is None:
+                    pass
 
+            def select_model():
+                """
+                Выбор гиперпараметров модели. Возвращает обучающую функцию и ее аргументы.
+                """
+                fit_kwargs = {}
                 if model_mode == "Linear Regression":
-                    from sklearn.linear_model import LinearRegression
-                    model = LinearRegression()
-                    model.fit(X_train_combined, y_train_tc_par)
-                    y_pred_tc_par = model.predict(X_test_combined)
-                    pred_all_tc_par = model.predict(ALL_GIS_combined)
-                    if pred_name is not None:
-                        display_title_metrics(pred_name)
-                        source.get_metrics(y_test_tc_par, y_pred_tc_par)
+                    model = models.build_model(model_mode)
+                    fit_fn, fit_args = models.fit_predict, (model,)
 
                 elif model_mode == "Decision Tree":
-                    from sklearn.tree import DecisionTreeRegressor
-
                     params = {'max_depth': None, # None or int
                             'min_samples_split': 2,
                             'min_samples_leaf': 1}
@@ -640,17 +808,10 @@ def run():
                     st.write(params)
                     params['random_state'] = 42
 
-                    model = DecisionTreeRegressor(**params)
-                    model.fit(X_train_combined, y_train_tc_par)
-                    y_pred_tc_par = model.predict(X_test_combined)
-                    pred_all_tc_par = model.predict(ALL_GIS_combined)
-                    if pred_name is not None:
-                        display_title_metrics(pred_name)
-                        source.get_metrics(y_test_tc_par, y_pred_tc_par)          
+                    model = models.build_model(model_mode, params)
+                    fit_fn, fit_args = models.fit_predict, (model,)
 
                 elif model_mode == "Gradient Boosting":
-                    from sklearn.ensemble import GradientBoostingRegressor
-
                     params = {'max_depth': 3, # None or int
                             'learning_rate': 0.01,
                             'n_estimators': 200}
@@ -675,17 +836,10 @@ def run():
                     st.write(params)
                     params['random_state'] = 42
 
-                    model = GradientBoostingRegressor(**params)
-                    model.fit(X_train_combined, y_train_tc_par)
-                    y_pred_tc_par = model.predict(X_test_combined)
-                    pred_all_tc_par = model.predict(ALL_GIS_combined)
-                    if pred_name is not None:
-                        display_title_metrics(pred_name)
-                        source.get_metrics(y_test_tc_par, y_pred_tc_par)
+                    model = models.build_model(model_mode, params)
+                    fit_fn, fit_args = models.fit_predict, (model,)
 
                 elif model_mode == "XGBoost":
-                    import xgboost as xgb
-
                     params = {'max_depth': 7, # None or int
                             'learning_rate': 0.5,
                             'n_estimators': 200}
@@ -709,18 +863,12 @@ def run():
                     st.write("Selected Parameters:")
                     st.write(params)
                     params['random_state'] = 42
+                    params['tree_method'] = 'hist'
 
-                    model = xgb.XGBRegressor(**params)
-                    model.fit(X_train_combined, y_train_tc_par)
-                    y_pred_tc_par = model.predict(X_test_combined)
-                    pred_all_tc_par = model.predict(ALL_GIS_combined)
-                    if pred_name is not None:
-                        display_title_metrics(pred_name)
-                        source.get_metrics(y_test_tc_par, y_pred_tc_par) 
+                    model = models.build_model(model_mode, params)
+                    fit_fn, fit_args = models.fit_predict, (model,)
 
                 elif model_mode == "CatBoost":
-                    from catboost import CatBoostRegressor
-
                     params = {'depth': 7, # None or int
                             'learning_rate': 0.5,
                             'l2_leaf_reg': 5,
@@ -749,21 +897,12 @@ def run():
                     params['random_state'] = 42
                     params['task_type'] = 'CPU'
                     params['silent'] = True
+                    params['allow_writing_files'] = False
 
-                    model = CatBoostRegressor(**params)
-                    model.fit(X_train_combined, y_train_tc_par)
-                    y_pred_tc_par = model.predict(X_test_combined)
-                    pred_all_tc_par = model.predict(ALL_GIS_combined)
-                    if pred_name is not None:
-                        display_title_metrics(pred_name)
-                        source.get_metrics(y_test_tc_par, y_pred_tc_par)
+                    model = models.build_model(model_mode, params)
+                    fit_fn, fit_args = models.fit_predict, (model,)
 
                 elif model_mode == "Stacking":
-                    from sklearn.linear_model import LinearRegression
-                    from sklearn.ensemble import GradientBoostingRegressor
-                    import xgboost as xgb
-                    from catboost import CatBoostRegressor
-
                     params_gb = {'max_depth': 3, # None or int
                             'learning_rate': 0.01,
                             'n_estimators': 200}
@@ -837,31 +976,219 @@ def run():
 
                     params_cb['task_type'] = 'CPU'
                     params_cb['silent'] = True
+                    params_cb['allow_writing_files'] = False
 
-                    model_gb = GradientBoostingRegressor(**params_gb)
-                    model_xgb = xgb.XGBRegressor(**params_xgb)
-                    model_cb = CatBoostRegressor(**params_cb)
-                    models = [model_gb, model_xgb, model_cb]
-                    
-                    for model in models:
-                        model.fit(X_train_combined, y_train_tc_par)
-                    
-                    for model in  models:
-                        print('MSE of ', model.__class__.__name__, ' on test:', metrics.mse(y_test_tc_par, model.predict(X_test_combined)))
-                    
-                    meta_model = LinearRegression()
-                    meta_model.fit(X_train_combined, y_train_tc_par)
-                    print('MSE of metaregressor on original datasets features on test: ', metrics.mse(y_test_tc_par, meta_model.predict(X_test_combined)))
+                    model_gb = models.build_model("Gradient Boosting", params_gb)
+                    model_xgb = models.build_model("XGBoost", params_xgb)
+                    model_cb = models.build_model("CatBoost", params_cb)
+                    base_models = [model_gb, model_xgb, model_cb]
+                    meta_model = models.build_model("Linear Regression")
 
                     n = 5
-                    y_pred_tc_par, model = source.metaregressor(models, meta_model, X_train_combined, X_test_combined, y_train_tc_par, n)
-                    pred_all_tc_par, model = source.metaregressor(models, meta_model, X_train_combined, ALL_GIS_combined, y_train_tc_par, n)
-                    if pred_name is not None:
-                        display_title_metrics(pred_name)
-                        source.get_metrics(y_test_tc_par, y_pred_tc_par)
+                    fit_fn, fit_args = models.fit_predict_stacking, (base_models, meta_model)
+                    fit_kwargs = {'cv': n}
+
+                return fit_fn, fit_args, fit_kwargs
+
+            def predictor(pred_name, model_spec, X_train_combined, y_train_tc_par, 
+                          X_test_combined, y_test_tc_par, ALL_GIS_combined, show_metrics=True):
+                # Каждое звено цепочки обучает собственную копию выбранной модели
+                fit_fn, fit_args, fit_kwargs = model_spec
+                fit_args = models.clone_models(fit_args)
+
+                # Обучение выполняется в фоновом пуле, страница отображает прогресс
+                signature = (pred_name, model_mode, models.model_signature(fit_args), repr(fit_kwargs),
+                             source.fingerprint(X_train_combined, y_train_tc_par, ALL_GIS_combined))
+                result = jobs.run_in_background(pred_name, signature, fit_fn, *fit_args,
+                                                X_train_combined, y_train_tc_par,
+                                                X_test_combined, ALL_GIS_combined, **fit_kwargs)
+                if result is None:
+                    st.stop()
+                y_pred_tc_par, pred_all_tc_par, model = result
+
+                if show_metrics:
+                    display_title_metrics(pred_name)
+                    source.get_metrics(y_test_tc_par, y_pred_tc_par)
+                if isinstance(model, models.LithEnsemble):
+                    with st.expander(f'Модели {pred_name} по типам пород'):
+                        st.dataframe(model.summary())
 
                 return y_pred_tc_par, pred_all_tc_par, model
-            
+
+            def cross_validation(pred_name, model_spec, X, y):
+                """
+                Повторная K-fold кросс-валидация выбранной модели (фолды обучаются параллельно).
+                """
+                if not st.checkbox('Оценить модель повторной кросс-валидацией', key=f'cv_{pred_name}'):
+                    return
+                n_splits = st.slider('Число фолдов', 2, 10, 5, step=1, key=f'cv_splits_{pred_name}')
+                n_repeats = st.slider('Число повторений', 1, 10, 3, step=1, key=f'cv_repeats_{pred_name}')
+
+                fit_fn, fit_args, fit_kwargs = model_spec
+                numeric_features = [name for name in X.columns if name != lith_name] if use_lith else list(X.columns)
+                signature = ('CV', pred_name, model_mode, models.model_signature(fit_args), repr(fit_kwargs),
+                             n_splits, n_repeats, use_lith and lith_ohe, feature_precision, source.fingerprint(X, y))
+                result = jobs.run_in_background(f'CV_{pred_name}', signature, validation.cross_validate,
+                                                fit_fn, models.clone_models(fit_args), X, y, numeric_features,
+                                                lith_name=lith_name if use_lith else None,
+                                                n_splits=n_splits, n_repeats=n_repeats,
+                                                random_state=random_state, 
+                                                do_ohe=lith_ohe if use_lith else True, dtype=feature_dtype, 
+                                                **fit_kwargs)
+                if result is None:
+                    st.stop()
+                fold_metrics, summary, wall_time = result
+
+                st.write(f"Кросс-валидация: {len(fold_metrics)} обучений, общее время {wall_time:.3} с.")
+                st.write(summary)
+                with st.expander('Метрики по фолдам'):
+                    st.write(fold_metrics)
+
+            def uncertainty_bands(pred_name, model_spec, pred_all, X_train_combined, y_train,
+                                  X_test_combined, y_test, ALL_GIS_combined):
+                """
+                Интервалы неопределенности прогноза P10/P50/P90 по всему интервалу ГИС.
+                """
+                if not st.checkbox('Оценить неопределенность прогноза (P10/P50/P90)', key=f'unc_{pred_name}'):
+                    return
+                if use_gis_store:
+                    st.warning('Оценка неопределенности недоступна при хранении данных ГИС на диске.')
+                    return
+
+                fit_fn, fit_args, fit_kwargs = model_spec
+                signature = ('Uncertainty', pred_name, model_mode, models.model_signature(fit_args),
+                             source.fingerprint(X_train_combined, y_train, ALL_GIS_combined))
+                result = jobs.run_in_background(f'Uncertainty_{pred_name}', signature,
+                                                uncertainty.fit_predict_quantiles,
+                                                fit_fn, models.clone_models(fit_args),
+                                                X_train_combined, y_train, X_test_combined, ALL_GIS_combined)
+                if result is None:
+                    st.stop()
+                q_test, q_all, method = result
+
+                st.write(f"Способ оценки: {method}. Доля измерений тестовой выборки в интервале P10-P90: "
+                         f"{uncertainty.coverage(y_test, q_test[:, 0], q_test[:, -1]):.0%}")
+
+                bands = pd.DataFrame({depth_name: ALL_GIS[depth_name],
+                                      f'{pred_name}_pred': pred_all,
+                                      f'{pred_name}_P10': q_all[:, 0],
+                                      f'{pred_name}_P50': q_all[:, 1],
+                                      f'{pred_name}_P90': q_all[:, 2]})
+
+                import plotly.graph_objects as go
+
+                fig = go.Figure()
+                fig.add_trace(go.Scatter(x=bands[f'{pred_name}_P10'], y=bands[depth_name], mode='lines',
+                                         line_width=0, showlegend=False))
+                fig.add_trace(go.Scatter(x=bands[f'{pred_name}_P90'], y=bands[depth_name], mode='lines',
+                                         line_width=0, fill='tonextx', name='P10-P90'))
+                fig.add_trace(go.Scatter(x=bands[f'{pred_name}_P50'], y=bands[depth_name], mode='lines', name='P50'))
+                fig.add_trace(go.Scatter(x=bands[f'{pred_name}_pred'], y=bands[depth_name], mode='lines', name='Прогноз'))
+                fig.update_yaxes(autorange="reversed")
+                fig.update_layout(yaxis_title='Глубина, м', xaxis_title=pred_name, font_size=10, width=500, height=1000)
+                st.plotly_chart(fig)
+
+                df_to_csv(bands,
+                          filename=model_name +'_'+pred_name+'_P10_P50_P90'+'_'+'use_lith_'+str(use_lith),
+                          button_text=f'Скачать прогноз {pred_name} с интервалами P10/P50/P90',
+                          add_key=f'unc_{pred_name}')
+
+            def attribution_tracks(pred_name, model, X_train_combined, y_train, ALL_GIS_combined, transform):
+                """
+                Вклады кривых ГИС в прогноз по глубине (TreeSHAP моделей XGBoost и CatBoost).
+                """
+                if not st.checkbox('Показать вклады кривых ГИС в прогноз (SHAP)', key=f'shap_{pred_name}'):
+                    return
+                if use_gis_store:
+                    st.warning('Вклады признаков недоступны при хранении данных ГИС на диске.')
+                    return
+                if not explain.supports_attributions(model):
+                    st.warning('Вклады признаков доступны для моделей XGBoost и CatBoost.')
+                    return
+
+                n_rows = ALL_GIS_combined.shape[0]
+                rows = None
+                if st.checkbox('Рассчитать по стратифицированной выборке строк', value=n_rows > 20_000, 
+                               key=f'shap_sample_{pred_name}'):
+                    sample_size = st.number_input('Размер выборки', 100, max(n_rows, 100), min(10_000, n_rows), 
+                                                  step=1000, key=f'shap_size_{pred_name}')
+                    # Страты - типы пород или интервалы глубин с равным числом строк
+                    strata = ALL_GIS[lith_name] if use_lith else explain.depth_strata(ALL_GIS[depth_name])
+                    rows = explain.stratified_sample(strata, int(sample_size), random_state=random_state)
+
+                # One-hot колонки типов пород объединяются в один признак
+                # (без типов пород данные ГИС - массив, названия колонок берутся из предобработки)
+                groups = None
+                if isinstance(ALL_GIS_combined, pd.DataFrame):
+                    groups = {col: lith_name for col in ALL_GIS_combined.columns 
+                              if use_lith and str(col).startswith(f'{lith_name}_')}
+                signature = ('SHAP', pred_name, model_mode, models.model_signature(model), 
+                             source.fingerprint(X_train_combined, y_train, ALL_GIS_combined, rows))
+                attributions = jobs.run_in_background(f'SHAP_{pred_name}', signature, explain.feature_attributions, 
+                                                      model, ALL_GIS_combined, rows=rows, groups=groups, 
+                                                      feature_names=transform.columns)
+                if attributions is None:
+                    st.stop()
+
+                importance = explain.mean_abs_attributions(attributions)
+                st.write(f'Средний модуль вклада в прогноз {pred_name} ({len(attributions)} строк ГИС):')
+                st.bar_chart(importance, horizontal=True, sort=False)
+
+                import plotly.graph_objects as go
+                from plotly.subplots import make_subplots
+
+                top = list(importance.index[:6])
+                depth = ALL_GIS[depth_name].to_numpy()[attributions.index]
+                fig = make_subplots(rows=1, cols=len(top), shared_yaxes=True, subplot_titles=top)
+                mode = 'lines' if rows is None else 'markers'
+                for i, feature in enumerate(top, start=1):
+                    fig.add_trace(go.Scattergl(x=attributions[feature], y=depth, mode=mode, marker_size=2, 
+                                               name=feature, showlegend=False), row=1, col=i)
+                    fig.add_vline(x=0, line_width=1, line_color='grey', row=1, col=i)
+                fig.update_yaxes(autorange="reversed", title_text='Глубина, м', col=1)
+                fig.update_layout(font_size=10, height=1000)
+                st.plotly_chart(fig)
+
+                df_to_csv(pd.concat([pd.DataFrame({depth_name: depth}, index=attributions.index), attributions], axis=1),
+                          filename=model_name +'_'+pred_name+'_SHAP'+'_'+'use_lith_'+str(use_lith),
+                          button_text=f'Скачать вклады признаков в прогноз {pred_name}',
+                          add_key=f'shap_{pred_name}')
+
+            def store_prediction(pred_name, model, X_train_combined, y_train, predict_chunk):
+                """
+                Постраничный прогноз по всему интервалу хранилища ГИС на диске.
+
+                Возвращает глубины и прогноз `predict_chunk` для всех строк хранилища
+                (с исключением не представленных керном типов пород). Результат
+                кэшируется для обученной модели.
+                """
+                mask_fn = (lambda chunk: well_log.codes_mask(chunk[lith_name], data[lith_name])) if use_lith else None
+
+                def compute():
+                    bar = st.progress(0.0, text='Прогноз по хранилищу ГИС на диске')
+                    result = gis_store.map_chunks(store, predict_chunk, mask_fn, 
+                                                  progress=lambda step, total: bar.progress(
+                                                      step / total, text=f'Прогноз по хранилищу ГИС на диске: часть {step}/{total}'))
+                    bar.empty()
+                    return result
+
+                key = ('store', store.path, pred_name, models.model_signature(model), 
+                       source.fingerprint(X_train_combined, y_train))
+                return shared_cache.session_get_or_create(f'store_{pred_name}', key, compute)
+
+            def model_download(pred_name, bundle, X_train_combined, y_train):
+                """
+                Кнопка скачивания обученной модели с предобработкой (serving.ModelBundle)
+                для локального сервиса прогноза serving.py.
+                """
+                key = ('bundle', pred_name, models.model_signature(bundle.model), 
+                       source.fingerprint(X_train_combined, y_train))
+                content = shared_cache.session_get_or_create(f'bundle_{pred_name}', key, 
+                                                             lambda: serving.dump_bundle(bundle))
+                st.download_button(f'Скачать модель {pred_name} для сервиса прогноза', content, 
+                                   f"{model_name}_{pred_name}_use_lith_{use_lith}.joblib", 
+                                   "application/octet-stream", key=f'bundle_{pred_name}')
+
 
 
 
@@ -874,92 +1201,201 @@ def run():
 
             # st.write(st.session_state)
 
-            if st.session_state['predict']:
+            if st.session_state['predict'] and model_mode == "Сравнить все модели":
+                # Все модели с гиперпараметрами по умолчанию обучаются параллельно на одной выборке
+                if what_to_predict not in ['TC_par', 'VHC']:
+                    st.warning('Сравнение моделей доступно для прогноза TC_par и VHC')
+                elif use_gis_store:
+                    st.warning('Сравнение моделей недоступно при хранении данных ГИС на диске.')
+                else:
+                    signature = ('Leaderboard', what_to_predict, 
+                                 source.fingerprint(X_train_combined, y_train_tc_par, ALL_GIS_combined))
+                    result = jobs.run_in_background('Leaderboard', signature, leaderboard.run_leaderboard, 
+                                                    X_train_combined, y_train_tc_par, 
+                                                    X_test_combined, y_test_tc_par, ALL_GIS_combined)
+                    if result is None:
+                        st.stop()
+                    leaderboard_table, leaderboard_predictions = result
+
+                    display_title_metrics(what_to_predict)
+                    st.dataframe(leaderboard_table)
+                    best_model = leaderboard_table.loc[0, 'Модель']
+                    st.info(f"Лучшая модель по RMSE: {best_model}")
+
+                    df_to_csv(pd.DataFrame({depth_name: ALL_GIS[depth_name], 
+                                            f'{what_to_predict}_pred': leaderboard_predictions[best_model]}), 
+                                            filename="".join(best_model.split()) +'_'+what_to_predict+'_'+'use_lith_'+str(use_lith),
+                                            button_text=f'Скачать прогноз {what_to_predict} лучшей модели по всему интервалу',
+                                            add_key='leaderboard')
+
+            elif st.session_state['predict']:
+                model_spec = select_model()
+
+                # Отдельные модели по типам пород: обучающая функция оборачивается (как в fit_predict_multi),
+                # кросс-валидация и интервалы неопределенности оцениваются для общей модели
+                fit_spec = model_spec
+                if use_lith and st.checkbox('Обучить отдельные модели по типам пород', key='lith_models'):
+                    min_samples = st.number_input('Минимальное число образцов типа пород для отдельной модели '
+                                                  '(остальные типы пород прогнозирует общая модель)', 
+                                                  5, 10_000, 30, step=5)
+                    fit_fn, fit_args, fit_kwargs = model_spec
+                    fit_spec = (models.fit_predict_by_lith, (fit_fn, fit_args), 
+                                {**fit_kwargs, 'lith_name': lith_name, 'min_samples': int(min_samples)})
+
+                if ' ' in model_mode: 
+                    model_name = "".join(model_mode.split())
+                else: 
+                    model_name = model_mode
+
+                # Глубины прогноза по всему интервалу (при хранении ГИС на диске - глубины хранилища)
+                pred_depth = ALL_GIS[depth_name]
 
                 if what_to_predict in ['TC_par', 'VHC']:
                     if what_to_predict == 'TC_par':
                         pred_name = 'TC_par'
-                        time_0 = time.time()
-                        y_pred_tc_par, pred_all_tc_par, model_tc_par = predictor(pred_name)
-                        time_1 = time.time() - time_0
-                        st.write(f'Время осуществления прогноза: {time_1:.3} с.')
+                        y_pred_tc_par, pred_all_tc_par, model_tc_par = predictor(pred_name, fit_spec, 
+                                                                                 X_train_combined, y_train_tc_par, 
+                                                                                 X_test_combined, y_test_tc_par, 
+                                                                                 ALL_GIS_combined)
+                        if use_gis_store:
+                            pred_depth, pred_all_tc_par = store_prediction(
+                                pred_name, model_tc_par, X_train_combined, y_train_tc_par, 
+                                lambda chunk: models.predict(model_tc_par, transform(chunk)))
                         
-                        if ' ' in model_mode: 
-                            model_name = "".join(model_mode.split())
-                        else: 
-                            model_name = model_mode
-                        df_to_csv(pd.DataFrame({depth_name: ALL_GIS[depth_name], 
+                        df_to_csv(pd.DataFrame({depth_name: pred_depth, 
                                                 'TC_par_pred': pred_all_tc_par}), 
                                                 filename=model_name +'_'+'TC_par'+'_'+'use_lith_'+str(use_lith),
                                                 button_text='Скачать прогноз TC_par по всему интервалу')
+                        model_download('TC_par', serving.ModelBundle(model_tc_par, transform, ['TC_par_pred'], 
+                                                                     meta={'model': model_mode, 'use_lith': use_lith}), 
+                                       X_train_combined, y_train_tc_par)
+                        cross_validation('TC_par', model_spec, X, y)
+                        uncertainty_bands('TC_par', model_spec, pred_all_tc_par, 
+                                          X_train_combined, y_train_tc_par, 
+                                          X_test_combined, y_test_tc_par, ALL_GIS_combined)
+                        attribution_tracks('TC_par', model_tc_par, X_train_combined, y_train_tc_par, ALL_GIS_combined, transform)
                     elif what_to_predict == 'VHC':
                         pred_name = 'VHC'
-                        time_0 = time.time()
-                        y_pred_vhc, pred_all_vhc, model_vhc = predictor(pred_name)
-                        time_1 = time.time() - time_0
-                        st.write(f'Время осуществления прогноза: {time_1:.3} с.')
-
-                        if ' ' in model_mode: 
-                            model_name = "".join(model_mode.split())
-                        else: 
-                            model_name = model_mode
-                        df_to_csv(pd.DataFrame({depth_name: ALL_GIS[depth_name], 
+                        y_pred_vhc, pred_all_vhc, model_vhc = predictor(pred_name, fit_spec, 
+                                                                        X_train_combined, y_train_tc_par, 
+                                                                        X_test_combined, y_test_tc_par, 
+                                                                        ALL_GIS_combined)
+                        if use_gis_store:
+                            pred_depth, pred_all_vhc = store_prediction(
+                                pred_name, model_vhc, X_train_combined, y_train_tc_par, 
+                                lambda chunk: models.predict(model_vhc, transform(chunk)))
+
+                        df_to_csv(pd.DataFrame({depth_name: pred_depth, 
                                                 'VHC_pred': pred_all_vhc}), 
                                                 filename=model_name +'_'+'VHC'+'_'+'use_lith_'+str(use_lith),
                                                 button_text='Скачать прогноз VHC по всему интервалу')
-                # elif what_to_predict in ['TC_per'] and st.session_state['load_tc_par']:
-                elif what_to_predict in ['TC_per'] and st.session_state['pred_all_tc_par'] is not None:
+                        model_download('VHC', serving.ModelBundle(model_vhc, transform, ['VHC_pred'], 
+                                                                  meta={'model': model_mode, 'use_lith': use_lith}), 
+                                       X_train_combined, y_train_tc_par)
+                        cross_validation('VHC', model_spec, X, y)
+                        uncertainty_bands('VHC', model_spec, pred_all_vhc, 
+                                          X_train_combined, y_train_tc_par, 
+                                          X_test_combined, y_test_tc_par, ALL_GIS_combined)
+                        attribution_tracks('VHC', model_vhc, X_train_combined, y_train_tc_par, ALL_GIS_combined, transform)
+
+                elif what_to_predict == 'TC_par + VHC + K':
+                    # Все величины обучаются за один проход по общей предобработанной выборке
+                    fit_fn, fit_args, fit_kwargs = fit_spec
+                    multi_spec = (models.fit_predict_multi, (fit_fn, fit_args), fit_kwargs)
+                    y_pred_multi, pred_all_multi, model_multi = predictor('Multi', multi_spec, 
+                                                                          X_train_combined, y_train_tc_par, 
+                                                                          X_test_combined, y_test_tc_par, 
+                                                                          ALL_GIS_combined, show_metrics=False)
+                    if use_gis_store:
+                        pred_depth, pred_all_multi = store_prediction(
+                            'Multi', model_multi, X_train_combined, y_train_tc_par, 
+                            lambda chunk: np.asarray(models.predict(model_multi, transform(chunk))).reshape(len(chunk), -1))
+
+                    pred_titles = {tc_par_name: 'TC_par', vhc_name: 'VHC', anisotropy_name: 'Anisotropy'}
+                    export_names = {tc_par_name: 'TC_par_pred', vhc_name: 'VHC_pred', anisotropy_name: 'K_pred'}
+                    predictions = {depth_name: pred_depth}
+                    for i, target in enumerate(target_names):
+                        display_title_metrics(pred_titles[target])
+                        source.get_metrics(y_test_tc_par[target].values, y_pred_multi[:, i])
+                        predictions[export_names[target]] = pred_all_multi[:, i]
+                    if 'TC_par_pred' in predictions and 'K_pred' in predictions:
+                        predictions['TC_per_pred'] = predictions['TC_par_pred'] / predictions['K_pred']
+
+                    df_to_csv(pd.DataFrame(predictions), 
+                              filename=model_name +'_'+'_'.join(export_names[t] for t in target_names)+'_'+'use_lith_'+str(use_lith),
+                              button_text='Скачать прогноз всех величин по всему интервалу',
+                              add_key='multi')
+                    model_download('Multi', serving.ModelBundle(model_multi, transform, 
+                                                                [export_names[t] for t in target_names], 
+                                                                meta={'model': model_mode, 'use_lith': use_lith}), 
+                                   X_train_combined, y_train_tc_par)
+
+                elif what_to_predict in ['TC_per']:
+                    # 1. Прогноз λ∥ по всему интервалу (остается в памяти, без выгрузки и повторной загрузки)
+                    _, _, y_train_tc_par, y_test_tc_par, \
+                        X_train_combined, X_test_combined, ALL_GIS_combined, transform_tc_par = prep_tc_par
+                    y_pred_tc_par, pred_all_tc_par, model_tc_par = predictor('TC_par', fit_spec, 
+                                                                             X_train_combined, y_train_tc_par, 
+                                                                             X_test_combined, y_test_tc_par, 
+                                                                             ALL_GIS_combined)
+
+                    # 2. Прогноз K: прогноз λ∥ подставляется в данные ГИС построчно, порядок строк совпадает
+                    X_train_orig, X_test_orig, y_train_anisotropy, y_test_anisotropy, \
+                        X_train_combined, X_test_combined, ALL_GIS_combined, transform = preprocess_stage(
+                            'preprocess', balance_stage, X_columns, y_columns, mode_pred, 
+                            np.asarray(pred_all_tc_par, dtype=np.float32),
+                            gis_fn=lambda gis, tc_par_pred: gis.assign(**{tc_par_name: tc_par_pred})).value
+
                     pred_name = 'Anisotropy'
-                    time_0 = time.time()
-                    y_pred_anisotropy, pred_all_anisotropy, model_anisotropy = predictor(pred_name)
-                    time_1 = time.time() - time_0
-                    st.write(f'Время осуществления прогноза: {time_1:.3} с.')
-
-                    if ' ' in model_mode: 
-                        model_name = "".join(model_mode.split())
-                    else: 
-                        model_name = model_mode
-                    df_to_csv(pd.DataFrame({depth_name: ALL_GIS[depth_name], 
+                    y_pred_anisotropy, pred_all_anisotropy, model_anisotropy = predictor(pred_name, fit_spec, 
+                                                                                         X_train_combined, y_train_anisotropy, 
+                                                                                         X_test_combined, y_test_anisotropy, 
+                                                                                         ALL_GIS_combined)
+
+                    if use_gis_store:
+                        # Обе модели цепочки применяются к каждой части хранилища
+                        def predict_chain(chunk):
+                            tc_par_chunk = models.predict(model_tc_par, transform_tc_par(chunk))
+                            k_chunk = models.predict(model_anisotropy, 
+                                                     transform(chunk.assign(**{tc_par_name: tc_par_chunk})))
+                            return np.column_stack([tc_par_chunk, k_chunk])
+
+                        pred_depth, pred_all_chain = store_prediction('TC_per', (model_tc_par, model_anisotropy), 
+                                                                      X_train_combined, y_train_anisotropy, predict_chain)
+                        pred_all_tc_par, pred_all_anisotropy = pred_all_chain[:, 0], pred_all_chain[:, 1]
+
+                    df_to_csv(pd.DataFrame({depth_name: pred_depth, 
+                                            'TC_par_pred': pred_all_tc_par}), 
+                                            filename=model_name +'_'+'TC_par'+'_'+'use_lith_'+str(use_lith),
+                                            button_text='Скачать прогноз TC_par по всему интервалу',
+                                            add_key='tc_par')
+
+                    df_to_csv(pd.DataFrame({depth_name: pred_depth, 
                                             'K_pred': pred_all_anisotropy}), 
                                             filename=model_name +'_'+'K'+'_'+'use_lith_'+str(use_lith),
                                             button_text='Скачать прогноз K по всему интервалу')
                 
+                    # 3. λ⊥ = λ∥ / K
                     y_pred_tc_per = X_test_orig[tc_par_name].values / y_pred_anisotropy
                     y_test_tc_per = data_to_pred.loc[X_test_orig.index, tc_per_name].values
+                    pred_all_tc_per = pred_all_tc_par / pred_all_anisotropy
 
-                    if use_lith:
-                        try:
-                            pred_all_tc_per = st.session_state['pred_all_tc_par'] / pred_all_anisotropy
-                        except:
-                            st.info(r"Для получения прогноза $\lambda_{\bot}$ на весь интервал, загрузите полученный ранее прогноз $\lambda_{\parallel}$ по всему интервалу:")
-
-                            st.warning(r'**Важно!** Пожалуйста, убедитесь, что загружаемый прогноз $\lambda_{\parallel}$ получен с тем же выбором использования типов пород, что и прогнозируемая сейчас $\lambda_{\bot}$!')
-                            uploaded_tc_par_pred = st.file_uploader("TC_par_pred", 
-                                                                    type=['csv', 'xlsx'], 
-                                                                    label_visibility='collapsed')
-                            st.session_state['pred_all_tc_par'] = source.load_file_to_st(uploaded_tc_par_pred, 'с полученным ранее прогнозом $\lambda_{\parallel}$')
-                        
+                    df_to_csv(pd.DataFrame({depth_name: pred_depth, 
+                                            'TC_per_pred': pred_all_tc_per}), 
+                                            filename=model_name +'_'+'TC_per'+'_'+'use_lith_'+str(use_lith),
+                                            button_text='Скачать прогноз TC_per по всему интервалу',
+                                            add_key='1')
 
-                    if st.session_state['pred_all_tc_par'] is not None:
-                        a = st.session_state['pred_all_tc_par'].loc[:, st.session_state['pred_all_tc_par'].columns != depth_name].iloc[:, 0].values
-                        b = pred_all_anisotropy
-                        pred_all_tc_per = a / b
+                    st.write(r"Метрики для $\lambda_{\bot}$")
+                    source.get_metrics(y_test_tc_per, y_pred_tc_per)
 
-
-
-
-                        if ' ' in model_mode: 
-                            model_name = "".join(model_mode.split())
-                        else: 
-                            model_name = model_mode
-                        df_to_csv(pd.DataFrame({depth_name: ALL_GIS[depth_name], 
-                                                'TC_per_pred': pred_all_tc_per}), 
-                                                filename=model_name +'_'+'TC_per'+'_'+'use_lith_'+str(use_lith),
-                                                button_text='Скачать прогноз TC_per по всему интервалу',
-                                                add_key='1')
-
-                        st.write(r"Метрики для $\lambda_{\bot}$")
-                        source.get_metrics(y_test_tc_per, y_pred_tc_per)
+                    # Цепочка для сервиса: прогноз λ∥ подставляется в колонку tc_par_name перед прогнозом K
+                    chain = serving.ModelBundle(model_anisotropy, transform, ['K_pred'], 
+                                                previous=serving.ModelBundle(model_tc_par, transform_tc_par, ['TC_par_pred']), 
+                                                feed_column=tc_par_name, 
+                                                meta={'model': model_mode, 'use_lith': use_lith})
+                    model_download('TC_per', chain, X_train_combined, y_train_anisotropy)
+                    attribution_tracks('K', model_anisotropy, X_train_combined, y_train_anisotropy, ALL_GIS_combined, transform)
 
 
 
@@ -976,6 +1412,24 @@ def run():
 
 
 
+    data_layer.show_memory_report({**locals(), 
+                                   'all_gis_input': st.session_state.get('all_gis_input'),
+                                   'data_input': st.session_state.get('data_input')})
+    cache_stats = shared_cache.get_shared_cache().stats()
+    st.sidebar.caption(f"Общий кэш данных и моделей: {cache_stats['entries']} записей, "
+                       f"{cache_stats['MB']:.1f} / {cache_stats['limit_MB']:.0f} МБ, "
+                       f"попаданий: {cache_stats['hits']}, промахов: {cache_stats['misses']}")
+    matrix_stats = dataset_cache.get_dataset_cache().stats()
+    st.sidebar.caption(f"Кэш DMatrix / Pool: {matrix_stats['entries']} записей, "
+                       f"{matrix_stats['MB']:.1f} / {matrix_stats['limit_MB']:.0f} МБ, "
+                       f"попаданий: {matrix_stats['hits']}, промахов: {matrix_stats['misses']}")
+    jobs.show_resource_report()
+    stage_report = graph.report()
+    if len(stage_report):
+        with st.sidebar.expander(f"Этапы обработки: выполнено {int(stage_report['Выполнен'].sum())} "
+                                 f"из {len(stage_report)}, остальные из кэша"):
+            st.write(stage_report)
+
     # st.toast("Warming up...")
     # st.error("Error message")
     # st.warning("Warning message")
@@ -0,0 +1,82 @@
+"""
+Сравнение представлений типов пород: плотное one-hot кодирование
+и категориальная колонка (source.get_preprocessed_data, do_ohe=True/False).
+
+Для синтетической таблицы ГИС с заданным числом типов пород замеряется
+объем матриц признаков (обучающая выборка и весь интервал ГИС) и время
+обучения и прогноза каждой модели. При категориальной колонке CatBoost
+и XGBoost получают коды типов пород напрямую, остальные модели -
+разреженную матрицу (models.for_categorical).
+
+Запуск из корня репозитория:
+    python benchmarks/bench_categorical.py [--train 5000] [--gis 1000000] [--liths 10 50]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import source
+import models
+
+
+FEATURES = ['AK', 'BKS', 'DS_DN', 'GGP', 'GKS', 'NGKS', 'K', 'Th', 'U']
+LITH = 'Код Prime'
+
+
+def synthetic(n_rows: int, n_liths: int, rng) -> tuple:
+    X = pd.DataFrame(rng.normal(size=(n_rows, len(FEATURES))).astype(np.float32), columns=FEATURES)
+    X[LITH] = rng.integers(0, n_liths, size=n_rows)
+    lith_effect = np.linspace(-1, 1, n_liths)
+    y = X['AK'] - 0.5 * X['GKS'] + lith_effect[X[LITH]] + 0.1 * rng.normal(size=n_rows)
+    return X, y.to_numpy()
+
+
+def frame_mb(X) -> float:
+    if isinstance(X, pd.DataFrame):
+        return X.memory_usage(deep=True).sum() / 2**20
+    return X.nbytes / 2**20
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--train', type=int, default=5_000)
+    parser.add_argument('--gis', type=int, default=1_000_000)
+    parser.add_argument('--liths', type=int, nargs='*', default=[10, 50])
+    parser.add_argument('--models', nargs='*', default=list(models.MODEL_BACKENDS))
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'liths':>6}  {'encoding':<12}{'model':<20}{'train MB':>10}{'GIS MB':>10}"
+          f"{'fit, s':>9}{'predict, s':>12}{'RMSE':>9}")
+    for n_liths in args.liths:
+        X, y = synthetic(args.train, n_liths, rng)
+        X_gis, _ = synthetic(args.gis, n_liths, rng)
+        n_test = args.train // 3
+        X_train, X_test, y_train, y_test = X[n_test:], X[:n_test], y[n_test:], y[:n_test]
+        for encoding, do_ohe in (('one-hot', True), ('categorical', False)):
+            X_train_c, X_test_c, X_gis_c, _ = source.get_preprocessed_data(
+                X_train, X_test, X_gis, do_ohe=do_ohe, lith_name=LITH, feature_names=FEATURES)
+            for model_mode in args.models:
+                model = models.build_model(model_mode, models.DEFAULT_PARAMS[model_mode])
+                t0 = time.perf_counter()
+                model = models.for_categorical(model, X_train_c)
+                model.fit(X_train_c, y_train)
+                t_fit = time.perf_counter() - t0
+                t0 = time.perf_counter()
+                model.predict(X_gis_c)
+                t_pred = time.perf_counter() - t0
+                rmse = np.sqrt(np.mean((model.predict(X_test_c) - y_test) ** 2))
+                print(f"{n_liths:>6}  {encoding:<12}{model_mode:<20}{frame_mb(X_train_c):>10.2f}"
+                      f"{frame_mb(X_gis_c):>10.1f}{t_fit:>9.2f}{t_pred:>12.2f}{rmse:>9.3f}")
+
+
+if __name__ == '__main__':
+    main()
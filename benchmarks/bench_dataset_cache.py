@@ -0,0 +1,76 @@
+"""
+Повторное обучение XGBoost и CatBoost с разными гиперпараметрами
+на одних данных: без кэша и с кэшем DMatrix / Pool (dataset_cache.py).
+
+Имитирует перезапуски приложения при движении слайдеров: данные не меняются,
+меняются max_depth / learning_rate. Без кэша каждое обучение заново строит
+гистограммы (QuantileDMatrix) и квантованный Pool.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_dataset_cache.py [--rows 200000] [--runs 5] [--model XGBoost]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import models
+import dataset_cache
+
+
+def synthetic(n_rows: int, rng):
+    X = pd.DataFrame(rng.normal(size=(n_rows, 9)).astype(np.float32))
+    y = X[0] - 0.5 * X[1] + 0.1 * rng.normal(size=n_rows)
+    return X, y.to_numpy()
+
+
+def hyperparams(model_mode: str, run: int) -> dict:
+    params = dict(models.DEFAULT_PARAMS[model_mode])
+    if model_mode == 'XGBoost':
+        params.update(max_depth=4 + run % 4, learning_rate=0.1 + 0.05 * run)
+    else:
+        params.update(depth=4 + run % 4, learning_rate=0.05 + 0.02 * run)
+    return params
+
+
+def run(model_mode: str, X, y, runs: int, cached: bool) -> list:
+    dataset_cache.get_dataset_cache().clear()
+    times = []
+    for i in range(runs):
+        model = models.build_model(model_mode, hyperparams(model_mode, i))
+        t0 = time.perf_counter()
+        if cached:
+            dataset_cache.fit(model, X, y)
+            dataset_cache.predict(model, X)
+        else:
+            model.fit(X, y)
+            model.predict(X)
+        times.append(time.perf_counter() - t0)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=200_000)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--model', choices=['XGBoost', 'CatBoost'], default=None)
+    args = parser.parse_args()
+
+    X, y = synthetic(args.rows, np.random.default_rng(0))
+    print(f"{args.rows} строк, {args.runs} обучений с разными гиперпараметрами (обучение + прогноз)")
+    print(f"{'модель':<12}{'режим':<12}{'первое, с':>11}{'повторные, с':>14}{'всего, с':>10}")
+    for model_mode in [args.model] if args.model else ['XGBoost', 'CatBoost']:
+        for name, cached in (('без кэша', False), ('с кэшем', True)):
+            times = run(model_mode, X, y, args.runs, cached)
+            print(f"{model_mode:<12}{name:<12}{times[0]:>11.2f}{np.mean(times[1:]):>14.2f}{sum(times):>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
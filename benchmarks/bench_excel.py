@@ -0,0 +1,73 @@
+"""
+Замер времени чтения книги Excel с данными по листам (ingest.read_tables).
+
+Создается синтетическая книга .xlsx с заданным числом листов (по одной
+скважине на лист), затем все листы читаются:
+    - последовательно движком pandas по умолчанию (openpyxl), как pd.read_excel в source.load_file;
+    - последовательно движком ingest.EXCEL_ENGINE;
+    - параллельно в пуле процессов (ingest.read_tables).
+
+Запуск из корня репозитория:
+    python benchmarks/bench_excel.py [--sheets 8] [--rows 20000] [--workers 4]
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import ingest
+
+
+def make_workbook(n_sheets: int, n_rows: int, rng) -> bytes:
+    buffer = io.BytesIO()
+    with pd.ExcelWriter(buffer) as writer:
+        for sheet in range(n_sheets):
+            df = pd.DataFrame(rng.normal(size=(n_rows, 9)), columns=['AK', 'BKS', 'DS_DN', 'GGP', 'GKS',
+                                                                     'NGKS', 'K', 'Th', 'U'])
+            df.insert(0, 'DEPT', 1000 + 0.1 * np.arange(n_rows) + 1000 * sheet)
+            df['Код Prime'] = rng.integers(0, 20, size=n_rows)
+            df.to_excel(writer, sheet_name=f'well_{sheet + 1}', index=False)
+    return buffer.getvalue()
+
+
+def timed(fn):
+    t0 = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - t0, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sheets', type=int, default=8)
+    parser.add_argument('--rows', type=int, default=20_000)
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    content = make_workbook(args.sheets, args.rows, np.random.default_rng(0))
+    files = [('wells.xlsx', content)]
+    print(f"Книга: {args.sheets} листов по {args.rows} строк, {len(content) / 2**20:.1f} МБ, "
+          f"движок: {ingest.EXCEL_ENGINE or 'openpyxl'}")
+
+    t_base, df_base = timed(lambda: pd.concat(pd.read_excel(io.BytesIO(content), sheet_name=None).values(),
+                                              ignore_index=True))
+    t_engine, _ = timed(lambda: ingest.read_tables(files, max_workers=1))
+    t_parallel, df = timed(lambda: ingest.read_tables(files, max_workers=args.workers))
+    assert df.shape == df_base.shape
+
+    print(f"{'способ':<40}{'время, с':>10}{'ускорение':>12}")
+    for name, t in (('pd.read_excel (openpyxl), последовательно', t_base),
+                    ('ingest, 1 процесс', t_engine),
+                    ('ingest, пул процессов', t_parallel)):
+        print(f"{name:<40}{t:>10.2f}{t_base / t:>11.1f}x")
+
+
+if __name__ == '__main__':
+    main()
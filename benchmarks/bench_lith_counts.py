@@ -0,0 +1,59 @@
+"""
+Распределение типов пород для панели проверки литологии: прежний способ
+(сортировка таблицы, приведение кодов к строкам, гистограмма matplotlib)
+и подсчет well_log.code_counts.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_lith_counts.py [--rows 2000000] [--codes 40]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import well_log
+
+
+LITH = 'Код Prime'
+
+
+def old_hist(table: pd.DataFrame):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots()
+    ax.hist(table.sort_values(by=LITH)[LITH].astype(int).astype(str), bins=20)
+    plt.close(fig)
+
+
+def timed(fn, *args) -> float:
+    t0 = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=2_000_000)
+    parser.add_argument('--codes', type=int, default=40)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    table = pd.DataFrame(rng.normal(size=(args.rows, 9)).astype(np.float32))
+    table[LITH] = rng.integers(100, 100 + args.codes, size=args.rows).astype(np.float32)
+
+    print(f"{args.rows} строк ГИС, {args.codes} типов пород")
+    print(f"гистограмма matplotlib со строками: {timed(old_hist, table):8.3f} с")
+    print(f"well_log.code_counts:               {timed(well_log.code_counts, table[LITH]):8.3f} с")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+Отдельные модели по типам пород (models.fit_predict_by_lith) в сравнении
+с одной общей моделью: время обучения, RMSE на тестовой выборке и время
+прогноза по всему интервалу ГИС. Для ансамбля также замеряется прогноз
+построчным циклом (первые --loop-rows строк) вместо маршрутизации по группам.
+
+Синтетическая выборка: зависимость целевой величины от признаков различается
+по типам пород, один тип пород редкий (прогнозируется общей моделью).
+
+Запуск из корня репозитория (вне Streamlit, предупреждения ScriptRunContext можно игнорировать):
+    python benchmarks/bench_lith_models.py [--train 20000] [--gis 1000000] [--liths 8] [--threads 4]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import source
+import models
+
+
+FEATURES = ['AK', 'BKS', 'DS_DN', 'GGP', 'GKS', 'NGKS', 'K', 'Th', 'U']
+LITH = 'Код Prime'
+
+
+def synthetic(n_rows: int, n_liths: int, rng) -> tuple:
+    X = pd.DataFrame(rng.normal(size=(n_rows, len(FEATURES))).astype(np.float32), columns=FEATURES)
+    weights = np.r_[np.full(n_liths - 1, 1.0), 0.05]
+    X[LITH] = rng.choice(np.arange(n_liths) * 10, size=n_rows, p=weights / weights.sum())
+    slopes = np.random.default_rng(1).normal(size=(n_liths, 3))
+    lith = X[LITH].to_numpy() // 10
+    y = (slopes[lith, 0] * X['AK'] + slopes[lith, 1] * X['GKS'] + slopes[lith, 2] * X['NGKS'] * X['K']
+         + 0.1 * rng.normal(size=n_rows))
+    return X, y.to_numpy(np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--train', type=int, default=20_000)
+    parser.add_argument('--gis', type=int, default=1_000_000)
+    parser.add_argument('--liths', type=int, default=8)
+    parser.add_argument('--min-samples', type=int, default=200)
+    parser.add_argument('--models', nargs='*', default=['Linear Regression', 'Decision Tree', 'XGBoost'])
+    parser.add_argument('--threads', type=int, default=None)
+    parser.add_argument('--loop-rows', type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    X, y = synthetic(args.train, args.liths, rng)
+    X_gis, _ = synthetic(args.gis, args.liths, rng)
+    n_test = args.train // 3
+    X_train, X_test, X_gis, _ = source.get_preprocessed_data(X[n_test:], X[:n_test], X_gis, lith_name=LITH,
+                                                             feature_names=FEATURES)
+    y_train, y_test = y[n_test:], y[:n_test]
+
+    print(f"{'модель':<20}{'режим':<16}{'обучение, с':>13}{'прогноз ГИС, с':>16}{'RMSE':>9}")
+    for model_mode in args.models:
+        params = models.DEFAULT_PARAMS[model_mode]
+        runs = (('общая', models.fit_predict, (models.build_model(model_mode, params),), {}),
+                ('по типам пород', models.fit_predict_by_lith,
+                 (models.fit_predict, (models.build_model(model_mode, params),)),
+                 {'lith_name': LITH, 'min_samples': args.min_samples}))
+        for name, fit_fn, fit_args, fit_kwargs in runs:
+            t0 = time.perf_counter()
+            y_pred, _, model = fit_fn(*fit_args, X_train, y_train, X_test, X_test[:1], n_threads=args.threads,
+                                      **fit_kwargs)
+            t_fit = time.perf_counter() - t0
+            t0 = time.perf_counter()
+            models.predict(model, X_gis)
+            t_pred = time.perf_counter() - t0
+            rmse = np.sqrt(np.mean((np.asarray(y_pred) - y_test) ** 2))
+            print(f"{model_mode:<20}{name:<16}{t_fit:>13.2f}{t_pred:>16.2f}{rmse:>9.4f}")
+
+        part = X_gis[:args.loop_rows]
+        t0 = time.perf_counter()
+        for i in range(len(part)):
+            models.predict(model, part.iloc[[i]])
+        t_loop = (time.perf_counter() - t0) * len(X_gis) / len(part)
+        print(f"{'':<20}{'построчно':<16}{'':>13}{t_loop:>16.2f}   (оценка по {len(part)} строкам)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""
+Сопоставление нескольких прогнозов по глубине (pages/plotting.align_runs)
+и прореживание кривых для отображения (well_log.minmax_indices)
+в сравнении с построением графика по всем точкам.
+
+Запуск из корня репозитория (вне Streamlit, предупреждения ScriptRunContext можно игнорировать):
+    python benchmarks/bench_plot_align.py [--rows 2000000] [--runs 3] [--max-points 5000]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'pages'))
+
+import well_log
+from plotting import align_runs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=2_000_000)
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--max-points', type=int, default=5000)
+    args = parser.parse_args()
+
+    import plotly.graph_objects as go
+
+    rng = np.random.default_rng(0)
+    logs = {}
+    for i in range(args.runs):
+        depth = np.sort(rng.uniform(1000, 3000, args.rows))
+        table = pd.DataFrame({'DEPT': depth, 'TC_par_pred': rng.normal(2.5, 0.3, args.rows).astype(np.float32)})
+        logs[f'run_{i}.csv'] = well_log.DepthIndexedLog(table, 'DEPT')
+
+    t0 = time.perf_counter()
+    aligned = align_runs(logs, 'TC_par_pred', tolerance=0.01)
+    print(f"{args.runs} прогноза по {args.rows} строк, сопоставление: {time.perf_counter() - t0:.3f} с")
+
+    depth = aligned['Глубина'].to_numpy()
+    for name, max_points in (('все точки', None), (f'прореживание до {args.max_points}', args.max_points)):
+        t0 = time.perf_counter()
+        fig = go.Figure()
+        for run in logs:
+            values = aligned[run].to_numpy()
+            idx = np.arange(len(values)) if max_points is None else well_log.minmax_indices(values, max_points)
+            fig.add_trace(go.Scattergl(x=values[idx], y=depth[idx], mode='lines', name=run))
+        size = len(fig.to_json())
+        print(f"{name:<28}{time.perf_counter() - t0:8.2f} с, {size / 2 ** 20:8.1f} МБ JSON")
+
+
+if __name__ == '__main__':
+    main()
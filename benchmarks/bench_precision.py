@@ -0,0 +1,105 @@
+"""
+Точность признаков float64 и float32 (source.get_preprocessed_data, dtype):
+пиковый объем памяти и время предобработки (обучающая, тестовая выборки и весь
+интервал ГИС), время обучения и прогноза каждой модели и расхождение метрик
+(source.compute_metrics) на тестовой выборке.
+
+При float32 признаки копируются из таблицы один раз и масштабируются на месте;
+при float64 - как до выбора точности, в новых массивах float64. Расхождение
+метрик проверяется с относительным допуском --rtol; при превышении код возврата 1.
+
+Запуск из корня репозитория (вне Streamlit, предупреждения ScriptRunContext можно игнорировать):
+    python benchmarks/bench_precision.py [--train 20000] [--gis 2000000] [--rtol 0.02]
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import source
+import models
+import dataset_cache
+
+
+FEATURES = ['AK', 'BKS', 'DS_DN', 'GGP', 'GKS', 'NGKS', 'K', 'Th', 'U']
+LITH = 'Код Prime'
+
+
+def synthetic(n_rows: int, rng) -> tuple:
+    X = pd.DataFrame(rng.normal(size=(n_rows, len(FEATURES))).astype(np.float32), columns=FEATURES)
+    X[LITH] = rng.integers(0, 10, size=n_rows)
+    y = X['AK'] - 0.5 * X['GKS'] + 0.1 * X[LITH] + 0.1 * rng.normal(size=n_rows)
+    return X, y.astype(np.float32)
+
+
+def preprocess(X_train, X_test, X_gis, dtype):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    result = source.get_preprocessed_data(X_train, X_test, X_gis, lith_name=LITH, feature_names=FEATURES,
+                                          dtype=dtype)
+    elapsed = time.perf_counter() - t0
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak / 2**20
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--train', type=int, default=20_000)
+    parser.add_argument('--gis', type=int, default=2_000_000)
+    parser.add_argument('--models', nargs='*', default=list(models.MODEL_BACKENDS))
+    parser.add_argument('--rtol', type=float, default=0.02)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    X, y = synthetic(args.train, rng)
+    X_gis, _ = synthetic(args.gis, rng)
+    n_test = args.train // 3
+    X_train, X_test, y_train, y_test = X[n_test:], X[:n_test], y[n_test:], y[:n_test]
+
+    # Импорт sklearn и первые вызовы не входят в замер
+    source.get_preprocessed_data(X_train[:100], X_test[:100], X_gis[:100], lith_name=LITH, feature_names=FEATURES)
+
+    prepared = {}
+    print(f"{'точность':<10}{'предобработка, с':>18}{'пик памяти, МБ':>16}{'ГИС, МБ':>10}")
+    for name, dtype in source.FEATURE_DTYPES.items():
+        prepared[name], elapsed, peak = preprocess(X_train, X_test, X_gis, dtype)
+        gis_mb = prepared[name][2].memory_usage(deep=True).sum() / 2**20
+        print(f"{name:<10}{elapsed:>18.2f}{peak:>16.1f}{gis_mb:>10.1f}")
+
+    print(f"\n{'модель':<20}{'точность':<10}{'обучение, с':>13}{'прогноз, с':>12}{'RMSE':>10}{'R^2':>10}")
+    failed = []
+    for model_mode in args.models:
+        metrics = {}
+        for name, (X_train_c, X_test_c, X_gis_c, _) in prepared.items():
+            dataset_cache.get_dataset_cache().clear()
+            model = models.for_categorical(models.build_model(model_mode, models.DEFAULT_PARAMS[model_mode]),
+                                           X_train_c)
+            t0 = time.perf_counter()
+            dataset_cache.fit(model, X_train_c, y_train)
+            t_fit = time.perf_counter() - t0
+            t0 = time.perf_counter()
+            dataset_cache.predict(model, X_gis_c)
+            t_pred = time.perf_counter() - t0
+            metrics[name] = source.compute_metrics(y_test, dataset_cache.predict(model, X_test_c)).iloc[0]
+            print(f"{model_mode:<20}{name:<10}{t_fit:>13.2f}{t_pred:>12.2f}"
+                  f"{metrics[name]['RMSE']:>10.4f}{metrics[name]['R^2']:>10.4f}")
+        if not np.allclose(metrics['float32'][['RMSE', 'MAE']], metrics['float64'][['RMSE', 'MAE']], rtol=args.rtol):
+            failed.append(model_mode)
+
+    if failed:
+        print(f"\nРасхождение метрик больше {args.rtol:.0%}: {', '.join(failed)}")
+        sys.exit(1)
+    print(f"\nМетрики float32 и float64 совпадают с допуском {args.rtol:.0%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""
+Замер времени построения признаков по окну глубин (well_log.rolling_features).
+
+Для синтетической кривой ГИС заданной длины вычисляются все статистики
+ROLLING_STATS и, для сравнения, те же статистики через pandas.rolling.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_rolling.py [--sizes 100000 1000000 5000000] [--windows 5 21 101]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import well_log
+
+
+def best_time(fn, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return min(times)
+
+
+def pandas_rolling(values, window: int):
+    rolling = pd.Series(values).rolling(window, center=True, min_periods=1)
+    return rolling.mean(), rolling.std(ddof=0), rolling.min(), rolling.max()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='*', default=[100_000, 1_000_000, 5_000_000])
+    parser.add_argument('--windows', type=int, nargs='*', default=[5, 21, 101])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'samples':>10}{'window':>8}{'rolling_features, s':>22}{'pandas.rolling, s':>20}")
+    for size in args.sizes:
+        depth = 1000 + 0.1 * np.arange(size)
+        values = np.cumsum(rng.normal(size=size)).astype(np.float32)
+        for window in args.windows:
+            t_ours = best_time(lambda: well_log.rolling_features(values, window, depth=depth), args.repeat)
+            t_pandas = best_time(lambda: pandas_rolling(values, window), args.repeat)
+            print(f"{size:>10}{window:>8}{t_ours:>22.3f}{t_pandas:>20.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+Нагрузочная проверка локального сервиса прогноза (serving.py) без внешних сервисов.
+
+На синтетических данных ГИС обучается модель (по умолчанию XGBoost с типами
+пород), сервис запускается в этом же процессе на свободном порту, и несколько
+клиентов одновременно отправляют запросы по HTTP. Для сравнения выводится
+работа без объединения запросов (max_batch_rows=1 - каждый запрос отдельно).
+
+Запуск из корня репозитория:
+    python benchmarks/bench_serving.py [--clients 16] [--requests 50] [--rows 32] [--format json|arrow]
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import urllib.request
+
+import numpy as np
+import pandas as pd
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import source
+import models
+import serving
+
+
+FEATURES = ['AK', 'BKS', 'DS_DN', 'GGP', 'GKS', 'NGKS', 'K', 'Th', 'U']
+LITH = 'Код Prime'
+
+
+def synthetic(n_rows: int, rng) -> pd.DataFrame:
+    X = pd.DataFrame(rng.normal(size=(n_rows, len(FEATURES))).astype(np.float32), columns=FEATURES)
+    X[LITH] = rng.integers(0, 10, size=n_rows)
+    return X
+
+
+def train_bundle(model_mode: str, rng) -> serving.ModelBundle:
+    X = synthetic(3000, rng)
+    y = X['AK'] - 0.5 * X['GKS'] + 0.1 * X[LITH] + 0.1 * rng.normal(size=len(X))
+    X_train, X_test, _, scaler = source.get_preprocessed_data(X[:2000], X[2000:], X[2000:], lith_name=LITH,
+                                                              feature_names=FEATURES)
+    transform = source.GisTransform(scaler, FEATURES, lith_name=LITH, train_columns=X_train.columns)
+    model = models.build_model(model_mode, models.DEFAULT_PARAMS[model_mode])
+    _, _, model = models.fit_predict(model, X_train, y[:2000], X_test, X_test)
+    return serving.ModelBundle(model, transform, ['TC_par_pred'], meta={'model': model_mode})
+
+
+def post(url: str, table: pd.DataFrame, fmt: str) -> int:
+    if fmt == 'arrow':
+        body, content_type = serving.write_arrow(table), serving.ARROW_STREAM
+    else:
+        body, content_type = json.dumps({'columns': list(table.columns),
+                                         'data': table.values.tolist()}).encode(), 'application/json'
+    request = urllib.request.Request(url, data=body, headers={'Content-Type': content_type})
+    with urllib.request.urlopen(request) as response:
+        response.read()
+        return response.status
+
+
+def run_load(bundle, args, max_batch_rows: int) -> dict:
+    server = serving.make_server(bundle, port=0, max_batch_rows=max_batch_rows, max_wait_ms=args.max_wait_ms)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    rng = np.random.default_rng(1)
+    tables = [synthetic(args.rows, rng) for _ in range(args.clients)]
+
+    def client(table):
+        for _ in range(args.requests):
+            assert post(url + '/predict', table, args.format) == 200
+
+    t0 = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(table,)) for table in tables]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - t0
+
+    with urllib.request.urlopen(url + '/stats') as response:
+        stats = json.loads(response.read())
+    server.shutdown()
+    server.server_close()
+    server.batcher.close()
+    stats['wall_s'] = wall
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', default='XGBoost')
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument('--rows', type=int, default=32)
+    parser.add_argument('--max-wait-ms', type=float, default=5.0)
+    parser.add_argument('--format', choices=['json', 'arrow'], default='json')
+    args = parser.parse_args()
+
+    bundle = train_bundle(args.model, np.random.default_rng(0))
+    print(f"{args.model}: {args.clients} клиентов x {args.requests} запросов x {args.rows} строк, {args.format}")
+    print(f"{'режим':<22}{'запросов/пакет':>16}{'p50, мс':>10}{'p99, мс':>10}{'строк/с':>12}")
+    for name, max_batch_rows in (('без объединения', 1), ('micro-batching', 8192)):
+        stats = run_load(bundle, args, max_batch_rows)
+        print(f"{name:<22}{stats['mean_requests_per_batch']:>16.1f}{stats['latency_p50_ms']:>10.1f}"
+              f"{stats['latency_p99_ms']:>10.1f}{stats['rows'] / stats['wall_s']:>12.0f}")
+
+
+if __name__ == '__main__':
+    main()
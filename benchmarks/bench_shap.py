@@ -0,0 +1,49 @@
+"""
+Время расчета вкладов признаков (explain.feature_attributions) по всему
+интервалу ГИС и по стратифицированной выборке строк.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_shap.py [--rows 200000] [--sample 20000] [--model XGBoost] [--threads 4]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import models
+import explain
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=200_000)
+    parser.add_argument('--sample', type=int, default=20_000)
+    parser.add_argument('--model', choices=['XGBoost', 'CatBoost'], default='XGBoost')
+    parser.add_argument('--threads', type=int, default=None)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    X = pd.DataFrame(rng.normal(size=(args.rows, 9)).astype(np.float32),
+                     columns=['AK', 'BKS', 'DS_DN', 'GGP', 'GKS', 'NGKS', 'K', 'Th', 'U'])
+    y = X['AK'] - 0.5 * X['GKS'] + 0.1 * rng.normal(size=args.rows)
+    model = models.build_model(args.model, models.DEFAULT_PARAMS[args.model])
+    models.fit_predict(model, X[:5000], y[:5000], X[:10], X[:10])
+    strata = explain.depth_strata(np.arange(args.rows, dtype=np.float64))
+
+    print(f"{args.model}: {args.rows} строк ГИС")
+    for name, rows in (('весь интервал', None),
+                       (f'выборка {args.sample} строк', explain.stratified_sample(strata, args.sample))):
+        t0 = time.perf_counter()
+        explain.feature_attributions(model, X, rows=rows, n_threads=args.threads)
+        print(f"{name:<24}{time.perf_counter() - t0:8.2f} с")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+Перезапуск конвейера подготовки данных через граф этапов (stages.py):
+первое выполнение, повторное без изменений и с изменением параметра
+последнего этапа (доля тестовой выборки).
+
+Этапы повторяют приложение: упорядочивание ГИС и керна по глубине,
+привязка ГИС к глубинам керна, отбор строк, разбиение и масштабирование
+(включая данные ГИС по всему интервалу).
+
+Запуск из корня репозитория (вне Streamlit, предупреждения ScriptRunContext можно игнорировать):
+    python benchmarks/bench_stages.py [--gis-rows 2000000] [--core-rows 5000]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import source
+import stages
+import well_log
+
+
+FEATURES = ['AK', 'BKS', 'DS_DN', 'GGP', 'GKS', 'NGKS', 'K', 'Th', 'U']
+
+
+def synthetic(n_gis: int, n_core: int, rng):
+    gis = pd.DataFrame(rng.normal(size=(n_gis, len(FEATURES))).astype(np.float32), columns=FEATURES)
+    gis.insert(0, 'DEPT', np.sort(rng.uniform(1000, 3000, n_gis)))
+    core = pd.DataFrame({'DEPT': rng.uniform(1000, 3000, n_core),
+                         'TC_par_ups': rng.normal(2.5, 0.3, n_core).astype(np.float32)})
+    return gis, core
+
+
+def pipeline(graph, gis, core, test_size):
+    from sklearn.model_selection import train_test_split
+    from sklearn.preprocessing import StandardScaler
+
+    # Как в приложении, ключ исходных таблиц - ключ загруженного файла (без хеширования таблицы)
+    gis_source, core_source = graph.source('all_gis', gis, key='gis.csv'), graph.source('data', core, key='core.csv')
+    gis_log = graph.run('index_gis', lambda gis: well_log.DepthIndexedLog(gis, 'DEPT'), gis_source)
+    core_log = graph.run('index_core', lambda core: well_log.DepthIndexedLog(core, 'DEPT', duplicates='keep'),
+                         core_source)
+    interp = graph.run('interpolate', lambda core_log, gis_log: pd.concat(
+        [core_log.frame.reset_index(drop=True), gis_log.interp(core_log.frame['DEPT'], FEATURES)], axis=1),
+        core_log, gis_log)
+    rows = graph.run('balance', lambda table: source.training_rows(table, ['DEPT'] + FEATURES + ['TC_par_ups']),
+                     interp)
+
+    def preprocess(table, gis_log):
+        X_train, X_test, y_train, y_test = train_test_split(table[FEATURES], table['TC_par_ups'],
+                                                            test_size=test_size, random_state=322)
+        scaler = StandardScaler().fit(X_train)
+        return scaler.transform(X_train), scaler.transform(X_test), scaler.transform(gis_log.frame[FEATURES])
+
+    return graph.run('preprocess', preprocess, rows, gis_log, depends=(test_size,)).value
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--gis-rows', type=int, default=2_000_000)
+    parser.add_argument('--core-rows', type=int, default=5000)
+    args = parser.parse_args()
+
+    gis, core = synthetic(args.gis_rows, args.core_rows, np.random.default_rng(0))
+    print(f"ГИС: {args.gis_rows} строк, керн: {args.core_rows} образцов")
+    print(f"{'выполнение':<34}{'время, с':>10}{'выполнено этапов':>18}")
+    for name, test_size in (('первое', 0.3), ('повторное без изменений', 0.3), ('изменена доля тестовой выборки', 0.25)):
+        graph = stages.StageGraph()
+        t0 = time.perf_counter()
+        pipeline(graph, gis, core, test_size)
+        report = graph.report()
+        print(f"{name:<34}{time.perf_counter() - t0:>10.3f}{int(report['Выполнен'].sum()):>12} из {len(report)}")
+
+
+if __name__ == '__main__':
+    main()
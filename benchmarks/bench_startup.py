@@ -0,0 +1,64 @@
+"""
+Замер времени холодного импорта модулей приложения.
+
+Каждый модуль импортируется в отдельном процессе интерпретатора, чтобы
+не учитывать кэш уже загруженных библиотек. Дополнительно проверяется,
+какие тяжелые ML-библиотеки оказались загружены при старте.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_startup.py [--repeat 5]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import statistics
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ['sklearn', 'xgboost', 'catboost', 'matplotlib', 'IPython', 'tqdm']
+
+PROBE = """
+import json, sys, time
+t0 = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - t0
+heavy = [m for m in {heavy!r} if m in sys.modules]
+print(json.dumps({{'elapsed': elapsed, 'heavy': heavy}}))
+"""
+
+
+def measure(module: str, repeat: int) -> dict:
+    """
+    Импортирует модуль `repeat` раз в чистых процессах и возвращает статистику.
+    """
+    times = []
+    heavy = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, '-c', PROBE.format(module=module, heavy=HEAVY_MODULES)],
+                             cwd=ROOT, capture_output=True, text=True, check=True)
+        result = json.loads(out.stdout.strip().splitlines()[-1])
+        times.append(result['elapsed'])
+        heavy = result['heavy']
+    return {'module': module,
+            'median_s': statistics.median(times),
+            'min_s': min(times),
+            'heavy_loaded': heavy}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('modules', nargs='*', default=['source', 'models', 'App'])
+    args = parser.parse_args()
+
+    print(f"{'module':<12}{'median, s':>12}{'min, s':>12}  heavy libraries loaded")
+    for module in args.modules:
+        res = measure(module, args.repeat)
+        print(f"{res['module']:<12}{res['median_s']:>12.3f}{res['min_s']:>12.3f}  {', '.join(res['heavy_loaded']) or '-'}")
+
+
+if __name__ == '__main__':
+    main()
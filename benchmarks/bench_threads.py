@@ -0,0 +1,104 @@
+"""
+Одновременное обучение несколькими «сессиями»: потоки без согласования
+и с бюджетами планировщика resources.ResourceScheduler.
+
+Без согласования каждая задача обучает модель с потоками по умолчанию
+(XGBoost и CatBoost используют все ядра, стекинг - cross_val_predict(n_jobs=-1)).
+С планировщиком задачи получают долю ядер через jobs.JobQueue, как в приложении.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_threads.py [--sessions 4] [--rows 20000] [--model XGBoost] [--max-jobs 2]
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import models
+import resources
+
+
+def synthetic(n_rows: int, rng):
+    X = pd.DataFrame(rng.normal(size=(n_rows, 9)).astype(np.float32))
+    y = X[0] - 0.5 * X[1] + 0.1 * rng.normal(size=n_rows)
+    return X, y.to_numpy()
+
+
+def train(model_mode, X, y, job=None):
+    if model_mode == 'Stacking':
+        base_models = [models.build_model(name, models.DEFAULT_PARAMS[name])
+                       for name in ("Gradient Boosting", "XGBoost", "CatBoost")]
+        return models.fit_predict_stacking(base_models, models.build_model("Linear Regression"), X, y, X, X,
+                                           job=job)
+    return models.fit_predict(models.build_model(model_mode, models.DEFAULT_PARAMS[model_mode]), X, y, X, X, job=job)
+
+
+class BenchJob:
+    """
+    Минимальная задача с бюджетом потоков (как jobs.Job, без Streamlit).
+    """
+    def __init__(self, threads):
+        self.threads = threads
+        self.cancel_requested = False
+        self.progress, self.message = 0.0, ''
+
+    def report(self, step, total, message=''):
+        pass
+
+    def raise_if_cancelled(self):
+        pass
+
+
+def run(args, scheduled: bool) -> dict:
+    rng = np.random.default_rng(0)
+    data = [synthetic(args.rows, rng) for _ in range(args.sessions)]
+    scheduler = resources.ResourceScheduler(resources.HOST_THREADS)
+    per_job = max(scheduler.total // args.max_jobs, 1)
+    latencies = []
+
+    def session(i):
+        t0 = time.perf_counter()
+        if scheduled:
+            with scheduler.acquire(per_job) as lease:
+                train(args.model, *data[i], job=BenchJob(lease.threads))
+        else:
+            train(args.model, *data[i])
+        latencies.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    # Ожидание свободных ядер входит в время задачи
+    with ThreadPoolExecutor(max_workers=args.sessions) as executor:
+        list(executor.map(session, range(args.sessions)))
+    wall = time.perf_counter() - t0
+    stats = scheduler.stats()
+    return {'wall': wall, 'p50': float(np.median(latencies)), 'max': max(latencies),
+            'utilisation': stats['utilisation'] if scheduled else None}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sessions', type=int, default=4)
+    parser.add_argument('--rows', type=int, default=20_000)
+    parser.add_argument('--model', default='XGBoost')
+    parser.add_argument('--max-jobs', type=int, default=2)
+    args = parser.parse_args()
+
+    print(f"{args.model}: {args.sessions} сессий по {args.rows} строк, ядер: {resources.HOST_THREADS}, "
+          f"одновременных задач: {args.max_jobs}")
+    print(f"{'режим':<22}{'общее время, с':>16}{'p50 задачи, с':>15}{'макс., с':>10}{'загрузка':>10}")
+    for name, scheduled in (('без согласования', False), ('планировщик', True)):
+        result = run(args, scheduled)
+        utilisation = f"{result['utilisation']:.0%}" if result['utilisation'] is not None else '-'
+        print(f"{name:<22}{result['wall']:>16.2f}{result['p50']:>15.2f}{result['max']:>10.2f}{utilisation:>10}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+import os
+
+import streamlit as st
+import numpy as np
+import pandas as pd
+
+
+# Бюджет памяти на одну сессию (МБ), при превышении приложение выводит предупреждение
+SESSION_MEMORY_BUDGET_MB = float(os.environ.get('SESSION_MEMORY_BUDGET_MB', 512))
+
+
+def to_float32(df: pd.DataFrame, keep=()) -> pd.DataFrame:
+    """
+    Приводит вещественные колонки DataFrame к float32 на месте.
+
+    Целочисленные колонки (например, коды типов пород) и колонки `keep` не изменяются:
+    глубина в float32 округляется до 1e-4 м на больших глубинах, что искажает
+    сопоставление глубин керна и ГИС.
+
+    Parameters:
+    df (pd.DataFrame): Исходная таблица.
+    keep: Колонки, остающиеся в float64 (например, глубина).
+
+    Returns:
+    pd.DataFrame: Та же таблица с колонками float32.
+    """
+    if df is None:
+        return None
+    for col in df.columns:
+        if df[col].dtype == np.float64 and col not in keep:
+            df[col] = df[col].to_numpy(dtype=np.float32)
+    return df
+
+
+def frame_nbytes(obj) -> int:
+    """
+    Возвращает объем памяти объекта (DataFrame, Series, ndarray) в байтах.
+
+    Для представлений (views) NumPy-массивов возвращает 0, так как их данные
+    уже учтены в исходном массиве. Для остальных объектов возвращает None.
+    """
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(index=True, deep=True).sum())
+    if isinstance(obj, pd.Series):
+        return int(obj.memory_usage(index=True, deep=True))
+    if isinstance(obj, np.ndarray):
+        return 0 if obj.base is not None else obj.nbytes
+    return None
+
+
+def memory_report(objects: dict) -> pd.DataFrame:
+    """
+    Формирует таблицу с объемом памяти, занимаемой данными сессии.
+
+    Объекты, на которые ссылаются несколько ключей (например, одна и та же
+    таблица в `st.session_state` и в локальной переменной), учитываются один раз.
+
+    Parameters:
+    objects (dict): Название -> объект с данными.
+
+    Returns:
+    pd.DataFrame: Колонки 'Объект', 'dtype', 'МБ'.
+    """
+    seen = set()
+    rows = []
+    for name, obj in objects.items():
+        if obj is None or id(obj) in seen:
+            continue
+        nbytes = frame_nbytes(obj)
+        if nbytes is None:
+            continue
+        seen.add(id(obj))
+        if isinstance(obj, pd.DataFrame):
+            dtypes = ', '.join(sorted({str(t) for t in obj.dtypes}))
+        else:
+            dtypes = str(obj.dtype)
+        rows.append({'Объект': name, 'dtype': dtypes, 'МБ': nbytes / 2**20})
+    return pd.DataFrame(rows, columns=['Объект', 'dtype', 'МБ'])
+
+
+def show_memory_report(objects: dict):
+    """
+    Выводит в боковую панель объем памяти сессии и предупреждение о превышении бюджета.
+    """
+    report = memory_report(objects)
+    total_mb = report['МБ'].sum()
+    with st.sidebar.expander(f"Память сессии: {total_mb:.1f} МБ"):
+        st.write(report)
+    if total_mb > SESSION_MEMORY_BUDGET_MB:
+        st.sidebar.warning(f"Объем данных сессии ({total_mb:.0f} МБ) превышает бюджет "
+                           f"{SESSION_MEMORY_BUDGET_MB:.0f} МБ.")
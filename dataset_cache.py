@@ -0,0 +1,159 @@
+"""
+Кэш внутренних представлений данных XGBoost и CatBoost.
+
+XGBoost (tree_method='hist') при обучении строит QuantileDMatrix - гистограммы
+признаков, CatBoost - квантованный Pool с границами признаков. Эти структуры
+зависят только от данных и параметров квантования (max_bin / border_count),
+поэтому строятся один раз для каждого набора данных (по хешу содержимого,
+source.fingerprint) и используются повторно при изменении гиперпараметров.
+Для прогноза CatBoost кэшируется Pool тестовой выборки и интервала ГИС;
+XGBoost прогнозирует без DMatrix (inplace_predict).
+"""
+import os
+import threading
+from collections import OrderedDict
+
+import source
+
+
+# Лимит памяти кэша (МБ); при превышении удаляются давно не использованные структуры
+DATASET_CACHE_MAX_MB = float(os.environ.get('DATASET_CACHE_MAX_MB', 512))
+
+
+class DatasetCache:
+    """
+    LRU-кэш структур данных библиотек бустинга с ограничением объема памяти.
+
+    Объем структуры оценивается как 4 байта на значение исходной таблицы.
+    """
+    def __init__(self, max_bytes: int = int(DATASET_CACHE_MAX_MB * 2**20)):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_create(self, key, nbytes: int, factory):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            self.misses += 1
+        value = factory()
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = (value, nbytes)
+                self.nbytes += nbytes
+            while self.nbytes > self.max_bytes and len(self._entries) > 1:
+                _, (_, old_nbytes) = self._entries.popitem(last=False)
+                self.nbytes -= old_nbytes
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'entries': len(self._entries), 'MB': self.nbytes / 2**20,
+                    'limit_MB': self.max_bytes / 2**20, 'hits': self.hits, 'misses': self.misses}
+
+
+_cache = DatasetCache()
+
+
+def get_dataset_cache() -> DatasetCache:
+    return _cache
+
+
+def _nbytes(X) -> int:
+    return int(X.shape[0]) * (int(X.shape[1]) if len(X.shape) > 1 else 1) * 4
+
+
+def xgboost_train_matrix(model, X, y):
+    """
+    QuantileDMatrix обучающей выборки для модели XGBoost (из кэша).
+    """
+    import xgboost as xgb
+
+    params = model.get_params()
+    max_bin = params.get('max_bin') or 256
+    enable_categorical = bool(params.get('enable_categorical'))
+    key = ('xgb', source.fingerprint(X, y), max_bin, enable_categorical, repr(params.get('missing')))
+    return _cache.get_or_create(key, _nbytes(X), lambda: xgb.QuantileDMatrix(
+        X, y, max_bin=max_bin, enable_categorical=enable_categorical, missing=params.get('missing'),
+        nthread=params.get('n_jobs')))
+
+
+def catboost_pool(model, X, y=None):
+    """
+    Pool для модели CatBoost (из кэша): квантованный для обучения (y задан) или исходный для прогноза.
+    """
+    from catboost import Pool
+
+    params = model.get_params()
+    cat_features = list(params.get('cat_features') or ()) or None
+    if y is None:
+        key = ('catboost', source.fingerprint(X), repr(cat_features))
+        return _cache.get_or_create(key, _nbytes(X), lambda: Pool(X, cat_features=cat_features))
+
+    quantize_params = {name: params[name] for name in ('border_count', 'feature_border_type')
+                       if params.get(name) is not None}
+    key = ('catboost', source.fingerprint(X, y), repr(cat_features), repr(sorted(quantize_params.items())))
+
+    def build():
+        pool = Pool(X, y, cat_features=cat_features)
+        pool.quantize(**quantize_params)
+        return pool
+
+    return _cache.get_or_create(key, _nbytes(X), build)
+
+
+def is_cached_model(model) -> bool:
+    """
+    Поддерживает ли модель обучение на кэшированных структурах (XGBoost с hist/approx, CatBoost).
+    """
+    name = type(model).__name__
+    if name == 'XGBRegressor':
+        params = model.get_params()
+        return params.get('tree_method') in (None, 'hist', 'approx') \
+            and params.get('booster') in (None, 'gbtree', 'dart')
+    return name == 'CatBoostRegressor'
+
+
+def fit(model, X, y, **fit_params):
+    """
+    Обучение модели на кэшированных структурах данных (для остальных моделей - обычный fit).
+
+    XGBoost обучается функцией xgb.train на кэшированной QuantileDMatrix с параметрами
+    и обратными вызовами модели, после чего бустер загружается в XGBRegressor (load_model),
+    поэтому прогноз, интерпретация и сохранение модели не меняются. Обучение с
+    дополнительными аргументами fit (веса, выборки для валидации) выполняется штатным fit.
+    """
+    name = type(model).__name__
+    if not is_cached_model(model):
+        return model.fit(X, y, **fit_params)
+    if name == 'CatBoostRegressor':
+        return model.fit(catboost_pool(model, X, y), **fit_params)
+    if fit_params:
+        return model.fit(X, y, **fit_params)
+
+    import xgboost as xgb
+
+    booster = xgb.train(model.get_xgb_params(), xgboost_train_matrix(model, X, y),
+                        num_boost_round=model.get_num_boosting_rounds(),
+                        callbacks=model.get_params().get('callbacks'))
+    model.load_model(booster.save_raw())
+    return model
+
+
+def predict(model, X):
+    """
+    Прогноз модели; для CatBoost по кэшированному Pool.
+    """
+    if type(model).__name__ == 'CatBoostRegressor':
+        return model.predict(catboost_pool(model, X))
+    return model.predict(X)
@@ -0,0 +1,139 @@
+"""
+Вклады признаков (кривых ГИС) в прогноз по глубине: TreeSHAP моделей XGBoost и CatBoost.
+
+Вклады вычисляются встроенными реализациями TreeSHAP библиотек
+(XGBoost: Booster.predict(pred_contribs=True), CatBoost: ShapValues)
+частями интервала ГИС в пуле потоков. Сумма вкладов строки и базового
+значения равна прогнозу модели.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import models
+import resources
+
+
+# Название колонки с базовым значением (средним прогнозом модели)
+BASE_VALUE = 'Базовое значение'
+
+
+def supports_attributions(model) -> bool:
+    """
+    Есть ли для обученной модели быстрый TreeSHAP (одна модель XGBoost или CatBoost с одной целевой величиной).
+    """
+    name = type(model).__name__
+    if name == 'CatBoostRegressor':
+        return model.get_params().get('loss_function') in (None, 'RMSE')
+    return name == 'XGBRegressor'
+
+
+def _xgboost_contributions(booster, model, X):
+    import xgboost as xgb
+
+    dmatrix = xgb.DMatrix(X, enable_categorical=bool(model.get_params().get('enable_categorical')), nthread=1)
+    return booster.predict(dmatrix, pred_contribs=True)
+
+
+def _catboost_contributions(model, X, n_threads):
+    from catboost import Pool
+
+    pool = Pool(X, cat_features=list(model.get_params().get('cat_features') or ()) or None)
+    return model.get_feature_importance(pool, type='ShapValues', thread_count=n_threads)
+
+
+def stratified_sample(strata, size: int, random_state: int = 42) -> np.ndarray:
+    """
+    Стратифицированная выборка строк: из каждой страты (например, типа пород или
+    интервала глубин) берется доля строк, пропорциональная ее размеру, но не меньше одной строки.
+
+    Returns:
+    np.ndarray: Номера выбранных строк по возрастанию.
+    """
+    strata = np.asarray(strata)
+    if size >= len(strata):
+        return np.arange(len(strata))
+    rng = np.random.default_rng(random_state)
+    codes, inverse, counts = np.unique(strata, return_inverse=True, return_counts=True)
+    quota = np.maximum(np.round(counts * size / len(strata)).astype(np.int64), 1)
+    order = np.argsort(inverse, kind='stable')
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    selected = [rng.choice(order[start:start + count], size=min(q, count), replace=False)
+                for start, count, q in zip(starts, counts, quota)]
+    return np.sort(np.concatenate(selected))
+
+
+def depth_strata(depth, n_bins: int = 20) -> np.ndarray:
+    """
+    Номера интервалов глубин с равным числом строк (страты для stratified_sample).
+    """
+    depth = np.asarray(depth, dtype=np.float64)
+    edges = np.unique(np.nanquantile(depth, np.linspace(0, 1, n_bins + 1)[1:-1]))
+    return np.searchsorted(edges, depth, side='right')
+
+
+def feature_attributions(model, X, rows=None, groups=None, feature_names=None, chunk_rows: int = 20_000,
+                         n_threads: int = None, job=None) -> pd.DataFrame:
+    """
+    Вклады признаков в прогноз модели для строк `X`.
+
+    Parameters:
+    model: Обученная модель XGBoost или CatBoost (см. supports_attributions).
+    X (pd.DataFrame | np.ndarray): Предобработанные данные ГИС (как при прогнозе).
+    rows (np.ndarray): Номера строк для расчета (например, stratified_sample); по умолчанию все строки.
+    groups (dict): Объединение колонок в один признак {колонка: признак},
+        например one-hot колонки типов пород; вклады колонок группы суммируются.
+    feature_names (list): Названия колонок массива `X` (для DataFrame берутся его колонки).
+    chunk_rows (int): Число строк в части интервала.
+    n_threads (int): Общее число потоков (по умолчанию бюджет задачи `job`, см. resources.job_threads).
+    job (jobs.Job): Фоновая задача для отображения прогресса и отмены.
+
+    Returns:
+    pd.DataFrame: Вклады признаков и колонка BASE_VALUE; индекс - номера строк `X`.
+
+    Raises:
+    ValueError: Если для модели нет TreeSHAP.
+    """
+    if not supports_attributions(model):
+        raise ValueError(f'Вклады признаков доступны только для XGBoost и CatBoost, модель: {type(model).__name__}')
+    if isinstance(X, pd.DataFrame):
+        feature_names, take = list(X.columns), lambda chunk: X.iloc[chunk]
+    else:
+        feature_names = list(feature_names) if feature_names is not None else list(range(X.shape[1]))
+        take = lambda chunk: X[chunk]
+    rows = np.arange(X.shape[0]) if rows is None else np.asarray(rows)
+    chunks = [rows[start:start + chunk_rows] for start in range(0, len(rows), chunk_rows)] or [rows]
+    n_workers, per_chunk = resources.split_threads(resources.job_threads(job, n_threads), len(chunks))
+
+    if type(model).__name__ == 'XGBRegressor':
+        # Копия бустера с бюджетом потоков части интервала (модель не меняется)
+        booster = model.get_booster().copy()
+        booster.set_param({'nthread': per_chunk})
+        contributions = lambda part: _xgboost_contributions(booster, model, part)
+    else:
+        contributions = lambda part: _catboost_contributions(model, part, per_chunk)
+
+    results = []
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        futures = [executor.submit(contributions, take(chunk)) for chunk in chunks]
+        for done, future in enumerate(futures, start=1):
+            if job is not None:
+                job.raise_if_cancelled()
+            results.append(future.result())
+            if job is not None:
+                job.report(done, len(chunks), 'Вклады признаков: обработано частей интервала')
+
+    values = np.concatenate(results, axis=0).astype(np.float32)
+    columns = {}
+    for i, col in enumerate(feature_names + [BASE_VALUE]):
+        columns.setdefault((groups or {}).get(col, col), []).append(i)
+    return pd.DataFrame({name: values[:, idx].sum(axis=1) if len(idx) > 1 else values[:, idx[0]]
+                         for name, idx in columns.items()}, index=rows)
+
+
+def mean_abs_attributions(table: pd.DataFrame) -> pd.Series:
+    """
+    Средний модуль вклада признаков по интервалу, по убыванию.
+    """
+    return table.drop(columns=BASE_VALUE).abs().mean().sort_values(ascending=False)
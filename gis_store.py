@@ -0,0 +1,313 @@
+"""
+Хранение данных ГИС на диске в виде отображаемого в память (memmap) массива float32.
+
+Таблица ГИС записывается построчно частями в файл values.f32, рядом сохраняется
+описание колонок manifest.json. Строки упорядочиваются по глубине. Приложение
+загружает в память только интервал, покрытый керном, а прогноз по всему интервалу
+выполняется постранично, поэтому объем таблицы может превышать объем памяти.
+
+Готовое хранилище можно создать на сервере из большого файла:
+    python gis_store.py well_gis.csv --depth DEPT [--name field_gis]
+"""
+import os
+import json
+import shutil
+import tempfile
+import uuid
+
+import numpy as np
+import pandas as pd
+
+import source
+import ingest
+
+
+# Каталог хранилищ ГИС на диске
+GIS_STORE_DIR = os.environ.get('GIS_STORE_DIR', os.path.join(tempfile.gettempdir(), 'gis_store'))
+# Число строк, обрабатываемых за один шаг при записи и прогнозе
+CHUNK_ROWS = int(os.environ.get('GIS_CHUNK_ROWS', 200_000))
+
+MANIFEST = 'manifest.json'
+VALUES = 'values.f32'
+
+
+def read_manifest(path: str) -> dict:
+    """
+    Описание хранилища (manifest.json) без открытия файла значений.
+    """
+    with open(os.path.join(path, MANIFEST), encoding='utf-8') as f:
+        return json.load(f)
+
+
+class GisStore:
+    """
+    Хранилище таблицы ГИС на диске.
+
+    Parameters:
+    path (str): Каталог хранилища с файлами manifest.json и values.f32.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.manifest = read_manifest(path)
+        self.name = self.manifest['name']
+        self.columns = self.manifest['columns']
+        self.int_columns = self.manifest['int_columns']
+        self.depth_name = self.manifest['depth_name']
+        self.n_rows = self.manifest['n_rows']
+        if self.n_rows:
+            self.values = np.memmap(os.path.join(path, VALUES), dtype=np.float32, mode='r',
+                                    shape=(self.n_rows, len(self.columns)))
+        else:
+            self.values = np.zeros((0, len(self.columns)), dtype=np.float32)
+
+    @property
+    def shape(self) -> tuple:
+        return self.n_rows, len(self.columns)
+
+    @property
+    def nbytes(self) -> int:
+        return self.n_rows * len(self.columns) * 4
+
+    def column(self, name: str) -> np.ndarray:
+        """
+        Колонка хранилища (представление memmap, данные читаются с диска по мере обращения).
+        """
+        return self.values[:, self.columns.index(name)]
+
+    @property
+    def depth(self) -> np.ndarray:
+        return self.column(self.depth_name)
+
+    def frame(self, rows: slice = slice(None)) -> pd.DataFrame:
+        """
+        Строки `rows` в виде DataFrame в памяти (целочисленные колонки восстанавливаются).
+        """
+        df = pd.DataFrame(np.array(self.values[rows]), columns=self.columns)
+        for col in self.int_columns:
+            if not df[col].isna().any():
+                df[col] = df[col].astype(np.int64)
+        return df
+
+    def interval(self, top: float, bottom: float, pad: float = 0.0) -> pd.DataFrame:
+        """
+        Строки с глубинами в [top - pad, bottom + pad] в виде DataFrame в памяти.
+        """
+        depth = self.depth
+        start = int(np.searchsorted(depth, top - pad, side='left'))
+        stop = int(np.searchsorted(depth, bottom + pad, side='right'))
+        return self.frame(slice(start, stop))
+
+    def iter_chunks(self, chunk_rows: int = CHUNK_ROWS):
+        """
+        Последовательный обход хранилища частями по `chunk_rows` строк.
+        """
+        for start in range(0, self.n_rows, chunk_rows):
+            yield self.frame(slice(start, min(start + chunk_rows, self.n_rows)))
+
+
+def read_chunks(file, file_type: str, chunk_rows: int = CHUNK_ROWS):
+    """
+    Чтение таблицы частями. Файлы .xlsx не поддерживают чтение частями и читаются целиком.
+    """
+    if file_type == 'csv':
+        yield from pd.read_csv(file, chunksize=chunk_rows)
+    elif file_type == 'xlsx':
+        yield pd.read_excel(file, engine=ingest.EXCEL_ENGINE)
+    else:
+        raise Exception("Неподходящее расширение файла. Пожалуйста, загрузите файл в формате .csv или .xlsx.")
+
+
+def _check_chunk(chunk: pd.DataFrame, columns: list, depth_name: str):
+    """
+    Проверяет часть таблицы перед записью: колонки совпадают с первой частью и все числовые.
+
+    Raises:
+    KeyError: Если в данных нет колонки с глубиной.
+    ValueError: Если колонки части отличаются от первой части или есть нечисловые колонки.
+    """
+    chunk_columns = [str(col) for col in chunk.columns]
+    if depth_name not in chunk_columns:
+        raise KeyError(f"В данных нет колонки с глубиной {depth_name}")
+    if columns is not None and chunk_columns != columns:
+        missing = [col for col in columns if col not in chunk_columns]
+        extra = [col for col in chunk_columns if col not in columns]
+        raise ValueError(f"Колонки части таблицы отличаются от первой части "
+                         f"(нет: {', '.join(missing) or '-'}; лишние: {', '.join(extra) or '-'})")
+    non_numeric = [col for col in chunk.columns if not pd.api.types.is_numeric_dtype(chunk[col])]
+    if non_numeric:
+        raise ValueError(f"Нечисловые колонки не поддерживаются: {', '.join(map(str, non_numeric))}")
+
+
+def _write_store(chunks, tmp_path: str, name: str, depth_name: str):
+    """
+    Записывает значения и описание хранилища в каталог `tmp_path` (см. create_store).
+    """
+    columns, int_columns, n_rows = None, [], 0
+    with open(os.path.join(tmp_path, VALUES), 'wb') as f:
+        for chunk in chunks:
+            _check_chunk(chunk, columns, depth_name)
+            if columns is None:
+                columns = [str(col) for col in chunk.columns]
+                int_columns = [str(col) for col in chunk.columns if pd.api.types.is_integer_dtype(chunk[col])]
+            chunk = chunk[chunk[depth_name].notna()]
+            f.write(np.ascontiguousarray(chunk.to_numpy(dtype=np.float32)).tobytes())
+            n_rows += len(chunk)
+
+    manifest = {'name': name, 'columns': columns or [], 'int_columns': int_columns,
+                'depth_name': depth_name, 'n_rows': n_rows}
+    if n_rows:
+        values = np.memmap(os.path.join(tmp_path, VALUES), dtype=np.float32, mode='r',
+                           shape=(n_rows, len(columns)))
+        depth = values[:, columns.index(depth_name)]
+        if not np.all(depth[1:] >= depth[:-1]):
+            order = np.argsort(depth, kind='stable')
+            sorted_values = np.memmap(os.path.join(tmp_path, VALUES + '.sorted'), dtype=np.float32, mode='w+',
+                                      shape=values.shape)
+            for start in range(0, n_rows, CHUNK_ROWS):
+                sorted_values[start:start + CHUNK_ROWS] = values[order[start:start + CHUNK_ROWS]]
+            sorted_values.flush()
+            del values, depth, sorted_values
+            os.replace(os.path.join(tmp_path, VALUES + '.sorted'), os.path.join(tmp_path, VALUES))
+        else:
+            del values, depth
+
+    # Описание записывается последним: хранилище без manifest.json считается незавершенным
+    with open(os.path.join(tmp_path, MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False)
+
+
+def create_store(chunks, path: str, name: str, depth_name: str = 'DEPT') -> GisStore:
+    """
+    Записывает таблицу, заданную последовательностью частей, в хранилище на диске.
+
+    Все колонки должны быть числовыми. Если строки не упорядочены по глубине,
+    они переупорядочиваются (в памяти хранится только перестановка строк).
+    Строки без глубины удаляются. Запись выполняется во временный каталог,
+    который удаляется при ошибке. Если то же хранилище (каталог именуется по
+    хешу содержимого) одновременно записала другая сессия, используется готовое.
+
+    Parameters:
+    chunks: Последовательность DataFrame с одинаковыми колонками.
+    path (str): Каталог хранилища.
+    name (str): Название хранилища.
+    depth_name (str): Колонка с глубиной.
+
+    Returns:
+    GisStore: Открытое хранилище.
+
+    Raises:
+    KeyError: Если в данных нет колонки с глубиной.
+    ValueError: Если в данных есть нечисловые колонки или колонки частей не совпадают.
+    OSError: Если каталог хранилища не удалось занять.
+    """
+    tmp_path = f"{path}.tmp-{uuid.uuid4().hex[:8]}"
+    os.makedirs(tmp_path)
+    try:
+        _write_store(chunks, tmp_path, name, depth_name)
+    except BaseException:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+    manifest_path = os.path.join(path, MANIFEST)
+    try:
+        for _ in range(3):
+            if os.path.isfile(manifest_path):
+                break
+            try:
+                os.replace(tmp_path, path)
+                break
+            except OSError:
+                # Каталог занят готовым хранилищем другой сессии или остатком прерванной записи (без manifest.json)
+                if not os.path.isfile(manifest_path):
+                    shutil.rmtree(path, ignore_errors=True)
+        else:
+            raise OSError(f"Не удалось записать хранилище ГИС в {path}")
+    finally:
+        # Временный каталог остается, если хранилище уже записано другой сессией или перенос не удался
+        shutil.rmtree(tmp_path, ignore_errors=True)
+    return GisStore(path)
+
+
+def list_stores() -> list:
+    """
+    Описания (manifest.json) готовых хранилищ в каталоге GIS_STORE_DIR с путем хранилища в ключе 'path'.
+
+    Файлы значений не открываются; хранилище открывается через GisStore(manifest['path']).
+    """
+    if not os.path.isdir(GIS_STORE_DIR):
+        return []
+    manifests = []
+    for name in sorted(os.listdir(GIS_STORE_DIR)):
+        path = os.path.join(GIS_STORE_DIR, name)
+        if os.path.isfile(os.path.join(path, MANIFEST)):
+            manifests.append({**read_manifest(path), 'path': path})
+    return manifests
+
+
+def store_uploaded_file(uploaded_file, depth_name: str = 'DEPT') -> GisStore:
+    """
+    Записывает загруженный через streamlit.file_uploader файл в хранилище на диске.
+
+    Хранилище именуется по хешу содержимого файла, поэтому повторная загрузка
+    того же файла (в том числе из другой сессии) использует готовое хранилище.
+    Список файлов (и все листы книг Excel) объединяется в одно хранилище через ingest.read_uploaded.
+    """
+    if isinstance(uploaded_file, list):
+        key = source.fingerprint(*[file.getvalue() for file in uploaded_file],
+                                 [file.name for file in uploaded_file], depth_name)
+        path = os.path.join(GIS_STORE_DIR, key)
+        if os.path.isfile(os.path.join(path, MANIFEST)):
+            return GisStore(path)
+        name = ', '.join(file.name for file in uploaded_file)
+        return create_store([ingest.read_uploaded(uploaded_file)], path, name, depth_name)
+
+    file_type = uploaded_file.name.split('.')[-1]
+    key = source.fingerprint(uploaded_file.getvalue(), file_type, depth_name)
+    path = os.path.join(GIS_STORE_DIR, key)
+    if os.path.isfile(os.path.join(path, MANIFEST)):
+        return GisStore(path)
+    uploaded_file.seek(0)
+    return create_store(read_chunks(uploaded_file, file_type), path, uploaded_file.name, depth_name)
+
+
+def map_chunks(store: GisStore, fn, mask_fn=None, chunk_rows: int = CHUNK_ROWS, progress=None):
+    """
+    Постраничное применение `fn` ко всему хранилищу.
+
+    Parameters:
+    store (GisStore): Хранилище ГИС.
+    fn: Функция от части таблицы (DataFrame), возвращающая массив с строкой на каждую строку части.
+    mask_fn: Функция от части таблицы, возвращающая маску используемых строк (или None).
+    chunk_rows (int): Число строк в части.
+    progress: callable(step, total), вызывается после каждой части.
+
+    Returns:
+    tuple: (глубины использованных строк, результаты `fn`).
+    """
+    depths, results = [], []
+    total = -(-store.n_rows // chunk_rows)
+    for step, chunk in enumerate(store.iter_chunks(chunk_rows), start=1):
+        if mask_fn is not None:
+            chunk = chunk[mask_fn(chunk)]
+        if len(chunk):
+            depths.append(chunk[store.depth_name].to_numpy())
+            results.append(np.asarray(fn(chunk), dtype=np.float32))
+        if progress is not None:
+            progress(step, total)
+    if not results:
+        return np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.float32)
+    return np.concatenate(depths), np.concatenate(results)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('file')
+    parser.add_argument('--depth', default='DEPT')
+    parser.add_argument('--name', default=None)
+    args = parser.parse_args()
+
+    name = args.name or os.path.splitext(os.path.basename(args.file))[0]
+    store = create_store(read_chunks(args.file, args.file.split('.')[-1]),
+                         os.path.join(GIS_STORE_DIR, name), name, args.depth)
+    print(f"{store.path}: {store.n_rows} строк, {len(store.columns)} колонок, {store.nbytes / 2**20:.1f} МБ")
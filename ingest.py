@@ -0,0 +1,117 @@
+"""
+Чтение нескольких таблиц (файлов и листов книг Excel) в одну таблицу.
+
+Листы разбираются параллельно в пуле процессов. Для .xlsx используется
+движок calamine (пакет python-calamine), если он установлен, иначе
+движок pandas по умолчанию (openpyxl). Модуль не импортирует streamlit,
+чтобы процессы пула запускались быстро.
+"""
+import io
+import os
+import importlib.util
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+
+# Движок чтения .xlsx: calamine (Rust) в несколько раз быстрее openpyxl
+EXCEL_ENGINE = 'calamine' if importlib.util.find_spec('python_calamine') is not None else None
+
+
+def list_sheets(content: bytes, engine: str = EXCEL_ENGINE) -> list:
+    """
+    Названия листов книги Excel.
+    """
+    with pd.ExcelFile(io.BytesIO(content), engine=engine) as book:
+        return list(book.sheet_names)
+
+
+def read_table(content: bytes, file_type: str, sheet_name=0, engine: str = EXCEL_ENGINE) -> pd.DataFrame:
+    """
+    Чтение одной таблицы (файл .csv или лист книги .xlsx) из содержимого файла.
+
+    Raises:
+    Exception: Если расширение файла не соответствует допустимым форматам.
+    """
+    if file_type == 'csv':
+        return pd.read_csv(io.BytesIO(content))
+    if file_type == 'xlsx':
+        return pd.read_excel(io.BytesIO(content), sheet_name=sheet_name, engine=engine)
+    raise Exception("Неподходящее расширение файла. Пожалуйста, загрузите файл в формате .csv или .xlsx.")
+
+
+def _to_numeric(values: pd.Series) -> pd.Series:
+    """
+    Текстовая колонка с числами (в том числе с десятичной запятой) в числовом виде.
+
+    Если хотя бы одно непустое значение не является числом, колонка не меняется.
+    """
+    converted = pd.to_numeric(values.astype(str).str.strip().str.replace(',', '.', regex=False)
+                              .where(values.notna()), errors='coerce')
+    return converted if converted.notna().sum() == values.notna().sum() else values
+
+
+def harmonize_dtypes(frames: list) -> list:
+    """
+    Согласование типов одноименных колонок нескольких таблиц перед объединением.
+
+    Текстовые колонки, содержащие только числа (например, '0,52' на части листов),
+    переводятся в числовой вид, если эта колонка числовая хотя бы в одной таблице.
+    Остальные различия типов (int и float) устраняются при объединении pd.concat.
+    """
+    numeric = {col for frame in frames for col in frame.columns
+               if pd.api.types.is_numeric_dtype(frame[col])}
+    result = []
+    for frame in frames:
+        frame = frame.copy(deep=False)
+        for col in frame.columns:
+            if col in numeric and not pd.api.types.is_numeric_dtype(frame[col]):
+                frame[col] = _to_numeric(frame[col])
+        result.append(frame)
+    return result
+
+
+def read_tables(files: list, all_sheets: bool = True, max_workers: int = None,
+                engine: str = EXCEL_ENGINE) -> pd.DataFrame:
+    """
+    Чтение нескольких файлов (и всех листов книг Excel) в одну таблицу.
+
+    Каждый лист разбирается в отдельном процессе пула, таблицы объединяются
+    в порядке файлов и листов с согласованием типов колонок (harmonize_dtypes).
+
+    Parameters:
+    files (list): Пары (имя файла, содержимое в байтах).
+    all_sheets (bool): Читать все листы книг .xlsx (иначе только первый).
+    max_workers (int): Число процессов (по умолчанию число ядер).
+    engine (str): Движок чтения .xlsx.
+
+    Returns:
+    pd.DataFrame: Объединенная таблица.
+
+    Raises:
+    Exception: Если расширение файла не соответствует допустимым форматам.
+    """
+    tasks = []
+    for name, content in files:
+        file_type = name.split('.')[-1]
+        sheets = list_sheets(content, engine) if file_type == 'xlsx' and all_sheets else [0]
+        tasks.extend((content, file_type, sheet, engine) for sheet in sheets)
+
+    n_workers = max(min(len(tasks), max_workers or os.cpu_count() or 1), 1)
+    if n_workers == 1:
+        frames = [read_table(*task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            frames = list(executor.map(read_table, *zip(*tasks)))
+
+    frames = [frame for frame in harmonize_dtypes(frames) if len(frame.columns)]
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, axis=0, ignore_index=True)
+
+
+def read_uploaded(uploaded_files: list, all_sheets: bool = True) -> pd.DataFrame:
+    """
+    Чтение загруженных через streamlit.file_uploader файлов в одну таблицу (см. read_tables).
+    """
+    return read_tables([(file.name, file.getvalue()) for file in uploaded_files], all_sheets=all_sheets)
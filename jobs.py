@@ -0,0 +1,269 @@
+import os
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import streamlit as st
+
+import shared_cache
+import resources
+
+
+# Максимальное число одновременно обучаемых моделей на весь процесс (все сессии)
+TRAINING_MAX_JOBS = int(os.environ.get('TRAINING_MAX_JOBS', 2))
+# Время хранения завершенных задач (с), после которого результат удаляется из памяти
+JOB_TTL = 3600
+
+
+class JobCancelled(Exception):
+    """
+    Обучение остановлено пользователем.
+    """
+
+
+class Job:
+    """
+    Задача обучения, выполняемая в фоновом пуле потоков.
+
+    Хранит статус ('queued', 'running', 'done', 'cancelled', 'error'),
+    прогресс в долях единицы, результат или ошибку.
+    """
+    def __init__(self, signature=None):
+        self.id = uuid.uuid4().hex[:8]
+        self.signature = signature
+        self.status = 'queued'
+        self.progress = 0.0
+        self.message = 'В очереди'
+        self.result = None
+        self.error = None
+        # Бюджет потоков, выданный планировщиком resources на время выполнения
+        self.threads = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.future = None
+        self.subscribers = set()
+        self._cancel_event = threading.Event()
+
+    @property
+    def cancel_requested(self) -> bool:
+        return self._cancel_event.is_set()
+
+    @property
+    def elapsed(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ('done', 'cancelled', 'error')
+
+    def detach(self, session_id: str):
+        """
+        Отписывает сессию от задачи. Задача отменяется, если подписчиков не осталось.
+        """
+        self.subscribers.discard(session_id)
+        if not self.subscribers:
+            self.cancel()
+
+    def cancel(self):
+        self._cancel_event.set()
+        if self.future is not None and self.future.cancel():
+            self.status = 'cancelled'
+            self.message = 'Отменено'
+            self.finished_at = time.time()
+
+    def report(self, step: int, total: int, message: str = ''):
+        """
+        Обновляет прогресс задачи. Вызывается из обучающего кода.
+
+        Raises:
+        JobCancelled: Если пользователь запросил отмену.
+        """
+        self.progress = min(max(step / max(total, 1), 0.0), 1.0)
+        self.message = f"{message} {step}/{total}".strip()
+        self.raise_if_cancelled()
+
+    def raise_if_cancelled(self):
+        if self.cancel_requested:
+            raise JobCancelled()
+
+    def _run(self, fn, args, kwargs):
+        self.status = 'running'
+        self.message = 'Обучение'
+        self.started_at = time.time()
+        try:
+            self.raise_if_cancelled()
+            self.result = fn(*args, job=self, **kwargs)
+            self.status = 'done'
+            self.progress = 1.0
+            self.message = 'Готово'
+        except JobCancelled:
+            self.status = 'cancelled'
+            self.message = 'Отменено'
+        except Exception as e:
+            self.status = 'error'
+            self.error = e
+            self.message = str(e)
+        finally:
+            self.finished_at = time.time()
+
+
+class JobQueue:
+    """
+    Общий для всех сессий пул обучения с ограничением числа одновременных задач.
+
+    Каждая задача получает у планировщика resources равную долю ядер хоста
+    (`total // max_workers`, см. ResourceScheduler.share) и передает ее моделям
+    через job.threads; задача, запущенная первой, не занимает ядра следующих.
+    """
+    def __init__(self, max_workers: int = TRAINING_MAX_JOBS, scheduler: resources.ResourceScheduler = None):
+        self.max_workers = max_workers
+        self.scheduler = scheduler or resources.get_scheduler()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='training')
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def _run(self, job: Job, fn, args, kwargs):
+        job.message = 'Ожидание свободных ядер'
+        with self.scheduler.acquire(max_active=self.max_workers) as lease, \
+                resources.limit_blas_threads(lease.threads):
+            job.threads = lease.threads
+            job._run(fn, args, kwargs)
+
+    def submit(self, fn, *args, signature=None, **kwargs) -> Job:
+        """
+        Ставит функцию `fn(*args, job=job, **kwargs)` в очередь и возвращает задачу.
+        """
+        job = Job(signature)
+        with self._lock:
+            now = time.time()
+            for job_id, old_job in list(self._jobs.items()):
+                if old_job.finished and now - old_job.finished_at > JOB_TTL:
+                    del self._jobs[job_id]
+            self._jobs[job.id] = job
+            job.future = self._executor.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def get(self, job_id: str) -> Job:
+        return self._jobs.get(job_id)
+
+    def find(self, signature) -> Job:
+        """
+        Возвращает активную задачу с той же конфигурацией (из любой сессии) или None.
+        """
+        with self._lock:
+            for job in self._jobs.values():
+                if job.signature == signature and job.status in ('queued', 'running', 'done') \
+                        and not job.cancel_requested:
+                    return job
+        return None
+
+    def forget(self, job_id: str):
+        with self._lock:
+            self._jobs.pop(job_id, None)
+
+    def active_count(self) -> int:
+        return sum(job.status in ('queued', 'running') for job in list(self._jobs.values()))
+
+    def stats(self) -> dict:
+        """
+        Загрузка ядер (см. resources.ResourceScheduler.stats) и время ожидания задач в очереди.
+        """
+        jobs = list(self._jobs.values())
+        waits = [job.started_at - job.submitted_at for job in jobs if job.started_at is not None]
+        stats = self.scheduler.stats()
+        stats.update({'queued': sum(job.status == 'queued' for job in jobs),
+                      'running': sum(job.status == 'running' for job in jobs),
+                      'queue_wait_mean_s': sum(waits) / len(waits) if waits else 0.0,
+                      'queue_wait_max_s': max(waits) if waits else 0.0})
+        return stats
+
+
+@st.cache_resource
+def get_job_queue() -> JobQueue:
+    return JobQueue()
+
+
+def run_in_background(key: str, signature, fn, *args, **kwargs):
+    """
+    Запускает обучение в фоне и отображает его прогресс в Streamlit.
+
+    Задача привязывается к сессии по ключу `key`. Если конфигурация
+    (`signature`) изменилась, сессия отписывается от предыдущей задачи и
+    ставит новую. Результаты обучения хранятся в общем кэше (shared_cache),
+    а одинаковые задачи разных сессий выполняются один раз.
+    Пока задача выполняется, страница периодически перезапускается для
+    обновления прогресса.
+
+    Parameters:
+    key (str): Ключ задачи в st.session_state (например, прогнозируемая величина).
+    signature: Хешируемое описание конфигурации обучения.
+    fn: Обучающая функция, принимающая аргумент `job`.
+
+    Returns:
+    Результат `fn` или None, если задача еще не завершена.
+    """
+    queue = get_job_queue()
+    session_id = shared_cache.current_session_id()
+    session_jobs = st.session_state.setdefault('training_jobs', {})
+    job = queue.get(session_jobs.get(key))
+
+    if job is not None and job.signature != signature:
+        job.detach(session_id)
+        job = None
+
+    if job is None:
+        cached = shared_cache.session_get_or_create(f'fit_{key}', ('fit', signature), lambda: None)
+        if cached is not None:
+            st.write('Модель с такой конфигурацией уже обучена на этих данных, результат взят из общего кэша.')
+            return cached
+        job = queue.find(signature) or queue.submit(fn, *args, signature=signature, **kwargs)
+        session_jobs[key] = job.id
+    job.subscribers.add(session_id)
+
+    if job.status == 'done':
+        shared_cache.session_get_or_create(f'fit_{key}', ('fit', signature), lambda: job.result)
+        st.write(f'Время осуществления прогноза: {job.elapsed:.3} с.')
+        return job.result
+
+    if job.status == 'error':
+        st.error(f"Ошибка при обучении модели (задача {job.id}): {job.error}")
+        if st.button('Перезапустить обучение', key=f'restart_{key}'):
+            queue.forget(job.id)
+            session_jobs.pop(key, None)
+            st.rerun()
+        return None
+
+    if job.status == 'cancelled':
+        st.warning(f"Обучение отменено (задача {job.id}).")
+        if st.button('Перезапустить обучение', key=f'restart_{key}'):
+            queue.forget(job.id)
+            session_jobs.pop(key, None)
+            st.rerun()
+        return None
+
+    st.progress(job.progress, text=f"Задача {job.id}: {job.message}")
+    if job.status == 'queued':
+        st.info(f"Задача ожидает свободного обработчика (активных задач: {queue.active_count()}, "
+                f"лимит: {queue.max_workers}).")
+    if len(job.subscribers) > 1:
+        st.info(f"Эту задачу также ожидают другие сессии: {len(job.subscribers) - 1}.")
+    if st.button('Отменить обучение', key=f'cancel_{key}'):
+        job.detach(session_id)
+    time.sleep(0.5)
+    st.rerun()
+
+
+def show_resource_report():
+    """
+    Выводит в боковую панель загрузку ядер и очередь задач обучения (все сессии).
+    """
+    queue = get_job_queue()
+    stats = queue.stats()
+    st.sidebar.caption(f"Ядра: занято {stats['used']} из {stats['threads']} "
+                       f"(задач с бюджетом: {stats['active']}), средняя загрузка {stats['utilisation']:.0%}; "
+                       f"задач выполняется: {stats['running']}, в очереди: {stats['queued']}, "
+                       f"среднее ожидание в очереди: {stats['queue_wait_mean_s']:.1f} с")
@@ -0,0 +1,92 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+import source
+import models
+import resources
+import dataset_cache
+
+
+# Модели, участвующие в сравнении (порядок как в selectbox App.py)
+LEADERBOARD_MODELS = ("Linear Regression", "Decision Tree", "Gradient Boosting", "XGBoost", "CatBoost", "Stacking")
+
+
+def _slice_rows(X, stop):
+    return X.iloc[:stop] if hasattr(X, 'iloc') else X[:stop]
+
+
+def evaluate_model(model_mode, X_train, y_train, X_test, y_test, X_all, n_threads=1, params=None):
+    """
+    Обучает одну модель и измеряет качество, время обучения и время прогноза.
+
+    Время прогноза измеряется на всем интервале ГИС `X_all`.
+
+    Returns:
+    tuple: (строка таблицы лидеров (dict), прогноз на всем интервале).
+    """
+    if model_mode == "Stacking":
+        base_models = [models.build_model(name, models.with_thread_budget(name, models.DEFAULT_PARAMS[name], n_threads))
+                       for name in ("Gradient Boosting", "XGBoost", "CatBoost")]
+        meta_model = models.build_model("Linear Regression")
+        time_0 = time.perf_counter()
+        y_pred, _, model = models.fit_predict_stacking(base_models, meta_model, X_train, y_train,
+                                                       X_test, _slice_rows(X_all, 0), n_jobs=1, n_threads=n_threads)
+        fit_time = time.perf_counter() - time_0
+        time_0 = time.perf_counter()
+        pred_all = models.predict(model, X_all)
+        predict_time = time.perf_counter() - time_0
+    else:
+        params = models.with_thread_budget(model_mode, params or models.DEFAULT_PARAMS[model_mode], n_threads)
+        model = models.for_categorical(models.build_model(model_mode, params), X_train)
+        time_0 = time.perf_counter()
+        dataset_cache.fit(model, X_train, y_train)
+        fit_time = time.perf_counter() - time_0
+        y_pred = model.predict(X_test)
+        time_0 = time.perf_counter()
+        pred_all = model.predict(X_all)
+        predict_time = time.perf_counter() - time_0
+
+    row = {'Модель': model_mode}
+    row.update(source.compute_metrics(np.asarray(y_test), y_pred).iloc[0].to_dict())
+    row.update({'Обучение, с': fit_time, 'Прогноз, с': predict_time, 'Потоков': n_threads})
+    return row, pred_all
+
+
+def run_leaderboard(X_train, y_train, X_test, y_test, X_all, model_modes=LEADERBOARD_MODELS,
+                    n_threads=None, job=None):
+    """
+    Параллельное обучение всех моделей и таблица лидеров.
+
+    Модели обучаются в пуле потоков; бюджет потоков делится resources.split_threads:
+    одновременно обучается не больше моделей, чем потоков в бюджете, каждая - с равной
+    долей потоков (параметры n_jobs / thread_count), поэтому бюджет не превышается.
+
+    Parameters:
+    X_train, y_train, X_test, y_test: Обучающая и тестовая выборки.
+    X_all: Данные ГИС по всему интервалу.
+    model_modes (tuple): Названия сравниваемых моделей.
+    n_threads (int): Общее число потоков (по умолчанию бюджет задачи `job`, см. resources.job_threads).
+    job (jobs.Job): Фоновая задача для отображения прогресса.
+
+    Returns:
+    tuple: (таблица лидеров, отсортированная по RMSE; словарь модель -> прогноз на всем интервале).
+    """
+    n_workers, per_model = resources.split_threads(resources.job_threads(job, n_threads), len(model_modes))
+
+    rows = []
+    predictions = {}
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        futures = {executor.submit(evaluate_model, mode, X_train, y_train, X_test, y_test, X_all, per_model): mode
+                   for mode in model_modes}
+        for done, future in enumerate(as_completed(futures), start=1):
+            row, pred_all = future.result()
+            rows.append(row)
+            predictions[row['Модель']] = pred_all
+            if job is not None:
+                job.report(done, len(model_modes), 'Обучено моделей')
+
+    table = pd.DataFrame(rows).sort_values('RMSE').reset_index(drop=True)
+    return table, predictions
@@ -0,0 +1,584 @@
+import importlib
+
+import numpy as np
+import pandas as pd
+
+import source
+import resources
+import dataset_cache
+
+
+# Реестр моделей: название из selectbox `model_mode` -> (модуль, класс).
+# Библиотеки импортируются только при первом обращении к соответствующей модели.
+MODEL_BACKENDS = {
+    "Linear Regression": ("sklearn.linear_model", "LinearRegression"),
+    "Decision Tree": ("sklearn.tree", "DecisionTreeRegressor"),
+    "Gradient Boosting": ("sklearn.ensemble", "GradientBoostingRegressor"),
+    "XGBoost": ("xgboost", "XGBRegressor"),
+    "CatBoost": ("catboost", "CatBoostRegressor"),
+}
+
+_loaded_backends = {}
+
+# Гиперпараметры по умолчанию (совпадают с начальными значениями ползунков в App.py)
+DEFAULT_PARAMS = {
+    "Linear Regression": {},
+    "Decision Tree": {'max_depth': None, 'min_samples_split': 2, 'min_samples_leaf': 1, 'random_state': 42},
+    "Gradient Boosting": {'max_depth': 3, 'learning_rate': 0.01, 'n_estimators': 200, 'random_state': 42},
+    "XGBoost": {'max_depth': 7, 'learning_rate': 0.5, 'n_estimators': 200, 'random_state': 42, 'tree_method': 'hist'},
+    "CatBoost": {'depth': 7, 'learning_rate': 0.5, 'l2_leaf_reg': 5, 'iterations': 700,
+                 'random_state': 42, 'task_type': 'CPU', 'silent': True, 'allow_writing_files': False},
+}
+
+# Параметр, задающий число потоков для каждой библиотеки
+THREAD_PARAMS = {
+    "Linear Regression": 'n_jobs',
+    "XGBoost": 'n_jobs',
+    "CatBoost": 'thread_count',
+}
+
+
+def get_backend(model_mode: str) -> type:
+    """
+    Возвращает класс модели для выбранного `model_mode`, импортируя библиотеку при первом вызове.
+
+    Parameters:
+    model_mode (str): Название модели из MODEL_BACKENDS.
+
+    Returns:
+    type: Класс регрессора.
+
+    Raises:
+    KeyError: Если модель с таким названием не зарегистрирована.
+    """
+    if model_mode not in _loaded_backends:
+        module_name, class_name = MODEL_BACKENDS[model_mode]
+        module = importlib.import_module(module_name)
+        _loaded_backends[model_mode] = getattr(module, class_name)
+    return _loaded_backends[model_mode]
+
+
+def with_thread_budget(model_mode: str, params: dict, n_threads: int) -> dict:
+    """
+    Копия гиперпараметров с явно заданным числом потоков для модели.
+
+    Модели sklearn без параметра n_jobs (Decision Tree, Gradient Boosting)
+    однопоточны, для них параметры не меняются.
+    """
+    params = dict(params or {})
+    if model_mode in THREAD_PARAMS:
+        params[THREAD_PARAMS[model_mode]] = max(int(n_threads), 1)
+    return params
+
+
+def limit_threads(obj, n_threads: int):
+    """
+    Задает число потоков уже созданной модели (или вложенных списков/кортежей моделей).
+    """
+    if isinstance(obj, (list, tuple)):
+        for item in obj:
+            limit_threads(item, n_threads)
+        return obj
+    if isinstance(obj, SparseCategorical):
+        limit_threads(obj.estimator, n_threads)
+        return obj
+    if hasattr(obj, 'get_params'):
+        params = obj.get_params()
+        for name in set(THREAD_PARAMS.values()):
+            if name in params:
+                obj.set_params(**{name: max(int(n_threads), 1)})
+    return obj
+
+
+def categorical_columns(X) -> list:
+    """
+    Категориальные колонки таблицы (пустой список для numpy массивов).
+    """
+    if not isinstance(X, pd.DataFrame):
+        return []
+    return [col for col in X.columns if isinstance(X[col].dtype, pd.CategoricalDtype)]
+
+
+def to_sparse(X):
+    """
+    Разреженная матрица признаков: числовые колонки и one-hot кодирование категориальных колонок.
+
+    One-hot колонки строятся по кодам категорий (набор категорий задан типом колонки),
+    поэтому разные части данных с одинаковыми категориями кодируются одинаково.
+    Отсутствующие значения не кодируются.
+
+    Returns:
+    scipy.sparse.csr_matrix: Матрица float32 (n, число числовых колонок + число категорий).
+    """
+    import scipy.sparse as sp
+
+    cat_columns = categorical_columns(X)
+    if not cat_columns:
+        return sp.csr_matrix(np.asarray(X, dtype=np.float32))
+    blocks = [sp.csr_matrix(X.drop(columns=cat_columns).to_numpy(dtype=np.float32))]
+    n_rows = X.shape[0]
+    for col in cat_columns:
+        codes = X[col].cat.codes.to_numpy()
+        rows = np.flatnonzero(codes >= 0)
+        blocks.append(sp.csr_matrix((np.ones(len(rows), dtype=np.float32), (rows, codes[rows])),
+                                    shape=(n_rows, len(X[col].cat.categories))))
+    return sp.hstack(blocks, format='csr')
+
+
+class SparseCategorical:
+    """
+    Модель sklearn, обучаемая на разреженном one-hot кодировании категориальных колонок (см. to_sparse).
+
+    Поддерживает get_params/set_params, поэтому копируется sklearn.base.clone
+    (в том числе в cross_val_predict при стекинге).
+
+    Parameters:
+    estimator: Регрессор sklearn, принимающий разреженные матрицы.
+    """
+    def __init__(self, estimator):
+        self.estimator = estimator
+
+    def get_params(self, deep=True):
+        params = {'estimator': self.estimator}
+        if deep and hasattr(self.estimator, 'get_params'):
+            params.update({f'estimator__{name}': value for name, value in self.estimator.get_params().items()})
+        return params
+
+    def set_params(self, **params):
+        if 'estimator' in params:
+            self.estimator = params.pop('estimator')
+        self.estimator.set_params(**{name.split('__', 1)[1]: value for name, value in params.items()})
+        return self
+
+    def __sklearn_tags__(self):
+        # Теги (тип модели и т.п.) совпадают с тегами обернутой модели
+        return self.estimator.__sklearn_tags__()
+
+    def fit(self, X, y, **fit_params):
+        self.estimator.fit(to_sparse(X), y, **fit_params)
+        return self
+
+    def predict(self, X):
+        return self.estimator.predict(to_sparse(X))
+
+
+def for_categorical(obj, X):
+    """
+    Настраивает модель (или вложенные списки/кортежи моделей) на категориальные колонки таблицы `X`.
+
+    CatBoost получает категориальные колонки в cat_features, XGBoost - enable_categorical
+    (с tree_method='hist'); остальные модели оборачиваются в SparseCategorical.
+    Если категориальных колонок нет, модель не меняется.
+
+    Returns:
+    Настроенная модель (CatBoost и XGBoost изменяются на месте).
+    """
+    cat_columns = categorical_columns(X)
+    if not cat_columns:
+        return obj
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(for_categorical(item, X) for item in obj)
+    if isinstance(obj, SparseCategorical) or not hasattr(obj, 'get_params'):
+        return obj
+    name = type(obj).__name__
+    if name == 'CatBoostRegressor':
+        # Кортеж, а не список: список параметр CatBoost копирует, и sklearn.base.clone его не принимает
+        return obj.set_params(cat_features=tuple(cat_columns))
+    if name == 'XGBRegressor':
+        return obj.set_params(enable_categorical=True, tree_method='hist')
+    return SparseCategorical(obj)
+
+
+def build_model(model_mode: str, params: dict = None):
+    """
+    Создает модель выбранного типа с заданными гиперпараметрами.
+
+    Parameters:
+    model_mode (str): Название модели из MODEL_BACKENDS.
+    params (dict): Гиперпараметры модели.
+
+    Returns:
+    Необученный регрессор.
+    """
+    return get_backend(model_mode)(**(params or {}))
+
+
+def model_signature(obj) -> str:
+    """
+    Текстовое описание модели (или списка моделей) с гиперпараметрами.
+
+    Используется для сравнения конфигураций обучения между перезапусками страницы.
+    """
+    if isinstance(obj, (list, tuple)):
+        return '[' + ', '.join(model_signature(item) for item in obj) + ']'
+    if not hasattr(obj, 'get_params'):
+        return getattr(obj, '__name__', repr(obj))
+    params = sorted(obj.get_params().items(), key=lambda item: item[0])
+    return f"{type(obj).__name__}({params!r})"
+
+
+def clone_models(obj):
+    """
+    Необученные копии модели (или вложенных списков/кортежей моделей) с теми же гиперпараметрами.
+    """
+    from sklearn.base import clone
+
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(clone_models(item) for item in obj)
+    if not hasattr(obj, 'get_params'):
+        return obj
+    return clone(obj)
+
+
+def _iterations(model) -> int:
+    """
+    Число итераций бустинга для модели (для отображения прогресса).
+    """
+    params = model.get_params()
+    for name in ('iterations', 'n_estimators'):
+        if params.get(name) is not None:
+            return params[name]
+    return 1000 if type(model).__name__ == 'CatBoostRegressor' else 100
+
+
+def _fit_with_progress(model, X_train, y_train, job=None):
+    """
+    Обучает модель, передавая номер итерации бустинга в задачу `job`.
+
+    Остановка обучения по запросу пользователя выполняется штатными
+    механизмами библиотек (callbacks / monitor), после чего выбрасывается JobCancelled.
+    """
+    if isinstance(model, SparseCategorical):
+        _fit_with_progress(model.estimator, to_sparse(X_train), y_train, job)
+        return model
+
+    if job is None:
+        dataset_cache.fit(model, X_train, y_train)
+        return model
+
+    name = type(model).__name__
+    total = _iterations(model)
+
+    def report(step):
+        job.progress = min(step / max(total, 1), 1.0)
+        job.message = f"Итерация бустинга {step}/{total}"
+        return job.cancel_requested
+
+    if name == 'CatBoostRegressor':
+        class CatBoostProgress:
+            def after_iteration(self, info):
+                return not report(info.iteration)
+
+        dataset_cache.fit(model, X_train, y_train, callbacks=[CatBoostProgress()])
+
+    elif name == 'XGBRegressor':
+        import xgboost as xgb
+
+        class XGBoostProgress(xgb.callback.TrainingCallback):
+            def after_iteration(self, booster, epoch, evals_log):
+                return report(epoch + 1)
+
+        model.set_params(callbacks=[XGBoostProgress()])
+        try:
+            dataset_cache.fit(model, X_train, y_train)
+        finally:
+            model.set_params(callbacks=None)
+
+    elif name == 'GradientBoostingRegressor':
+        model.fit(X_train, y_train, monitor=lambda i, estimator, local_vars: report(i + 1))
+
+    else:
+        model.fit(X_train, y_train)
+
+    job.raise_if_cancelled()
+    return model
+
+
+def fit_predict(model, X_train, y_train, X_test, X_all, job=None, n_threads=None):
+    """
+    Обучает модель и возвращает прогноз на тестовой выборке и на всем интервале ГИС.
+
+    Parameters:
+    model: Необученный регрессор.
+    X_train, y_train: Обучающая выборка.
+    X_test: Тестовая выборка.
+    X_all: Данные ГИС по всему интервалу.
+    job (jobs.Job): Фоновая задача для отображения прогресса и отмены.
+    n_threads (int): Число потоков модели (по умолчанию бюджет задачи `job`).
+        Без `job` и `n_threads` число потоков модели не меняется.
+
+    Если в X_train есть категориальные колонки, модель настраивается на них (см. for_categorical).
+
+    Returns:
+    tuple: (прогноз на тесте, прогноз на всем интервале, обученная модель).
+    """
+    model = for_categorical(model, X_train)
+    if job is not None or n_threads is not None:
+        limit_threads(model, resources.job_threads(job, n_threads))
+    _fit_with_progress(model, X_train, y_train, job)
+    return dataset_cache.predict(model, X_test), dataset_cache.predict(model, X_all), model
+
+
+def fit_predict_stacking(base_models, meta_model, X_train, y_train, X_test, X_all, cv=5, n_jobs=-1, job=None,
+                         n_threads=None):
+    """
+    Стекинг: обучает базовые модели и метарегрессор за один проход
+    и возвращает прогноз на тестовой выборке и на всем интервале ГИС.
+
+    Тестовая выборка и весь интервал объединяются, чтобы базовые модели
+    обучались один раз, а не отдельно для каждого набора данных.
+    Обученная модель возвращается как пара (базовые модели, метарегрессор).
+
+    Бюджет потоков (`n_threads`, бюджет задачи `job` или все ядра) делится между
+    параллельными фолдами cross_val_predict (n_jobs=-1 - по фолду на поток)
+    и потоками базовых моделей. С `job` фолды обучаются последовательно.
+    """
+    n_threads = resources.job_threads(job, n_threads)
+    if job is not None:
+        n_jobs, per_model = 1, n_threads
+    else:
+        n_jobs, per_model = resources.split_threads(n_threads, cv if n_jobs in (None, -1) else n_jobs)
+    base_models = limit_threads(for_categorical(list(base_models), X_train), per_model)
+    limit_threads(meta_model, per_model)
+    if isinstance(X_test, pd.DataFrame):
+        X_pred = pd.concat([X_test, X_all], axis=0, ignore_index=True)
+    else:
+        X_pred = np.concatenate([X_test, X_all], axis=0)
+
+    progress = None
+    if job is not None:
+        progress = lambda step, total: job.report(step, total, 'Фолд стекинга')
+
+    y_pred, meta_model = source.metaregressor(base_models, meta_model, X_train, X_pred, y_train, cv,
+                                              progress=progress, n_jobs=n_jobs)
+    n_test = X_test.shape[0]
+    return y_pred[:n_test], y_pred[n_test:], (base_models, meta_model)
+
+
+def predict_stacking(base_models, meta_model, X):
+    """
+    Прогноз стекинга обученными базовыми моделями и метарегрессором.
+    """
+    scores = np.column_stack([model.predict(X) for model in base_models])
+    return meta_model.predict(scores)
+
+
+def predict(model, X):
+    """
+    Прогноз обученной модели, возвращенной fit_predict, fit_predict_stacking или fit_predict_multi.
+
+    Пара (базовые модели, метарегрессор) - стекинг, список - отдельные модели по целевым величинам.
+    """
+    if isinstance(model, list):
+        return np.column_stack([predict(item, X) for item in model])
+    if isinstance(model, tuple):
+        return predict_stacking(*model, X)
+    return model.predict(X)
+
+
+# Модели, обучающиеся сразу на нескольких целевых величинах
+NATIVE_MULTI_OUTPUT = ('LinearRegression', 'DecisionTreeRegressor', 'XGBRegressor', 'CatBoostRegressor')
+
+
+def fit_predict_multi(fit_fn, fit_args, X_train, Y_train, X_test, X_all, job=None, **fit_kwargs):
+    """
+    Совместное обучение на нескольких целевых величинах (колонки Y_train).
+
+    Модели из NATIVE_MULTI_OUTPUT обучаются один раз на всех целевых величинах
+    (для CatBoost используется функция потерь MultiRMSE). Для остальных моделей
+    (Gradient Boosting, стекинг) по каждой целевой величине параллельно обучается
+    своя копия модели.
+
+    Parameters:
+    fit_fn: Обучающая функция (fit_predict или fit_predict_stacking).
+    fit_args (tuple): Модели - аргументы fit_fn.
+    X_train, Y_train: Обучающая выборка, Y_train - DataFrame с целевыми величинами.
+    X_test: Тестовая выборка.
+    X_all: Данные ГИС по всему интервалу.
+    job (jobs.Job): Фоновая задача для отображения прогресса и отмены.
+
+    Returns:
+    tuple: (прогноз на тесте (n_test, k), прогноз на всем интервале (n_all, k), модель или список моделей).
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    targets = list(Y_train.columns)
+    if fit_fn is fit_predict and type(fit_args[0]).__name__ in NATIVE_MULTI_OUTPUT:
+        model = fit_args[0]
+        if type(model).__name__ == 'CatBoostRegressor':
+            model.set_params(loss_function='MultiRMSE')
+        y_pred, pred_all, model = fit_predict(model, X_train, Y_train, X_test, X_all, job=job, **fit_kwargs)
+        return np.asarray(y_pred).reshape(len(y_pred), -1), np.asarray(pred_all).reshape(len(pred_all), -1), model
+
+    # Бюджет потоков делится между параллельно обучаемыми целевыми величинами
+    n_workers, per_target = resources.split_threads(resources.job_threads(job, fit_kwargs.pop('n_threads', None)),
+                                                    len(targets))
+
+    def fit_target(target):
+        if job is not None:
+            job.raise_if_cancelled()
+        return fit_fn(*clone_models(fit_args), X_train, Y_train[target], X_test, X_all,
+                      n_threads=per_target, **fit_kwargs)
+
+    results = []
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        for done, result in enumerate(executor.map(fit_target, targets), start=1):
+            results.append(result)
+            if job is not None:
+                job.report(done, len(targets), 'Обучено целевых величин')
+    y_pred = np.column_stack([result[0] for result in results])
+    pred_all = np.column_stack([result[1] for result in results])
+    return y_pred, pred_all, [result[2] for result in results]
+
+
+class LithEnsemble:
+    """
+    Отдельные модели по типам пород с общей моделью для остальных строк.
+
+    Тип породы строки определяется по признакам: категориальной колонке `lith_name`
+    или one-hot колонкам `{lith_name}_<код>`. Строки типов пород без отдельной модели
+    (редких в обучающей выборке или отсутствующих в ней) прогнозирует общая модель.
+
+    Parameters:
+    lith_name (str): Колонка с типами пород.
+    columns (list): One-hot колонки типов пород (None для категориальной колонки).
+    codes (list): Коды типов пород в порядке групп.
+    group_models (list): Модель каждой группы (None - прогноз общей моделью).
+    fallback: Общая модель, обученная на всей выборке.
+    counts (np.ndarray): Число обучающих образцов каждой группы.
+    """
+    def __init__(self, lith_name, columns, codes, group_models, fallback, counts):
+        self.lith_name = lith_name
+        self.columns = columns
+        self.codes = list(codes)
+        self.group_models = list(group_models)
+        self.fallback = fallback
+        self.counts = np.asarray(counts)
+
+    @staticmethod
+    def lith_groups(X, lith_name: str) -> tuple:
+        """
+        Группы (номера типов пород) строк таблицы признаков.
+
+        Returns:
+        tuple: (номера групп строк (-1 - тип породы не задан или неизвестен), коды типов пород, one-hot колонки или None).
+
+        Raises:
+        ValueError: Если в признаках нет типов пород.
+        """
+        if not isinstance(X, pd.DataFrame):
+            raise ValueError('Для моделей по типам пород признаки должны быть таблицей с колонками типов пород')
+        if lith_name in X.columns and isinstance(X[lith_name].dtype, pd.CategoricalDtype):
+            # Категория source.UNKNOWN_LITH не встречается в обучающей выборке и прогнозируется общей моделью
+            return X[lith_name].cat.codes.to_numpy().astype(np.int64), list(X[lith_name].cat.categories), None
+        columns = [col for col in X.columns if str(col).startswith(f'{lith_name}_')]
+        if not columns:
+            raise ValueError(f'В признаках нет колонок типов пород {lith_name}')
+        block = X[columns].to_numpy()
+        groups = np.where(block.any(axis=1), block.argmax(axis=1), -1)
+        return groups, [str(col)[len(lith_name) + 1:] for col in columns], columns
+
+    def groups(self, X) -> np.ndarray:
+        """
+        Номера групп строк `X` в порядке self.codes (-1 - группы нет в обучающей выборке).
+        """
+        if self.columns is None:
+            groups, categories, _ = self.lith_groups(X, self.lith_name)
+            if categories == self.codes:
+                return groups
+            # Набор категорий отличается от обучающего: сопоставление по кодам
+            lookup = {code: i for i, code in enumerate(self.codes)}
+            mapping = np.array([lookup.get(code, -1) for code in categories] + [-1])
+            return mapping[groups]
+        block = X.reindex(columns=self.columns, fill_value=0).to_numpy()
+        return np.where(block.any(axis=1), block.argmax(axis=1), -1)
+
+    def predict(self, X):
+        """
+        Прогноз с маршрутизацией строк: строки упорядочиваются по группам одной сортировкой,
+        каждая модель получает все строки своей группы одним вызовом.
+        """
+        # Номер модели строки: номер группы с отдельной моделью или -1 (общая модель)
+        has_model = np.array([model is not None for model in self.group_models] + [False])
+        groups = self.groups(X)
+        route = np.where(has_model[groups], groups, -1)
+        if len(route) == 0:
+            return np.asarray(predict(self.fallback, X))
+
+        order = np.argsort(route, kind='stable')
+        parts = []
+        for rows in np.split(order, np.flatnonzero(np.diff(route[order])) + 1):
+            group = route[rows[0]]
+            model = self.fallback if group < 0 else self.group_models[group]
+            parts.append((rows, np.asarray(predict(model, source.take_rows(X, rows)))))
+
+        dtype = np.result_type(*[part.dtype for _, part in parts])
+        result = np.empty((len(route),) + parts[0][1].shape[1:], dtype=dtype)
+        for rows, part in parts:
+            result[rows] = part
+        return result
+
+    def summary(self) -> pd.DataFrame:
+        """
+        Типы пород обучающей выборки, число образцов и модель, прогнозирующая каждый тип пород.
+        """
+        table = pd.DataFrame({'Тип пород': self.codes, 'Образцов': self.counts,
+                              'Модель': ['отдельная' if model is not None else 'общая'
+                                         for model in self.group_models]})
+        return table[table['Образцов'] > 0].reset_index(drop=True)
+
+
+def fit_predict_by_lith(fit_fn, fit_args, X_train, y_train, X_test, X_all, lith_name='Код Prime',
+                        min_samples=30, job=None, n_threads=None, **fit_kwargs):
+    """
+    Отдельные модели по типам пород и общая модель (см. LithEnsemble).
+
+    Для каждого типа пород, представленного не менее чем `min_samples` образцами,
+    обучается своя копия модели на строках этого типа пород; общая модель
+    обучается на всей выборке. Модели обучаются параллельно, бюджет потоков
+    делится между ними. Прогноз строится маршрутизацией строк по группам.
+
+    Parameters:
+    fit_fn: Обучающая функция (fit_predict или fit_predict_stacking).
+    fit_args (tuple): Модели - аргументы fit_fn.
+    X_train, y_train: Обучающая выборка (таблица с типами пород, см. LithEnsemble.lith_groups).
+    X_test: Тестовая выборка.
+    X_all: Данные ГИС по всему интервалу.
+    lith_name (str): Колонка с типами пород.
+    min_samples (int): Минимальное число образцов типа пород для отдельной модели.
+    job (jobs.Job): Фоновая задача для отображения прогресса и отмены.
+    n_threads (int): Общее число потоков (по умолчанию бюджет задачи `job`, см. resources.job_threads).
+
+    Returns:
+    tuple: (прогноз на тесте, прогноз на всем интервале, LithEnsemble).
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    groups, codes, columns = LithEnsemble.lith_groups(X_train, lith_name)
+    counts = np.bincount(groups[groups >= 0], minlength=len(codes))
+    # None - общая модель
+    tasks = [None] + [group for group in range(len(codes)) if counts[group] >= min_samples]
+    n_workers, per_task = resources.split_threads(resources.job_threads(job, n_threads), len(tasks))
+
+    def fit_group(group):
+        if job is not None:
+            job.raise_if_cancelled()
+        rows = np.arange(len(groups)) if group is None else np.flatnonzero(groups == group)
+        X_group = source.take_rows(X_train, rows)
+        # fit_fn также прогнозирует; прогноз по всем строкам строится маршрутизацией, поэтому передается одна строка
+        head = source.take_rows(X_group, [0])
+        return fit_fn(*clone_models(fit_args), X_group, source.take_rows(y_train, rows), head, head,
+                      n_threads=per_task, **fit_kwargs)[2]
+
+    fitted = []
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        for done, model in enumerate(executor.map(fit_group, tasks), start=1):
+            fitted.append(model)
+            if job is not None:
+                job.report(done, len(tasks), 'Обучено моделей по типам пород')
+
+    group_models = [None] * len(codes)
+    for group, model in zip(tasks[1:], fitted[1:]):
+        group_models[group] = model
+    ensemble = LithEnsemble(lith_name, columns, codes, group_models, fitted[0], counts)
+    return ensemble.predict(X_test), ensemble.predict(X_all), ensemble
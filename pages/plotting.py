@@ -1,36 +1,62 @@
 import streamlit as st
-import matplotlib.pyplot as plt
 import numpy as np
-from tqdm import tqdm
-import copy
+import pandas as pd
 
 import source
+import shared_cache
+import stages
+import well_log
+
+
+# Колонка прогноза в файлах, выгруженных из приложения
+PRED_COLUMNS = {'TC_par': 'TC_par_pred', 'TC_per': 'TC_per_pred', 'VHC': 'VHC_pred', 'Anisotropy': 'K_pred'}
+
+
+def align_runs(logs: dict, pred_column: str, tolerance: float) -> pd.DataFrame:
+    """
+    Прогнозы нескольких файлов на глубинах первого файла.
+
+    Каждая таблица один раз упорядочена по глубине (well_log.DepthIndexedLog),
+    значения переносятся на опорные глубины одним бинарным поиском;
+    глубины дальше `tolerance` от опорной дают NaN.
+
+    Returns:
+    pd.DataFrame: Колонка 'Глубина' и по колонке прогноза на каждый файл.
+    """
+    names = list(logs)
+    depth = logs[names[0]].depth
+    aligned = {'Глубина': depth}
+    for name in names:
+        aligned[name] = logs[name].at_depths(depth, [pred_column], tolerance)[pred_column].to_numpy()
+    return pd.DataFrame(aligned)
+
 
 def run_plotting():
 
     st.set_page_config(
         page_title="Визуализация полученных результатов",
         page_icon="🖥")
-    
+
     st.sidebar.success(r"Данный раздел предназначен для виулизации полученных в разделе \app результатов.")
-    
+
     st.write("### 1. Загрузка сохраненных прогнозных данных")
 
-    st.write("Загрузите входные данные в формате `.csv` или `.xlsx`.")
+    st.write("Загрузите один или несколько файлов с прогнозом в формате `.csv` или `.xlsx` "
+             "(например, прогнозы разных моделей или с типами пород и без) для сравнения на одном графике.")
 
-    uploaded_prediction = st.file_uploader("Prediction", 
-                                     type=['csv', 'xlsx'], 
+    uploaded_predictions = st.file_uploader("Prediction",
+                                     type=['csv', 'xlsx'],
+                                     accept_multiple_files=True,
                                      label_visibility='collapsed')
-    data_pred = source.load_file_to_st(uploaded_prediction)
 
     st.write("Что предсказано?")
 
-    what_to_predict = st.selectbox("Предсказано: ", 
-                                    ("TC_par", 
+    what_to_predict = st.selectbox("Предсказано: ",
+                                    ("TC_par",
                                     "TC_per",
                                     "VHC",
                                     "Anisotropy"))
-    
+
     st.info(f"Конфигурация прогноза: {what_to_predict}")
 
     if what_to_predict == 'TC_par':
@@ -42,25 +68,120 @@ def run_plotting():
     elif what_to_predict == 'Anisotropy':
         text = r'K, c.u.'
 
+    if not uploaded_predictions:
+        st.warning('Пожалуйста, загрузите файл с прогнозом.')
+        return
+
+    graph = stages.StageGraph()
+    pred_column = PRED_COLUMNS[what_to_predict]
+
+    # Файлы разбираются и упорядочиваются по глубине один раз (кэш по содержимому файла);
+    # глубины сопоставляются с допуском, поэтому таблицы остаются в float64
+    logs = {}
+    for uploaded in uploaded_predictions:
+        slot = f'plot_{uploaded.name}'
+        data_pred = shared_cache.load_file_shared(uploaded, f'с прогнозом {uploaded.name}', slot, float32=False)
+        if data_pred is None:
+            continue
+        # Глубина - первая колонка, прогноз - колонка прогноза приложения или вторая колонка
+        value_column = pred_column if pred_column in data_pred.columns else data_pred.columns[1]
+        log_stage = graph.run(f'index_{uploaded.name}',
+                              lambda table: well_log.DepthIndexedLog(
+                                  table.iloc[:, [0]].assign(**{pred_column: table[value_column]}),
+                                  table.columns[0], duplicates='mean'),
+                              graph.source(slot, data_pred, key=shared_cache.slot_key(slot)),
+                              depends=(pred_column, value_column))
+        logs[uploaded.name] = log_stage
+    if not logs:
+        return
+
+    first_log = next(iter(logs.values())).value
+    depth_step = float(np.median(np.diff(first_log.depth))) if len(first_log) > 1 else 0.1
+    tolerance = st.number_input("Допустимое расхождение глубин при сопоставлении, м:", min_value=0.0,
+                                value=round(depth_step, 3), step=0.05, format="%.3f")
+    aligned = graph.run('align', lambda *run_logs: align_runs(dict(zip(logs, run_logs)), pred_column, tolerance),
+                        *logs.values(), depends=(pred_column, tolerance)).value
+    names = list(logs)
+
+    st.write("### 2. Результаты измерений на керне (необязательно)")
+    uploaded_core = st.file_uploader("Core", type=['csv', 'xlsx'], label_visibility='collapsed')
+    core = None
+    if uploaded_core is not None:
+        data_core = shared_cache.load_file_shared(uploaded_core, 'с результатами измерений на керне', 'plot_core',
+                                                  float32=False)
+        if data_core is not None:
+            col_a, col_b = st.columns(2)
+            core_depth_name = col_a.selectbox("Колонка с глубиной:", list(data_core.columns))
+            numeric = [col for col in data_core.columns
+                       if col != core_depth_name and pd.api.types.is_numeric_dtype(data_core[col])]
+            core_value_name = col_b.selectbox("Измеренная величина:", numeric)
+
+            def core_at_predictions(table, *run_logs):
+                core_log = well_log.DepthIndexedLog(table[[core_depth_name, core_value_name]].dropna(),
+                                                    core_depth_name, duplicates='keep')
+                result = core_log.frame.rename(columns={core_depth_name: 'Глубина', core_value_name: 'Керн'})
+                for name, log in zip(logs, run_logs):
+                    result[name] = log.at_depths(core_log.depth, [pred_column], tolerance)[pred_column].to_numpy()
+                return result.reset_index(drop=True)
+
+            core = graph.run('align_core', core_at_predictions,
+                             graph.source('plot_core', data_core, key=shared_cache.slot_key('plot_core')),
+                             *logs.values(), depends=(core_depth_name, core_value_name, pred_column, tolerance)).value
+
+            metrics = []
+            for name in names:
+                matched = core[['Керн', name]].dropna()
+                if len(matched):
+                    row = source.compute_metrics(matched['Керн'].to_numpy(), matched[name].to_numpy()).iloc[0].to_dict()
+                    metrics.append({'Прогноз': name, 'Образцов': len(matched), **row})
+            if metrics:
+                st.write("Метрики прогнозов по образцам керна:")
+                st.dataframe(pd.DataFrame(metrics))
+
+    st.write("### 3. Сравнение прогнозов")
+    col_a, col_b = st.columns(2)
+    reference = col_a.selectbox("Базовый прогноз для разностей:", names)
+    max_points = col_b.number_input("Точек на кривой (прореживание для отображения):", min_value=500,
+                                    value=5000, step=500)
+
     # !!!
     import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
 
-    depth = data_pred.iloc[:, 0]
-    val = data_pred.iloc[:, 1]
-
-    fig = go.Figure()
-    fig.add_trace(go.Scatter(x=val, y=depth, mode='lines'))
+    depth = aligned['Глубина'].to_numpy()
+    fig = make_subplots(rows=1, cols=2, shared_yaxes=True,
+                        subplot_titles=('Прогнозы', f'Разность с {reference}'))
+    for name in names:
+        # Прореживание с сохранением минимумов и максимумов каждого участка кривой
+        idx = well_log.minmax_indices(aligned[name], max_points)
+        fig.add_trace(go.Scattergl(x=aligned[name].to_numpy()[idx], y=depth[idx], mode='lines', name=name,
+                                   legendgroup=name), row=1, col=1)
+        if name != reference:
+            difference = (aligned[name] - aligned[reference]).to_numpy()
+            idx = well_log.minmax_indices(difference, max_points)
+            fig.add_trace(go.Scattergl(x=difference[idx], y=depth[idx], mode='lines', name=name,
+                                       legendgroup=name, showlegend=False), row=1, col=2)
+    if core is not None:
+        fig.add_trace(go.Scattergl(x=core['Керн'], y=core['Глубина'], mode='markers', name='Керн',
+                                   marker=dict(color='black', size=5)), row=1, col=1)
 
     fig.update_yaxes(autorange="reversed")
+    fig.update_yaxes(title_text='Глубина, м', col=1)
+    fig.update_xaxes(title_text=text, col=1)
+    fig.update_xaxes(title_text=f'Δ {text}', col=2)
     fig.update_layout(
-        yaxis_title='Глубина, м',
-        xaxis_title=text,
         font_size=10,
-        width=500,
+        width=900,
         height=1000
     )
 
     st.plotly_chart(fig)
 
+    if len(names) > 1:
+        differences = pd.DataFrame({name: (aligned[name] - aligned[reference]).abs().describe()
+                                    for name in names if name != reference}).T
+        st.write(f"Модуль разности с {reference} по глубине:")
+        st.dataframe(differences[['count', 'mean', '50%', 'max']])
+
 if __name__ == "__main__":
-    run_plotting()
\ No newline at end of file
+    run_plotting()
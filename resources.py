@@ -0,0 +1,206 @@
+"""
+Распределение ядер процессора между задачами обучения и прогноза.
+
+Все задачи процесса (всех сессий Streamlit) получают потоки у общего
+планировщика ResourceScheduler. Выданное число потоков задается моделям
+явно (n_jobs, thread_count, число параллельных фолдов), поэтому суммарное
+число рабочих потоков не превышает числа ядер хоста. Размер бюджета задачи
+вычисляется при выдаче: при ограниченном числе одновременных задач - равная
+доля ядер на каждую из них, иначе - по числу активных задач. Пулы BLAS/OpenMP
+общие для всего процесса, поэтому ограничиваются на время выполнения задач
+(limit_blas_threads) наименьшим из их бюджетов и восстанавливаются после завершения последней.
+"""
+import os
+import time
+import threading
+from contextlib import contextmanager
+from collections import deque
+
+import numpy as np
+
+
+# Число ядер, доступных для обучения и прогноза (по умолчанию все ядра хоста)
+HOST_THREADS = int(os.environ.get('TRAINING_THREADS', os.cpu_count() or 1))
+
+
+class Lease:
+    """
+    Выданный задаче бюджет потоков. Освобождается release() или при выходе из блока with.
+    """
+    def __init__(self, scheduler, threads: int, waited: float):
+        self.scheduler = scheduler
+        self.threads = threads
+        self.waited = waited
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.scheduler._release(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class ResourceScheduler:
+    """
+    Планировщик потоков: выдает задачам бюджеты, сумма которых не превышает `total`.
+
+    Если свободных потоков меньше запрошенного, задача ждет их освобождения
+    (время ожидания учитывается в статистике).
+
+    Parameters:
+    total (int): Число потоков хоста.
+    """
+    def __init__(self, total: int = HOST_THREADS):
+        self.total = max(int(total), 1)
+        self.used = 0
+        self.active = 0
+        self.waiting = 0
+        self.leases = 0
+        self._waits = deque(maxlen=1000)
+        self._busy_time = 0.0
+        self._started = self._changed = time.monotonic()
+        self._cond = threading.Condition()
+
+    def _account(self):
+        now = time.monotonic()
+        self._busy_time += self.used * (now - self._changed)
+        self._changed = now
+
+    def share(self, max_active: int = None) -> int:
+        """
+        Доля ядер задачи.
+
+        При ограничении в `max_active` одновременных задач каждая получает `total // max_active`
+        потоков, поэтому задача, запущенная первой, не занимает ядра следующих. Иначе ядра делятся
+        поровну между выполняющимися и ожидающими задачами.
+        """
+        if max_active is not None:
+            return max(self.total // max(int(max_active), 1), 1)
+        return max(self.total // max(self.active + self.waiting, 1), 1)
+
+    def acquire(self, threads: int = None, max_active: int = None) -> Lease:
+        """
+        Бюджет из `threads` потоков с ожиданием освобождения ядер.
+
+        Без `threads` размер бюджета вычисляется в момент выдачи (см. share).
+        """
+        t0 = time.monotonic()
+        with self._cond:
+            self.waiting += 1
+            while True:
+                size = min(max(int(threads or self.share(max_active)), 1), self.total)
+                if self.used + size <= self.total:
+                    break
+                self._cond.wait()
+            threads = size
+            self.waiting -= 1
+            self._account()
+            self.used += threads
+            self.active += 1
+            self.leases += 1
+            waited = time.monotonic() - t0
+            self._waits.append(waited)
+        return Lease(self, threads, waited)
+
+    def _release(self, lease: Lease):
+        with self._cond:
+            self._account()
+            self.used -= lease.threads
+            self.active -= 1
+            self._cond.notify_all()
+
+    def stats(self) -> dict:
+        """
+        Текущая загрузка, средняя загрузка с момента запуска и время ожидания потоков.
+        """
+        with self._cond:
+            self._account()
+            waits = np.asarray(self._waits)
+            uptime = max(self._changed - self._started, 1e-9)
+            return {
+                'threads': self.total,
+                'used': self.used,
+                'active': self.active,
+                'waiting': self.waiting,
+                'leases': self.leases,
+                'utilisation': self._busy_time / (uptime * self.total),
+                'wait_mean_s': float(waits.mean()) if len(waits) else 0.0,
+                'wait_p95_s': float(np.percentile(waits, 95)) if len(waits) else 0.0,
+            }
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> ResourceScheduler:
+    """
+    Общий для процесса планировщик потоков.
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = ResourceScheduler()
+        return _scheduler
+
+
+def job_threads(job=None, n_threads: int = None) -> int:
+    """
+    Бюджет потоков задачи: заданный явно, выданный фоновой задаче `job` или все ядра.
+    """
+    return max(int(n_threads or getattr(job, 'threads', None) or HOST_THREADS), 1)
+
+
+def split_threads(n_threads: int, n_tasks: int) -> tuple:
+    """
+    Разделение бюджета между параллельными подзадачами.
+
+    Returns:
+    tuple: (число параллельных подзадач, потоков на подзадачу).
+    """
+    n_workers = max(min(n_tasks, n_threads), 1)
+    return n_workers, max(n_threads // n_workers, 1)
+
+
+_blas_lock = threading.Lock()
+_blas_limits = []
+_blas_limiter = None
+
+
+@contextmanager
+def limit_blas_threads(n_threads: int):
+    """
+    Ограничение пулов BLAS/OpenMP (numpy, scipy) через threadpoolctl, если он установлен.
+
+    Ограничение действует на весь процесс, а не на поток: при одновременных задачах
+    устанавливается наименьший из их бюджетов, а исходные значения восстанавливаются
+    при выходе последней задачи из блока with.
+    """
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:
+        yield
+        return
+
+    global _blas_limiter
+    n_threads = max(int(n_threads), 1)
+    with _blas_lock:
+        if not _blas_limits:
+            _blas_limiter = threadpool_limits(limits=n_threads, user_api='blas')
+        _blas_limits.append(n_threads)
+        threadpool_limits(limits=min(_blas_limits), user_api='blas')
+    try:
+        yield
+    finally:
+        with _blas_lock:
+            _blas_limits.remove(n_threads)
+            if _blas_limits:
+                threadpool_limits(limits=min(_blas_limits), user_api='blas')
+            else:
+                _blas_limiter.restore_original_limits()
+                _blas_limiter = None
@@ -0,0 +1,382 @@
+"""
+Локальный HTTP-сервис прогноза обученными моделями.
+
+Модель сохраняется из приложения кнопкой «Скачать модель» (файл .joblib с
+моделью и предобработкой source.GisTransform). Сервис принимает строки ГИС
+и объединяет одновременные запросы в один вызов predict (micro-batching).
+
+Запуск:
+    python serving.py TC_par_model.joblib [--host 127.0.0.1] [--port 8600]
+                      [--max-batch-rows 8192] [--max-wait-ms 5]
+
+Методы:
+    POST /predict  - строки ГИС в JSON (список записей, {"columns": [...], "data": [[...]]}
+                     или {колонка: [значения]}) или Arrow IPC stream
+                     (Content-Type: application/vnd.apache.arrow.stream).
+                     Ответ: {"predictions": {величина: [значения]}} или Arrow при Accept Arrow.
+    GET  /health   - прогнозируемые величины и необходимые колонки ГИС.
+    GET  /stats    - число запросов и строк, размер пакетов, задержки p50/p99, пропускная способность.
+"""
+import io
+import json
+import time
+import queue
+import threading
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+import models
+
+
+ARROW_STREAM = 'application/vnd.apache.arrow.stream'
+
+
+class ModelBundle:
+    """
+    Обученная модель с предобработкой строк ГИС.
+
+    Для цепочки TC_par -> K модель K получает прогноз предыдущей модели
+    `previous` в колонке `feed_column`; в результат добавляется TC_per_pred = TC_par_pred / K_pred.
+
+    Parameters:
+    model: Модель, возвращенная models.fit_predict, fit_predict_stacking или fit_predict_multi.
+    transform (source.GisTransform): Предобработка строк ГИС.
+    targets (list): Названия прогнозируемых величин (колонки результата).
+    previous (ModelBundle): Предыдущая модель цепочки.
+    feed_column (str): Колонка, в которую подставляется прогноз `previous`.
+    meta (dict): Описание модели (тип модели, дата обучения и т.п.).
+    """
+    def __init__(self, model, transform, targets, previous=None, feed_column=None, meta=None):
+        self.model = model
+        self.transform = transform
+        self.targets = list(targets)
+        self.previous = previous
+        self.feed_column = feed_column
+        self.meta = meta or {}
+
+    @property
+    def input_columns(self) -> list:
+        """
+        Колонки ГИС, необходимые для прогноза (без подставляемых прогнозов цепочки).
+        """
+        columns = [col for col in self.transform.input_columns if col != self.feed_column]
+        if self.previous is not None:
+            columns += [col for col in self.previous.input_columns if col not in columns]
+        return columns
+
+    @property
+    def output_columns(self) -> list:
+        columns = (self.previous.output_columns if self.previous is not None else []) + self.targets
+        if 'TC_par_pred' in columns and 'K_pred' in columns:
+            columns.append('TC_per_pred')
+        return columns
+
+    def predict(self, table: pd.DataFrame) -> pd.DataFrame:
+        """
+        Прогноз по строкам ГИС `table`.
+
+        Returns:
+        pd.DataFrame: Колонки output_columns, строки в порядке `table`.
+        """
+        result = pd.DataFrame(index=range(len(table)))
+        if self.previous is not None:
+            result = self.previous.predict(table)
+            table = table.assign(**{self.feed_column: result[self.previous.targets[0]].to_numpy(np.float32)})
+        pred = np.asarray(models.predict(self.model, self.transform(table))).reshape(len(table), -1)
+        for i, target in enumerate(self.targets):
+            result[target] = pred[:, i]
+        if 'TC_per_pred' in self.output_columns:
+            result['TC_per_pred'] = result['TC_par_pred'] / result['K_pred']
+        return result
+
+
+def dump_bundle(bundle: ModelBundle) -> bytes:
+    """
+    Сериализация модели в байты (joblib) для скачивания.
+    """
+    import joblib
+
+    buffer = io.BytesIO()
+    joblib.dump(bundle, buffer)
+    return buffer.getvalue()
+
+
+def load_bundle(path: str) -> ModelBundle:
+    """
+    Загрузка модели, сохраненной dump_bundle.
+    """
+    import joblib
+
+    return joblib.load(path)
+
+
+def numeric_columns(table: pd.DataFrame, columns) -> pd.DataFrame:
+    """
+    Таблица с колонками `columns`, приведенными к числам (пропуски допускаются).
+
+    Raises:
+    ValueError: Если в колонке есть значения, которые нельзя привести к числу.
+    """
+    converted = {}
+    for col in columns:
+        if col not in table.columns or pd.api.types.is_numeric_dtype(table[col]):
+            continue
+        values = pd.to_numeric(table[col], errors='coerce')
+        invalid = values.isna() & table[col].notna()
+        if invalid.any():
+            raise ValueError(f"Колонка {col}: нечисловое значение {table[col][invalid].iloc[0]!r}")
+        converted[col] = values
+    return table.assign(**converted) if converted else table
+
+
+class MicroBatcher:
+    """
+    Объединение одновременных запросов прогноза в пакеты.
+
+    Запросы накапливаются в очереди; рабочий поток забирает первый запрос и ждет
+    следующие не дольше `max_wait_ms` или до набора `max_batch_rows` строк,
+    после чего выполняет один вызов `predict_fn` на объединенной таблице.
+    Если вызов на пакете завершился ошибкой, запросы пакета выполняются по отдельности,
+    и ошибку получает только запрос, который ее вызвал.
+
+    Parameters:
+    predict_fn: Функция от DataFrame, возвращающая DataFrame с строкой на каждую входную строку.
+    columns (list): Колонки, приводимые к числам при постановке запроса в очередь (см. numeric_columns).
+    max_batch_rows (int): Максимальное число строк в пакете.
+    max_wait_ms (float): Максимальное ожидание следующих запросов, мс.
+    """
+    def __init__(self, predict_fn, max_batch_rows: int = 8192, max_wait_ms: float = 5.0, columns=None):
+        self.predict_fn = predict_fn
+        self.columns = list(columns or [])
+        self.max_batch_rows = max_batch_rows
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=10_000)
+        self._batch_sizes = deque(maxlen=10_000)
+        self._started = time.monotonic()
+        self.requests = 0
+        self.rows = 0
+        self.batches = 0
+        self.errors = 0
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def submit(self, table: pd.DataFrame) -> Future:
+        """
+        Постановка строк `table` в очередь; результат - DataFrame прогноза этих строк.
+
+        Raises:
+        ValueError: Если колонки self.columns нельзя привести к числам (запрос не ставится в очередь).
+        """
+        table = numeric_columns(table, self.columns)
+        future = Future()
+        self._queue.put((table.reset_index(drop=True), future, time.monotonic()))
+        return future
+
+    def predict(self, table: pd.DataFrame, timeout: float = None) -> pd.DataFrame:
+        return self.submit(table).result(timeout)
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch, n_rows = [item], len(item[0])
+            deadline = time.monotonic() + self.max_wait
+            stop = False
+            while n_rows < self.max_batch_rows:
+                try:
+                    item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+                n_rows += len(item[0])
+            self._run(batch)
+            if stop:
+                return
+
+    def _run(self, batch):
+        try:
+            table = pd.concat([item[0] for item in batch], axis=0, ignore_index=True)
+            result = self.predict_fn(table)
+        except Exception as e:
+            if len(batch) > 1:
+                # Ошибку вызвал один или несколько запросов пакета: остальные не должны ее получить
+                for item in batch:
+                    self._run([item])
+                return
+            with self._lock:
+                self.errors += 1
+            batch[0][1].set_exception(e)
+            return
+
+        done = time.monotonic()
+        start = 0
+        for part, future, submitted in batch:
+            future.set_result(result.iloc[start:start + len(part)].reset_index(drop=True))
+            start += len(part)
+        with self._lock:
+            self.requests += len(batch)
+            self.rows += len(table)
+            self.batches += 1
+            self._batch_sizes.append(len(batch))
+            self._latencies.extend(done - submitted for _, _, submitted in batch)
+
+    def stats(self) -> dict:
+        """
+        Счетчики сервиса: запросы, строки, пакеты, задержки p50/p99 (мс) и пропускная способность.
+        """
+        with self._lock:
+            latencies = np.asarray(self._latencies) * 1000
+            batch_sizes = np.asarray(self._batch_sizes)
+            uptime = time.monotonic() - self._started
+            return {
+                'requests': self.requests,
+                'rows': self.rows,
+                'batches': self.batches,
+                'errors': self.errors,
+                'mean_requests_per_batch': float(batch_sizes.mean()) if len(batch_sizes) else 0.0,
+                'latency_p50_ms': float(np.percentile(latencies, 50)) if len(latencies) else None,
+                'latency_p99_ms': float(np.percentile(latencies, 99)) if len(latencies) else None,
+                'requests_per_s': self.requests / uptime,
+                'rows_per_s': self.rows / uptime,
+                'uptime_s': uptime,
+            }
+
+
+def read_request(body: bytes, content_type: str) -> pd.DataFrame:
+    """
+    Строки ГИС из тела запроса (JSON или Arrow IPC stream).
+
+    Raises:
+    ValueError: Если формат тела запроса не поддерживается.
+    """
+    if content_type.startswith(ARROW_STREAM):
+        import pyarrow as pa
+
+        return pa.ipc.open_stream(body).read_all().to_pandas()
+    payload = json.loads(body)
+    if isinstance(payload, list):
+        return pd.DataFrame.from_records(payload)
+    if isinstance(payload, dict) and 'columns' in payload and 'data' in payload:
+        return pd.DataFrame(payload['data'], columns=payload['columns'])
+    if isinstance(payload, dict):
+        return pd.DataFrame(payload)
+    raise ValueError('Ожидается список записей или таблица в формате JSON')
+
+
+def write_arrow(table: pd.DataFrame) -> bytes:
+    import pyarrow as pa
+
+    arrow_table = pa.Table.from_pandas(table, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, arrow_table.schema) as writer:
+        writer.write_table(arrow_table)
+    return sink.getvalue().to_pybytes()
+
+
+def make_server(bundle: ModelBundle, host: str = '127.0.0.1', port: int = 8600,
+                max_batch_rows: int = 8192, max_wait_ms: float = 5.0) -> ThreadingHTTPServer:
+    """
+    HTTP-сервер прогноза моделью `bundle` (запускается server.serve_forever()).
+
+    Каждое соединение обслуживается отдельным потоком, прогноз выполняется
+    общим MicroBatcher (атрибут server.batcher). Порт 0 - любой свободный порт.
+    """
+    batcher = MicroBatcher(bundle.predict, max_batch_rows=max_batch_rows, max_wait_ms=max_wait_ms,
+                           columns=bundle.input_columns)
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def send_body(self, status: int, body: bytes, content_type: str = 'application/json'):
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def send_json(self, status: int, payload):
+            self.send_body(status, json.dumps(payload, ensure_ascii=False).encode())
+
+        def do_GET(self):
+            if self.path == '/health':
+                self.send_json(200, {'targets': bundle.output_columns, 'input_columns': bundle.input_columns,
+                                     'meta': bundle.meta})
+            elif self.path == '/stats':
+                self.send_json(200, batcher.stats())
+            else:
+                self.send_json(404, {'error': f'Неизвестный путь {self.path}'})
+
+        def do_POST(self):
+            if self.path != '/predict':
+                self.send_json(404, {'error': f'Неизвестный путь {self.path}'})
+                return
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            try:
+                table = read_request(body, self.headers.get('Content-Type', 'application/json'))
+            except Exception as e:
+                self.send_json(400, {'error': f'Некорректное тело запроса: {e}'})
+                return
+            missing = [col for col in bundle.input_columns if col not in table.columns]
+            if missing:
+                self.send_json(400, {'error': f"Нет колонок ГИС: {', '.join(map(str, missing))}"})
+                return
+            try:
+                future = batcher.submit(table)
+            except ValueError as e:
+                self.send_json(400, {'error': f'Некорректные значения: {e}'})
+                return
+            try:
+                result = future.result()
+            except Exception as e:
+                self.send_json(500, {'error': str(e)})
+                return
+            if self.headers.get('Accept', '').startswith(ARROW_STREAM):
+                self.send_body(200, write_arrow(result), ARROW_STREAM)
+            else:
+                self.send_json(200, {'predictions': {col: result[col].astype(float).tolist()
+                                                     for col in result.columns}})
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    server.batcher = batcher
+    return server
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('model')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8600)
+    parser.add_argument('--max-batch-rows', type=int, default=8192)
+    parser.add_argument('--max-wait-ms', type=float, default=5.0)
+    args = parser.parse_args()
+
+    bundle = load_bundle(args.model)
+    server = make_server(bundle, args.host, args.port, args.max_batch_rows, args.max_wait_ms)
+    print(f"Прогноз {', '.join(bundle.output_columns)} на http://{args.host}:{server.server_address[1]}/predict")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.batcher.close()
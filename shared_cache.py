@@ -0,0 +1,265 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+
+import streamlit as st
+
+import source
+import data_layer
+import well_log
+
+
+# Максимальный объем общего кэша (МБ) для всех сессий процесса
+SHARED_CACHE_MAX_MB = float(os.environ.get('SHARED_CACHE_MAX_MB', 1024))
+# Ссылка сессии считается активной, пока сессия обращалась к записи не позже REF_TTL секунд назад
+REF_TTL = 3600
+
+
+def sizeof(value) -> int:
+    """
+    Оценка объема памяти значения в байтах (таблицы, массивы, байты и их кортежи).
+    """
+    if isinstance(value, (list, tuple)):
+        return sum(sizeof(item) for item in value)
+    if isinstance(value, dict):
+        return sum(sizeof(item) for item in value.values())
+    if isinstance(value, bytes):
+        return len(value)
+    if isinstance(value, well_log.DepthIndexedLog):
+        return sizeof(value.frame)
+    return data_layer.frame_nbytes(value) or 0
+
+
+def current_session_id() -> str:
+    """
+    Идентификатор текущей сессии Streamlit ('local' вне Streamlit).
+    """
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        ctx = get_script_run_ctx()
+    except ImportError:
+        ctx = None
+    return ctx.session_id if ctx is not None else 'local'
+
+
+class _Entry:
+    def __init__(self, value, nbytes):
+        self.value = value
+        self.nbytes = nbytes
+        self.refs = {}
+
+
+class SharedCache:
+    """
+    Общий для всех сессий кэш разобранных таблиц и обученных моделей.
+
+    Ключ записи - хеш содержимого (см. source.fingerprint). Каждая сессия,
+    получившая значение, удерживает на него ссылку; при превышении лимита памяти
+    вытесняются давно не использованные записи без активных ссылок.
+    Значения из кэша разделяются между сессиями и не должны изменяться на месте.
+    """
+    def __init__(self, max_bytes: int = int(SHARED_CACHE_MAX_MB * 2**20)):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def _acquire_ref(self, key, entry, session_id):
+        entry.refs[session_id] = time.time()
+        self._entries.move_to_end(key)
+
+    def get(self, key, session_id: str = None):
+        """
+        Возвращает значение по ключу (или None) и регистрирует ссылку сессии.
+        """
+        session_id = session_id or current_session_id()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self.hits += 1
+            self._acquire_ref(key, entry, session_id)
+            return entry.value
+
+    def put(self, key, value, session_id: str = None):
+        """
+        Помещает значение в кэш и регистрирует ссылку сессии.
+        """
+        session_id = session_id or current_session_id()
+        nbytes = sizeof(value)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.nbytes -= old.nbytes
+            entry = _Entry(value, nbytes)
+            self._entries[key] = entry
+            self.nbytes += nbytes
+            self._acquire_ref(key, entry, session_id)
+            self._evict()
+        return value
+
+    def get_or_create(self, key, factory, session_id: str = None):
+        """
+        Возвращает значение из кэша или вычисляет его через `factory()`.
+
+        Если несколько сессий одновременно запрашивают один ключ,
+        значение вычисляется один раз, остальные сессии ожидают результат.
+        """
+        session_id = session_id or current_session_id()
+        value = self.get(key, session_id)
+        if value is not None:
+            return value
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            value = self.get(key, session_id)
+            if value is not None:
+                return value
+            with self._lock:
+                self.misses += 1
+            value = factory()
+            if value is not None:
+                self.put(key, value, session_id)
+        with self._lock:
+            self._key_locks.pop(key, None)
+        return value
+
+    def release(self, key, session_id: str = None):
+        """
+        Снимает ссылку сессии с записи.
+        """
+        session_id = session_id or current_session_id()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.refs.pop(session_id, None)
+                self._evict()
+
+    def _evict(self):
+        if self.nbytes <= self.max_bytes:
+            return
+        now = time.time()
+        for key in list(self._entries.keys()):
+            if self.nbytes <= self.max_bytes:
+                break
+            entry = self._entries[key]
+            entry.refs = {sid: t for sid, t in entry.refs.items() if now - t < REF_TTL}
+            if not entry.refs:
+                del self._entries[key]
+                self.nbytes -= entry.nbytes
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'entries': len(self._entries),
+                    'MB': self.nbytes / 2**20,
+                    'limit_MB': self.max_bytes / 2**20,
+                    'hits': self.hits,
+                    'misses': self.misses,
+                    'evictions': self.evictions}
+
+
+@st.cache_resource
+def get_shared_cache() -> SharedCache:
+    return SharedCache()
+
+
+def session_get_or_create(slot: str, key, factory):
+    """
+    Получает значение из общего кэша для «слота» текущей сессии.
+
+    Если в слоте раньше было другое значение (например, пользователь загрузил
+    другой файл), ссылка сессии на прежнюю запись снимается.
+
+    Parameters:
+    slot (str): Назначение значения в сессии (например, 'all_gis').
+    key: Ключ содержимого.
+    factory: Функция, вычисляющая значение при промахе кэша.
+    """
+    cache = get_shared_cache()
+    slots = st.session_state.setdefault('shared_cache_slots', {})
+    previous = slots.get(slot)
+    if previous is not None and previous != key:
+        cache.release(previous)
+    slots[slot] = key
+    return cache.get_or_create(key, factory)
+
+
+def slot_key(slot: str):
+    """
+    Ключ значения, которое текущая сессия получила для «слота» (см. session_get_or_create), или None.
+    """
+    return st.session_state.get('shared_cache_slots', {}).get(slot)
+
+
+def load_file_shared(uploaded_file, warning_name: str, slot: str, float32: bool = True, keep=()):
+    """
+    Загружает файл через source.load_file_to_st, разделяя результат между сессиями.
+
+    Таблица кэшируется по хешу содержимого файла, поэтому повторная загрузка
+    того же файла в другой сессии не требует повторного разбора.
+
+    Parameters:
+    uploaded_file: Загруженный через streamlit.file_uploader файл.
+    warning_name (str): Описание файла для сообщения об ошибке.
+    slot (str): Назначение таблицы в сессии (например, 'all_gis').
+    float32 (bool): Привести вещественные колонки к float32 (data_layer.to_float32).
+    keep: Колонки, остающиеся в float64 при приведении (например, глубина).
+
+    Returns:
+    pd.DataFrame: Таблица с данными (только для чтения) или None.
+    """
+    if uploaded_file is None or not hasattr(uploaded_file, 'getvalue'):
+        return source.load_file_to_st(uploaded_file, warning_name)
+    file_type = uploaded_file.name.split('.')[-1]
+    key = ('file', source.fingerprint(uploaded_file.getvalue(), file_type), float32, tuple(keep))
+
+    def factory():
+        table = source.load_file_to_st(uploaded_file, warning_name)
+        return data_layer.to_float32(table, keep) if float32 else table
+
+    return session_get_or_create(slot, key, factory)
+
+
+def load_files_shared(uploaded_files: list, warning_name: str, slot: str, all_sheets: bool = True,
+                      float32: bool = True, keep=()):
+    """
+    Загружает несколько файлов (и все листы книг Excel) в одну таблицу через ingest.read_uploaded,
+    разделяя результат между сессиями (см. load_file_shared).
+
+    Returns:
+    pd.DataFrame: Объединенная таблица (только для чтения) или None.
+    """
+    if not uploaded_files:
+        return source.load_file_to_st(None, warning_name)
+    import ingest
+
+    contents = [file.getvalue() for file in uploaded_files]
+    names = [file.name for file in uploaded_files]
+    key = ('files', source.fingerprint(*contents, names, all_sheets), float32, tuple(keep))
+
+    def factory():
+        try:
+            table = ingest.read_uploaded(uploaded_files, all_sheets=all_sheets)
+            return data_layer.to_float32(table, keep) if float32 else table
+        except Exception as e:
+            st.write(e)
+
+    return session_get_or_create(slot, key, factory)
+
+
+def code_counts_shared(values, slot: str):
+    """
+    Распределение кодов колонки (well_log.code_counts), вычисленное один раз для каждого набора данных.
+
+    Parameters:
+    values (pd.Series): Колонка с кодами (например, типами пород).
+    slot (str): Назначение распределения в сессии (например, 'lith_counts_gis').
+    """
+    key = ('code_counts', source.fingerprint(values))
+    return session_get_or_create(slot, key, lambda: well_log.code_counts(values))
@@ -1,4 +1,7 @@
+import hashlib
+
 import streamlit as st
+import numpy as np
 import pandas as pd
 
 allowed_extensions = ['csv', 'xlsx']
@@ -21,7 +24,8 @@ def load_file(file: bytes, filetype: str) -> pd.DataFrame:
         if filetype == 'csv':
             df = pd.read_csv(file)
         elif filetype == 'xlsx':
-            df = pd.read_excel(file)
+            import ingest
+            df = pd.read_excel(file, engine=ingest.EXCEL_ENGINE)
         return df
     else:
         raise Exception("Неподходящее расширение файла. Пожалуйста, загрузите файл в формате .csv или .xlsx.")
@@ -54,13 +58,83 @@ def load_file_to_st(uploaded_file: bytes, warning_name: str) -> pd.DataFrame:
         st.error(f"Пожалуйста, загрузите файл {warning_name}.")
 
 
-import pandas as pd
-from sklearn.preprocessing import StandardScaler
-from sklearn.preprocessing import MinMaxScaler
+def fingerprint(*objects) -> str:
+    """
+    Вычисляет хеш содержимого таблиц и массивов.
+
+    Parameters:
+    *objects: DataFrame, Series, ndarray, bytes или None.
+
+    Returns:
+    str: Шестнадцатеричный хеш.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    for obj in objects:
+        if obj is None:
+            h.update(b'none')
+        elif isinstance(obj, (pd.DataFrame, pd.Series)):
+            labels = list(obj.columns) if isinstance(obj, pd.DataFrame) else obj.name
+            h.update(repr((labels, obj.shape)).encode())
+            h.update(pd.util.hash_pandas_object(obj, index=False).to_numpy().tobytes())
+        elif isinstance(obj, np.ndarray):
+            h.update(repr((obj.dtype.str, obj.shape)).encode())
+            h.update(np.ascontiguousarray(obj).tobytes())
+        elif isinstance(obj, (bytes, memoryview)):
+            h.update(obj)
+        else:
+            h.update(repr(obj).encode())
+    return h.hexdigest()
+
+
+# Тип вещественных признаков после масштабирования (выбор точности в приложении)
+FEATURE_DTYPES = {'float32': np.float32, 'float64': np.float64}
+
+
+def make_scaler(mode: str = 'ss'):
+    """
+    StandardScaler (`mode='ss'`) или MinMaxScaler (`mode='mms'`) с масштабированием на месте.
+
+    Масштабируемые массивы создает scale_columns, поэтому copy=False
+    не изменяет исходные таблицы.
+    """
+    from sklearn.preprocessing import StandardScaler, MinMaxScaler
+    if mode == 'ss':
+        return StandardScaler(copy=False)
+    elif mode == 'mms':
+        return MinMaxScaler(copy=False)
+    raise ValueError(f'Неизвестный способ масштабирования: {mode}')
+
+
+def scale_columns(table: pd.DataFrame, columns: list, scaler, dtype=np.float32, fit: bool = False) -> np.ndarray:
+    """
+    Масштабированные колонки `columns` таблицы.
+
+    Колонки один раз копируются в новый массив `dtype`, масштабирование
+    выполняется в этом массиве (для scaler из make_scaler - на месте, без
+    промежуточных float64 копий при dtype=float32).
+
+    Parameters:
+    table (pd.DataFrame): Исходная таблица (не изменяется).
+    columns (list): Масштабируемые колонки.
+    scaler: StandardScaler или MinMaxScaler.
+    dtype: Тип результата (np.float32 или np.float64).
+    fit (bool): Обучить `scaler` на этих строках.
+
+    Returns:
+    np.ndarray: Массив (число строк, число колонок) типа `dtype`.
+    """
+    values = table[columns].to_numpy(dtype=dtype, copy=True)
+    if fit:
+        scaler.fit(values)
+    elif hasattr(scaler, 'feature_names_in_'):
+        # Масштабирование, обученное на таблице (сохраненные ранее модели)
+        return scaler.transform(pd.DataFrame(values, columns=columns, copy=False))
+    return scaler.transform(values)
 
 
 def get_preprocessed_data(X_train_orig, X_test_orig, ALL_GIS, mode='ss', do_ohe=True,
-                          lith_name='Код Prime', mode_pred='tc_par', feature_names=None, tc_par_name='TC_par_ups'):
+                          lith_name='Код Prime', mode_pred='tc_par', feature_names=None, tc_par_name='TC_par_ups',
+                          dtype=np.float32):
     """_summary_
 
     Args:
@@ -68,22 +142,25 @@ def get_preprocessed_data(X_train_orig, X_test_orig, ALL_GIS, mode='ss', do_ohe=
         X_test_orig (_type_): _description_
         ALL_GIS (_type_): _description_
         mode (str, optional): _description_. Defaults to 'ss'.
+        do_ohe (bool, optional): one-hot колонки типов пород; иначе одна категориальная
+            колонка с общим набором кодов (см. lith_categorical). Defaults to True.
+        dtype (optional): тип масштабированных признаков (см. FEATURE_DTYPES). Defaults to np.float32.
 
     Returns:
         _type_: _description_
     """
-    # One-hot encoding of categorial featurs ('Код Prime')
-    X_train_one_hot_encoded = pd.get_dummies(X_train_orig[lith_name], prefix=lith_name, dtype=float)
-    X_train = pd.concat([X_train_orig.drop('Код Prime', axis=1), X_train_one_hot_encoded], axis=1)
-
-    X_test_one_hot_encoded = pd.get_dummies(X_test_orig[lith_name], prefix=lith_name, dtype=float)
-    X_test = pd.concat([X_test_orig.drop(lith_name, axis=1), X_test_one_hot_encoded], axis=1)
+    if do_ohe:
+        # One-hot encoding of categorial featurs ('Код Prime')
+        X_train_one_hot_encoded = pd.get_dummies(X_train_orig[lith_name], prefix=lith_name, dtype=np.float32)
+        X_train = pd.concat([X_train_orig.drop('Код Prime', axis=1), X_train_one_hot_encoded], axis=1)
 
-    all_gis_one_hot_encoded = pd.get_dummies(ALL_GIS[lith_name], prefix=lith_name, dtype=float)
-    ALL_GIS_encoded = pd.concat([ALL_GIS.drop(lith_name, axis=1), all_gis_one_hot_encoded], axis=1)
+        X_test_one_hot_encoded = pd.get_dummies(X_test_orig[lith_name], prefix=lith_name, dtype=np.float32)
+        X_test = pd.concat([X_test_orig.drop(lith_name, axis=1), X_test_one_hot_encoded], axis=1)
+    else:
+        X_train = X_train_orig.drop(lith_name, axis=1)
+        X_test = X_test_orig.drop(lith_name, axis=1)
 
     # Numerica features selection
-    ALL_GIS_encoded = ALL_GIS_encoded.reindex(columns=X_train.columns, fill_value=0)
     # if 'TC_par_ups' in X_train_orig.columns.values:
     #     numeric_features = ['TC_par_ups', 'AK', 'BKS', 'DS_DN','GGP', 'GKS', 'NGKS', 'K', 'Th', 'U']
     # elif 'TC_par_pred' in X_train_orig.columns.values:
@@ -98,48 +175,140 @@ def get_preprocessed_data(X_train_orig, X_test_orig, ALL_GIS, mode='ss', do_ohe=
 
     ohe_cat_features = [item for item in X_train.columns.values.tolist() if item not in numeric_features]
 
-    X_train_numeric = X_train[numeric_features]
-    X_test_numeric = X_test[numeric_features]
-    ALL_GIS_numeric = ALL_GIS_encoded[numeric_features]
-
     # Scaler creation
-    if mode == 'ss':
-        scaler = StandardScaler()
-    elif mode == 'mms':
-        scaler = MinMaxScaler()
+    scaler = make_scaler(mode)
 
-    X_train_scaled = scaler.fit_transform(X_train_numeric)
-    X_test_scaled = scaler.transform(X_test_numeric)
-    ALL_GIS_scaled = scaler.transform(ALL_GIS_numeric)
+    X_train_scaled = scale_columns(X_train, numeric_features, scaler, dtype=dtype, fit=True)
+    X_test_scaled = scale_columns(X_test, numeric_features, scaler, dtype=dtype)
 
     # Create DataFrame for scaled numeric attributes
-    X_train_scaled_df = pd.DataFrame(X_train_scaled, columns=X_train_numeric.columns)
-    X_test_scaled_df = pd.DataFrame(X_test_scaled, columns=X_train_numeric.columns)
-    ALL_GIS_scaled_df = pd.DataFrame(ALL_GIS_scaled, columns=X_train_numeric.columns)
+    X_train_scaled_df = pd.DataFrame(X_train_scaled, columns=numeric_features, copy=False)
+    X_test_scaled_df = pd.DataFrame(X_test_scaled, columns=numeric_features, copy=False)
 
     X_train_categorical = X_train[ohe_cat_features]
     X_test_categorical = X_test[ohe_cat_features]
-    ALL_GIS_categorical = ALL_GIS_encoded[ohe_cat_features]
 
     # Transferring cat dataframe indexes to numerical dataframe
     X_train_scaled_df.set_index(X_train_categorical.index, inplace=True)
     X_test_scaled_df.set_index(X_test_categorical.index, inplace=True)
-    ALL_GIS_scaled_df.set_index(ALL_GIS_categorical.index, inplace=True)
 
     # Combining scaled numeric and categorical features
     if do_ohe:
         X_train_combined = pd.concat([X_train_scaled_df, X_train_categorical], axis=1)
         X_test_combined = pd.concat([X_test_scaled_df, X_test_categorical], axis=1)
-        ALL_GIS_combined = pd.concat([ALL_GIS_scaled_df, ALL_GIS_categorical], axis=1)
+        categories = None
     else:
-        X_train_combined = pd.concat([X_train_scaled_df, X_train_orig[lith_name].astype(str)], axis=1)
-        X_test_combined = pd.concat([X_test_scaled_df, X_test_orig[lith_name].astype(str)], axis=1)
-        ALL_GIS_combined = pd.concat([ALL_GIS_scaled_df, ALL_GIS[lith_name].astype(str)], axis=1)
+        # Категориальная колонка: один столбец кодов вместо плотных one-hot колонок
+        categories = np.union1d(np.union1d(X_train_orig[lith_name].unique(), X_test_orig[lith_name].unique()),
+                                [UNKNOWN_LITH])
+        X_train_combined = pd.concat([X_train_scaled_df, lith_categorical(X_train_orig[lith_name], categories)], axis=1)
+        X_test_combined = pd.concat([X_test_scaled_df, lith_categorical(X_test_orig[lith_name], categories)], axis=1)
+
+    ALL_GIS_combined = transform_gis(ALL_GIS, X_train.columns, numeric_features, scaler,
+                                     lith_name=lith_name, do_ohe=do_ohe, categories=categories, dtype=dtype)
 
     return X_train_combined, X_test_combined, ALL_GIS_combined, scaler
 
 
-import numpy as np
+def transform_gis(ALL_GIS, train_columns, numeric_features, scaler, lith_name='Код Prime', do_ohe=True,
+                  categories=None, dtype=np.float32):
+    """
+    Предобработка данных ГИС обученным масштабированием (как ALL_GIS в get_preprocessed_data).
+
+    Не зависит от остальных строк таблицы, поэтому может применяться
+    к отдельным частям интервала (например, при постраничном прогнозе).
+
+    Parameters:
+    ALL_GIS (pd.DataFrame): Данные ГИС (весь интервал или его часть).
+    train_columns (list): Колонки обучающей выборки после one-hot кодирования.
+    numeric_features (list): Масштабируемые числовые признаки.
+    scaler: Обученный StandardScaler или MinMaxScaler.
+    lith_name (str): Колонка с типами пород.
+    do_ohe (bool): Использовать one-hot кодирование типов пород.
+        Иначе типы пород передаются одной категориальной колонкой (см. lith_categorical).
+    categories: Коды типов пород категориальной колонки (при do_ohe=False).
+    dtype: Тип масштабированных признаков.
+
+    Returns:
+    pd.DataFrame: Масштабированные числовые признаки и типы пород.
+    """
+    if not do_ohe:
+        ALL_GIS_scaled_df = pd.DataFrame(scale_columns(ALL_GIS, numeric_features, scaler, dtype=dtype),
+                                         columns=numeric_features, index=ALL_GIS.index, copy=False)
+        return pd.concat([ALL_GIS_scaled_df, lith_categorical(ALL_GIS[lith_name], categories)], axis=1)
+
+    all_gis_one_hot_encoded = pd.get_dummies(ALL_GIS[lith_name], prefix=lith_name, dtype=np.float32)
+    ALL_GIS_encoded = pd.concat([ALL_GIS.drop(lith_name, axis=1), all_gis_one_hot_encoded], axis=1)
+    ALL_GIS_encoded = ALL_GIS_encoded.reindex(columns=train_columns, fill_value=0)
+
+    ohe_cat_features = [item for item in list(train_columns) if item not in numeric_features]
+    ALL_GIS_scaled_df = pd.DataFrame(scale_columns(ALL_GIS_encoded, numeric_features, scaler, dtype=dtype),
+                                     columns=numeric_features, index=ALL_GIS_encoded.index, copy=False)
+    return pd.concat([ALL_GIS_scaled_df, ALL_GIS_encoded[ohe_cat_features]], axis=1)
+
+
+# Код для типов пород, не встречавшихся в обучающей и тестовой выборках
+UNKNOWN_LITH = -1
+
+
+def lith_categorical(values: pd.Series, categories) -> pd.Series:
+    """
+    Типы пород в виде категориальной колонки с фиксированным набором кодов `categories`.
+
+    Одинаковый набор кодов в обучающей, тестовой выборках и данных ГИС гарантирует
+    одинаковое представление для всех моделей. Коды, которых нет в наборе,
+    заменяются на UNKNOWN_LITH.
+    """
+    categories = pd.Index(categories)
+    # Целые коды, прочитанные как float (например, при пропусках в колонке): XGBoost не принимает
+    # вещественные категории
+    if categories.dtype.kind == 'f' and np.array_equal(categories, np.floor(categories)):
+        categories = categories.astype(np.int64)
+    values = values.where(values.isin(categories), UNKNOWN_LITH)
+    return pd.Series(pd.Categorical(values, categories=categories), index=values.index, name=values.name)
+
+
+class GisTransform:
+    """
+    Обученная предобработка строк ГИС для прогноза (масштабирование и типы пород).
+
+    В отличие от lambda-функции сохраняется вместе с моделью (pickle/joblib),
+    поэтому используется и в приложении, и в сервисе прогноза serving.py.
+
+    Parameters:
+    scaler: Обученный StandardScaler или MinMaxScaler.
+    columns (list): Числовые признаки в порядке обучения.
+    lith_name (str): Колонка с типами пород (None, если типы пород не используются).
+    train_columns (list): Колонки обучающей выборки после one-hot кодирования.
+    do_ohe (bool): One-hot кодирование типов пород (иначе категориальная колонка).
+    categories: Коды типов пород категориальной колонки.
+    dtype: Тип масштабированных признаков.
+    """
+    def __init__(self, scaler, columns, lith_name=None, train_columns=None, do_ohe=True, categories=None,
+                 dtype=np.float32):
+        self.scaler = scaler
+        self.columns = list(columns)
+        self.lith_name = lith_name
+        self.train_columns = list(train_columns) if train_columns is not None else None
+        self.do_ohe = do_ohe
+        self.categories = categories
+        self.dtype = dtype
+
+    @property
+    def input_columns(self) -> list:
+        """
+        Колонки ГИС, необходимые для прогноза.
+        """
+        return self.columns + ([self.lith_name] if self.lith_name is not None else [])
+
+    def __call__(self, table: pd.DataFrame):
+        # Предобработка, сохраненная до появления параметра dtype
+        dtype = getattr(self, 'dtype', np.float64)
+        if self.lith_name is None:
+            return scale_columns(table, self.columns, self.scaler, dtype=dtype)
+        return transform_gis(table, self.train_columns, self.columns, self.scaler, lith_name=self.lith_name,
+                             do_ohe=self.do_ohe, categories=self.categories, dtype=dtype)
+
 
 class Metrics:
     def __init__(self):
@@ -181,7 +350,10 @@ class Metrics:
 
 
 metrics = Metrics()
-def get_metrics(y_test, y_pred):
+def compute_metrics(y_test, y_pred):
+    # Метрики считаются в float64 и при обучении в float32
+    y_test = np.asarray(y_test, dtype=np.float64)
+    y_pred = np.asarray(y_pred, dtype=np.float64)
     mse = metrics.mse(y_test, y_pred)
     rmse = metrics.rmse(y_test, y_pred)
     mae = metrics.mae(y_test, y_pred)
@@ -195,37 +367,46 @@ def get_metrics(y_test, y_pred):
     }
     df = pd.DataFrame(data_met)
 
+    return df
+
+
+def get_metrics(y_test, y_pred):
+    df = compute_metrics(y_test, y_pred)
+
     st.write(df)
 
+    return df
 
 
-from sklearn.model_selection import GridSearchCV
-from sklearn.ensemble import GradientBoostingRegressor
-import xgboost as xgb
-from catboost import CatBoostRegressor
-from tqdm import tqdm
-import numpy as np
-import pandas as pd
-import pickle
-from IPython.display import display
-from sklearn.linear_model import LinearRegression
-from sklearn.ensemble import RandomForestRegressor
-from sklearn.ensemble import GradientBoostingRegressor
-from sklearn.svm import SVR
-from sklearn.pipeline import make_pipeline
-from sklearn.ensemble import StackingRegressor
-import numpy as np
-from sklearn.model_selection import GridSearchCV, cross_val_predict
-import xgboost as xgb
-from catboost import CatBoostRegressor
-from sklearn.tree import DecisionTreeRegressor
 
+def training_rows(table: pd.DataFrame, columns: list, lith_name: str = None, max_count: int = 2) -> pd.DataFrame:
+    """
+    Строки выборки с заполненными колонками `columns`.
 
+    Если задана колонка с типами пород, строки типов пород, представленных
+    не более чем `max_count` образцами, добавляются повторно (для стратифицированного разбиения).
+
+    Returns:
+    pd.DataFrame: Новая таблица с колонками `columns` и индексом 0..n-1.
+    """
+    table = table[columns].dropna().reset_index(drop=True)
+    if lith_name is None:
+        return table
+    counts = table[lith_name].value_counts()
+    rare = counts[counts <= max_count].index.values
+    if len(rare) == 0:
+        return table
+    return pd.concat([table] + [table[table[lith_name] == val] for val in rare], axis=0).reset_index(drop=True)
 
 
+def take_rows(X, idx):
+    """
+    Positional row selection for both numpy arrays and pandas objects.
+    """
+    return X.iloc[idx] if hasattr(X, 'iloc') else X[idx]
 
 
-def metaregressor(base_clfs, final_classifier, X_train, X_test, y_train, cv):
+def metaregressor(base_clfs, final_classifier, X_train, X_test, y_train, cv, progress=None, n_jobs=-1):
     """
     Meta classifier prediction using stacking. 
     Input:
@@ -235,6 +416,9 @@ def metaregressor(base_clfs, final_classifier, X_train, X_test, y_train, cv):
     :param X_test: numpy array or pandas table, target for train set.
     :param X_train: numpy array or pandas table, test set.
     :param cv: number of cross-validation folds.
+    :param progress: callable(step, total), optional, called after every fold and every base model refit.
+        Folds are then computed sequentially instead of with cross_val_predict(n_jobs).
+    :param n_jobs: number of parallel jobs for cross_val_predict.
     
     Output:
     :param y_pred: numpy array or pandas table, prediction of meta classifier using stacking on test set.
@@ -244,6 +428,8 @@ def metaregressor(base_clfs, final_classifier, X_train, X_test, y_train, cv):
     
     """
     ### BEGIN Solution (do not delete this comment)
+    from sklearn.base import clone
+    from sklearn.model_selection import KFold, cross_val_predict
 
     # Initializing of empty arrays to store scores
     length_tr = X_train.shape[0]
@@ -253,11 +439,24 @@ def metaregressor(base_clfs, final_classifier, X_train, X_test, y_train, cv):
     test_score_mem = np.zeros([length_te, width])
 
     # Filling the empty arrays with scores
+    total = width * (cv + 1)
+    step = 0
     i = 0
     for model in base_clfs:
-      train_score_mem[:, i] = cross_val_predict(model, X_train, y_train, cv=cv, n_jobs = -1)
+      if progress is None:
+        train_score_mem[:, i] = cross_val_predict(model, X_train, y_train, cv=cv, n_jobs = n_jobs)
+      else:
+        for train_idx, val_idx in KFold(n_splits=cv).split(X_train):
+          fold_model = clone(model)
+          fold_model.fit(take_rows(X_train, train_idx), take_rows(y_train, train_idx))
+          train_score_mem[val_idx, i] = fold_model.predict(take_rows(X_train, val_idx))
+          step += 1
+          progress(step, total)
       model.fit(X_train, y_train)
       test_score_mem[:, i] = model.predict(X_test)
+      if progress is not None:
+        step += 1
+        progress(step, total)
       i += 1
 
     # Training the final classifier on scores from X_train
@@ -0,0 +1,82 @@
+"""
+Этапы обработки данных приложения с запоминанием результатов между перезапусками страницы.
+
+Конвейер App.run разбит на этапы (загрузка, исключение типов пород, привязка
+к глубинам керна, балансировка, разбиение и предобработка, ...). Результат этапа
+запоминается в общем кэше (shared_cache) по ключу: названию этапа, ключам входных
+этапов и параметрам. Ключ результата вычисляется из ключей входов без повторного
+хеширования таблиц, поэтому при перезапуске страницы выполняются только этапы,
+входы или параметры которых изменились. Исходные таблицы получают ключ по хешу
+содержимого (source.fingerprint) или по ключу загруженного файла.
+
+Функции этапов не должны выводить элементы Streamlit и изменять входы на месте:
+при повторном использовании результата функция не вызывается.
+"""
+import time
+
+import pandas as pd
+
+import source
+import shared_cache
+
+
+class Stage:
+    """
+    Результат этапа: значение и ключ, от которого зависят ключи следующих этапов.
+    """
+    def __init__(self, name: str, key: str, value):
+        self.name = name
+        self.key = key
+        self.value = value
+
+    def derive(self, name: str, value) -> 'Stage':
+        """
+        Часть результата этапа (например, элемент кортежа) как вход следующих этапов.
+        """
+        return Stage(name, source.fingerprint(self.key, name), value)
+
+
+class StageGraph:
+    """
+    Этапы одного выполнения страницы и журнал выполненных и повторно использованных этапов.
+    """
+    def __init__(self):
+        self.log = []
+
+    def source(self, name: str, value, key=None) -> Stage:
+        """
+        Исходные данные этапов. Без `key` ключ вычисляется по содержимому `value`.
+        """
+        return Stage(name, source.fingerprint('source', name, key if key is not None else value), value)
+
+    def run(self, name: str, fn, *inputs, depends=()) -> Stage:
+        """
+        Результат этапа `fn(*inputs)` из кэша или вычисленный заново.
+
+        Parameters:
+        name (str): Название этапа (одно значение в сессии на этап).
+        fn: Функция этапа.
+        *inputs: Результаты предыдущих этапов (Stage) или небольшие значения (хешируются).
+        depends (tuple): Параметры, от которых зависит результат помимо входов
+            (например, значения виджетов, используемые fn через замыкание).
+
+        Returns:
+        Stage: Результат этапа.
+        """
+        input_keys = [item.key if isinstance(item, Stage) else source.fingerprint(item) for item in inputs]
+        key = source.fingerprint('stage', name, *input_keys, repr(depends))
+        executed = []
+
+        def compute():
+            executed.append(True)
+            values = [item.value if isinstance(item, Stage) else item for item in inputs]
+            # Значение упаковывается в кортеж, чтобы результат None тоже запоминался
+            return (fn(*values),)
+
+        time_0 = time.perf_counter()
+        value, = shared_cache.session_get_or_create(f'stage_{name}', ('stage', key), compute)
+        self.log.append({'Этап': name, 'Выполнен': bool(executed), 'Время, с': time.perf_counter() - time_0})
+        return Stage(name, key, value)
+
+    def report(self) -> pd.DataFrame:
+        return pd.DataFrame(self.log, columns=['Этап', 'Выполнен', 'Время, с'])
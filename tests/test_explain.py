@@ -0,0 +1,51 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import explain
+import models
+
+
+FEATURES = ['GR', 'RHOB', 'NPHI', 'DT']
+
+
+def synthetic(n_rows: int = 500):
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(n_rows, len(FEATURES))).astype(np.float32)
+    y = X[:, 0] - 0.5 * X[:, 1] + 0.1 * rng.normal(size=n_rows)
+    return X, y
+
+
+@pytest.mark.parametrize('model_mode, params', [
+    ('XGBoost', {'n_estimators': 20, 'n_jobs': 1}),
+    ('CatBoost', {'iterations': 20, 'thread_count': 1}),
+])
+def test_feature_attributions_ndarray(model_mode, params):
+    # Без типов пород данные ГИС после предобработки - массив NumPy (source.scale_columns)
+    X, y = synthetic()
+    model = models.build_model(model_mode, dict(models.DEFAULT_PARAMS[model_mode], **params))
+    model.fit(X, y)
+    rows = explain.stratified_sample(explain.depth_strata(np.arange(len(X))), 100)
+
+    table = explain.feature_attributions(model, X, rows=rows, feature_names=FEATURES, chunk_rows=30, n_threads=1)
+
+    assert list(table.columns) == FEATURES + [explain.BASE_VALUE]
+    assert list(table.index) == list(rows)
+    np.testing.assert_allclose(table.sum(axis=1), model.predict(X[rows]), rtol=1e-3, atol=1e-3)
+
+
+def test_feature_attributions_groups_dataframe():
+    X, y = synthetic()
+    X = pd.DataFrame(X, columns=FEATURES)
+    model = models.build_model('XGBoost', dict(models.DEFAULT_PARAMS['XGBoost'], n_estimators=20, n_jobs=1))
+    model.fit(X, y)
+
+    table = explain.feature_attributions(model, X, groups={'RHOB': 'Плотность', 'NPHI': 'Плотность'}, n_threads=1)
+
+    assert list(table.columns) == ['GR', 'Плотность', 'DT', explain.BASE_VALUE]
+    np.testing.assert_allclose(table.sum(axis=1), model.predict(X), rtol=1e-3, atol=1e-3)
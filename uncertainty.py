@@ -0,0 +1,181 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import source
+import models
+import resources
+
+
+# Квантили прогноза: P10, P50, P90
+QUANTILES = (0.1, 0.5, 0.9)
+# Доля обучающей выборки для калибровки интервала квантильных моделей
+CALIBRATION_SHARE = 0.25
+
+
+def quantile_models(model, quantiles=QUANTILES):
+    """
+    Копии модели с квантильной функцией потерь.
+
+    CatBoost (MultiQuantile) и XGBoost (reg:quantileerror) прогнозируют все
+    квантили одной моделью; Gradient Boosting обучается отдельно для каждого квантиля.
+
+    Returns:
+    list: Необученные модели или None, если модель не поддерживает квантильную регрессию.
+    """
+    name = type(model).__name__
+    if name == 'CatBoostRegressor':
+        alphas = ','.join(str(q) for q in quantiles)
+        return [models.clone_models(model).set_params(loss_function=f'MultiQuantile:alpha={alphas}')]
+    if name == 'XGBRegressor':
+        return [models.clone_models(model).set_params(objective='reg:quantileerror',
+                                                      quantile_alpha=np.asarray(quantiles))]
+    if name == 'GradientBoostingRegressor':
+        return [models.clone_models(model).set_params(loss='quantile', alpha=q) for q in quantiles]
+    return None
+
+
+def _predict_columns(fitted, X):
+    """
+    Прогнозы моделей, объединенные в матрицу (n, число прогнозов).
+    """
+    return np.column_stack([np.asarray(model.predict(X)).reshape(X.shape[0], -1) for model in fitted])
+
+
+def calibrate_interval(q_cal, y_cal, quantiles=QUANTILES) -> float:
+    """
+    Поправка крайних квантилей по отложенной выборке (конформная квантильная регрессия).
+
+    Интервал [q_low - поправка, q_high + поправка] содержит долю
+    quantiles[-1] - quantiles[0] значений калибровочной выборки.
+
+    Returns:
+    float: Поправка (может быть отрицательной, если интервал модели шире необходимого).
+    """
+    y_cal = np.asarray(y_cal, dtype=np.float64).ravel()
+    scores = np.maximum(q_cal[:, 0] - y_cal, y_cal - q_cal[:, -1])
+    n = len(scores)
+    level = min(np.ceil((n + 1) * (quantiles[-1] - quantiles[0])) / n, 1.0)
+    return float(np.quantile(scores, level))
+
+
+def _run_parallel(fn, items, n_threads, job=None, message=''):
+    """
+    Выполняет `fn` для каждого элемента в пуле потоков с отображением прогресса.
+    """
+    results = []
+    with ThreadPoolExecutor(max_workers=max(min(len(items), n_threads), 1)) as executor:
+        for done, result in enumerate(executor.map(fn, items), start=1):
+            results.append(result)
+            if job is not None:
+                job.report(done, len(items), message)
+    return results
+
+
+def fit_predict_quantiles(fit_fn, fit_args, X_train, y_train, X_test, X_all, quantiles=QUANTILES,
+                          n_boot=20, random_state=42, n_threads=None, job=None, **fit_kwargs):
+    """
+    Квантили прогноза (по умолчанию P10/P50/P90) на тестовой выборке и на всем интервале ГИС.
+
+    Для Gradient Boosting, XGBoost и CatBoost обучаются модели с квантильной
+    функцией потерь на части обучающей выборки; крайние квантили расширяются
+    по остальной части (CALIBRATION_SHARE, см. calibrate_interval).
+    Для остальных моделей обучаются модели на бутстреп-выборках: центр интервала -
+    средний прогноз всех моделей (для стекинга - всех базовых моделей), квантили -
+    квантили остатков обучающих строк относительно среднего прогноза моделей,
+    не видевших эти строки (бутстреп с остатками вне выборки). Такой интервал
+    учитывает ошибку модели на новых данных, а не только разброс моделей.
+    Квантили вычисляются одной векторной операцией по всему интервалу.
+
+    Parameters:
+    fit_fn: Обучающая функция (models.fit_predict или models.fit_predict_stacking).
+    fit_args (tuple): Модели - аргументы fit_fn.
+    X_train, y_train: Обучающая выборка.
+    X_test: Тестовая выборка.
+    X_all: Данные ГИС по всему интервалу.
+    quantiles (tuple): Уровни квантилей по возрастанию.
+    n_boot (int): Число бутстреп-выборок.
+    random_state (int): Начальное состояние генератора бутстреп-выборок.
+    n_threads (int): Общее число потоков (по умолчанию бюджет задачи `job`, см. resources.job_threads).
+    job (jobs.Job): Фоновая задача для отображения прогресса и отмены.
+
+    Returns:
+    tuple: (квантили на тесте (n_test, k), квантили на всем интервале (n_all, k), способ оценки).
+    """
+    n_threads = resources.job_threads(job, n_threads)
+    fitted = None
+    if fit_fn is models.fit_predict:
+        fitted = quantile_models(fit_args[0], quantiles)
+
+    rng = np.random.default_rng(random_state)
+    n_train = X_train.shape[0]
+
+    if fitted is not None:
+        fitted = models.for_categorical(fitted, X_train)
+        method = 'Квантильная регрессия с калибровкой интервала'
+        per_model = max(n_threads // len(fitted), 1)
+        order = rng.permutation(n_train)
+        n_cal = int(n_train * CALIBRATION_SHARE)
+        cal_idx, fit_idx = order[:n_cal], order[n_cal:]
+
+        def fit_quantile(model):
+            models.limit_threads(model, per_model)
+            return model.fit(source.take_rows(X_train, fit_idx), source.take_rows(y_train, fit_idx))
+
+        fitted = _run_parallel(fit_quantile, fitted, n_threads, job, 'Обучено квантильных моделей')
+        # Исключение пересечения квантилей
+        q_test = np.sort(_predict_columns(fitted, X_test), axis=1)
+        q_all = np.sort(_predict_columns(fitted, X_all), axis=1)
+        if n_cal:
+            correction = calibrate_interval(np.sort(_predict_columns(fitted, source.take_rows(X_train, cal_idx)), axis=1),
+                                            source.take_rows(y_train, cal_idx), quantiles)
+            for q in (q_test, q_all):
+                q[:, 0] -= correction
+                q[:, -1] += correction
+        return np.sort(q_test, axis=1), np.sort(q_all, axis=1), method
+
+    if fit_fn is models.fit_predict_stacking:
+        method = 'Бутстреп базовых моделей стекинга с остатками вне выборки'
+        base_models = fit_args[0]
+    else:
+        method = 'Бутстреп с остатками вне выборки'
+        base_models = [fit_args[0]]
+
+    samples = rng.integers(0, n_train, size=(n_boot, n_train))
+    n_workers = max(min(n_boot, n_threads), 1)
+    per_fit = max(n_threads // n_workers, 1)
+
+    def fit_bootstrap(idx):
+        fitted = models.limit_threads(models.for_categorical(models.clone_models(base_models), X_train), per_fit)
+        for model in fitted:
+            model.fit(source.take_rows(X_train, idx), source.take_rows(y_train, idx))
+        # Прогноз строк, не попавших в бутстреп-выборку (для остальных строк - NaN)
+        oob = np.setdiff1d(np.arange(n_train), idx)
+        oob_pred = np.full((n_train, len(fitted)), np.nan)
+        if len(oob):
+            oob_pred[oob] = _predict_columns(fitted, source.take_rows(X_train, oob))
+        return fitted, oob_pred
+
+    results = _run_parallel(fit_bootstrap, list(samples), n_threads, job, 'Бутстреп-выборка')
+    fitted = sum([result[0] for result in results], [])
+    # Остаток каждой обучающей строки относительно среднего прогноза моделей, не видевших эту строку
+    oob_pred = np.column_stack([result[1] for result in results])
+    seen = ~np.isnan(oob_pred)
+    rows = seen.any(axis=1)
+    oob_mean = np.where(seen, oob_pred, 0.0)[rows].sum(axis=1) / seen[rows].sum(axis=1)
+    residuals = np.asarray(y_train, dtype=np.float64).ravel()[rows] - oob_mean
+    offsets = np.quantile(residuals, quantiles)
+
+    def bands(X):
+        # Средний прогноз всех моделей и квантили остатков вне выборки - одна векторная операция
+        return _predict_columns(fitted, X).mean(axis=1, keepdims=True) + offsets
+
+    return bands(X_test), bands(X_all), method
+
+
+def coverage(y_true, q_low, q_high) -> float:
+    """
+    Доля значений `y_true`, попавших в интервал [q_low, q_high].
+    """
+    y_true = np.asarray(y_true)
+    return float(np.mean((y_true >= q_low) & (y_true <= q_high)))
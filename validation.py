@@ -0,0 +1,137 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import source
+import models
+import resources
+
+
+class FoldData:
+    """
+    Признаки фолдов кросс-валидации в том же представлении, что и при обучении.
+
+    Набор one-hot колонок и кодов типов пород определяется один раз по всей выборке.
+    Для каждого фолда масштабирование обучается по обучающим строкам, и обе части
+    предобрабатываются source.GisTransform (как данные ГИС при обучении):
+    one-hot колонки или категориальная колонка типов пород, признаки типа `dtype`.
+
+    Parameters:
+    X (pd.DataFrame): Исходные признаки выборки.
+    numeric_features (list): Масштабируемые числовые признаки.
+    lith_name (str): Колонка с типами пород (или None).
+    do_ohe (bool): One-hot кодирование типов пород (иначе категориальная колонка, см. source.lith_categorical).
+    dtype: Тип масштабированных признаков (см. source.FEATURE_DTYPES).
+    """
+    def __init__(self, X: pd.DataFrame, numeric_features: list, lith_name: str = None, do_ohe: bool = True,
+                 dtype=np.float32):
+        self.X = X
+        self.numeric_features = list(numeric_features)
+        self.lith_name = lith_name
+        self.do_ohe = do_ohe
+        self.dtype = dtype
+        self.train_columns = self.numeric_features
+        self.categories = None
+        if lith_name is not None and do_ohe:
+            self.train_columns = self.numeric_features + list(
+                pd.get_dummies(X[lith_name], prefix=lith_name, dtype=np.float32).columns)
+        elif lith_name is not None:
+            self.categories = np.union1d(X[lith_name].unique(), [source.UNKNOWN_LITH])
+
+    def split(self, train_idx, test_idx):
+        """
+        Предобработанные признаки обучающей и тестовой части фолда.
+        """
+        train, test = self.X.iloc[train_idx], self.X.iloc[test_idx]
+        scaler = source.make_scaler('ss')
+        source.scale_columns(train, self.numeric_features, scaler, dtype=self.dtype, fit=True)
+        if self.lith_name is None:
+            transform = source.GisTransform(scaler, self.numeric_features, dtype=self.dtype)
+        else:
+            transform = source.GisTransform(scaler, self.numeric_features, lith_name=self.lith_name,
+                                            train_columns=self.train_columns, do_ohe=self.do_ohe,
+                                            categories=self.categories, dtype=self.dtype)
+        return transform(train), transform(test)
+
+
+def repeated_folds(n_samples: int, strata=None, n_splits: int = 5, n_repeats: int = 3, random_state: int = 322):
+    """
+    Индексы фолдов повторной K-fold кросс-валидации.
+
+    Если заданы `strata` (литотипы образцов), разбиение стратифицируется по ним;
+    число фолдов уменьшается до размера самого малочисленного литотипа.
+
+    Returns:
+    list: Пары (индексы обучающей части, индексы тестовой части).
+    """
+    from sklearn.model_selection import RepeatedKFold, RepeatedStratifiedKFold
+
+    if strata is not None:
+        n_splits = max(min(n_splits, int(pd.Series(strata).value_counts().min())), 2)
+        splitter = RepeatedStratifiedKFold(n_splits=n_splits, n_repeats=n_repeats, random_state=random_state)
+        return list(splitter.split(np.zeros(n_samples), np.asarray(strata)))
+    splitter = RepeatedKFold(n_splits=n_splits, n_repeats=n_repeats, random_state=random_state)
+    return list(splitter.split(np.zeros(n_samples)))
+
+
+def cross_validate(fit_fn, fit_args, X, y, numeric_features, lith_name=None, n_splits=5, n_repeats=3,
+                   random_state=322, n_threads=None, job=None, do_ohe=True, dtype=np.float32, **fit_kwargs):
+    """
+    Повторная (стратифицированная по литотипам) K-fold кросс-валидация модели.
+
+    Фолды обучаются параллельно в пуле потоков, каждая копия модели
+    ограничена равной долей ядер.
+
+    Parameters:
+    fit_fn: Обучающая функция (models.fit_predict или models.fit_predict_stacking).
+    fit_args (tuple): Модели - аргументы fit_fn.
+    X (pd.DataFrame): Исходные признаки выборки.
+    y (pd.Series): Целевая величина.
+    numeric_features (list): Числовые признаки, которые масштабируются.
+    lith_name (str): Колонка с литотипами для признаков и стратификации (или None).
+    n_splits (int): Число фолдов.
+    n_repeats (int): Число повторений разбиения.
+    random_state (int): Начальное состояние генератора разбиений.
+    n_threads (int): Общее число потоков (по умолчанию бюджет задачи `job`, см. resources.job_threads).
+    job (jobs.Job): Фоновая задача для отображения прогресса и отмены.
+    do_ohe (bool): Представление типов пород, как при обучении (см. FoldData).
+    dtype: Тип признаков, как при обучении.
+
+    Returns:
+    tuple: (метрики по фолдам, сводка среднее ± стандартное отклонение, общее время в секундах).
+    """
+    time_0 = time.perf_counter()
+    data = FoldData(X, numeric_features, lith_name, do_ohe=do_ohe, dtype=dtype)
+    y = np.asarray(y, dtype=np.float32)
+    folds = repeated_folds(len(y), X[lith_name] if lith_name is not None else None,
+                           n_splits, n_repeats, random_state)
+
+    n_workers, per_fold = resources.split_threads(resources.job_threads(job, n_threads), len(folds))
+    if fit_fn is models.fit_predict_stacking:
+        fit_kwargs = {**fit_kwargs, 'n_jobs': 1}
+
+    def run_fold(fold):
+        if job is not None:
+            job.raise_if_cancelled()
+        train_idx, test_idx = folds[fold]
+        X_train, X_test = data.split(train_idx, test_idx)
+        # Прогноз на всем интервале в кросс-валидации не нужен, вместо него передается тестовая часть
+        y_pred, _, _ = fit_fn(*models.clone_models(fit_args), X_train, y[train_idx], X_test, X_test,
+                              n_threads=per_fold, **fit_kwargs)
+        row = source.compute_metrics(y[test_idx], np.asarray(y_pred).ravel()).iloc[0].to_dict()
+        return {'Повтор': fold // (len(folds) // n_repeats) + 1, 'Фолд': fold % (len(folds) // n_repeats) + 1, **row}
+
+    rows = []
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        for done, row in enumerate(executor.map(run_fold, range(len(folds))), start=1):
+            rows.append(row)
+            if job is not None:
+                job.report(done, len(folds), 'Фолд кросс-валидации')
+
+    fold_metrics = pd.DataFrame(rows)
+    metric_names = [name for name in fold_metrics.columns if name not in ('Повтор', 'Фолд')]
+    summary = pd.DataFrame({'Среднее': fold_metrics[metric_names].mean(),
+                            'Ст. отклонение': fold_metrics[metric_names].std()}).T
+    return fold_metrics, summary, time.perf_counter() - time_0
@@ -0,0 +1,478 @@
+import numpy as np
+import pandas as pd
+
+
+class DepthIndexedLog:
+    """
+    Таблица каротажных (ГИС) или керновых данных, упорядоченная по глубине.
+
+    При создании таблица один раз сортируется по глубине, строки без глубины
+    удаляются, а повторяющиеся глубины (при duplicates='mean') усредняются.
+    После этого интервальные запросы и поиск ближайшей глубины выполняются
+    бинарным поиском (np.searchsorted) за O(log n) и возвращают срезы без копирования.
+
+    Parameters:
+    df (pd.DataFrame): Исходная таблица.
+    depth_name (str): Название колонки с глубиной.
+    duplicates (str): 'mean' - усреднять строки с одинаковой глубиной
+        (нецифровые колонки берутся из первой строки), 'keep' - оставить все строки.
+    """
+    def __init__(self, df: pd.DataFrame, depth_name: str = 'DEPT', duplicates: str = 'mean'):
+        if depth_name not in df.columns:
+            raise KeyError(f"В данных нет колонки с глубиной {depth_name}")
+        self.depth_name = depth_name
+        self.n_dropped = int(df[depth_name].isna().sum())
+        if self.n_dropped:
+            df = df[df[depth_name].notna()]
+
+        depth = df[depth_name].to_numpy()
+        self.was_sorted = bool(np.all(depth[1:] >= depth[:-1]))
+        if not self.was_sorted:
+            df = df.iloc[np.argsort(depth, kind='stable')]
+            depth = df[depth_name].to_numpy()
+
+        self.n_duplicates = int(np.count_nonzero(depth[1:] == depth[:-1]))
+        if self.n_duplicates and duplicates == 'mean':
+            df = self._merge_duplicates(df)
+            depth = df[depth_name].to_numpy()
+
+        if self.n_dropped or not self.was_sorted or not isinstance(df.index, pd.RangeIndex) \
+                or (self.n_duplicates and duplicates == 'mean'):
+            df = df.reset_index(drop=True)
+
+        self.frame = df
+        self.depth = depth
+
+    def _merge_duplicates(self, df):
+        numeric = [col for col in df.columns
+                   if col != self.depth_name and pd.api.types.is_float_dtype(df[col])]
+        other = [col for col in df.columns if col != self.depth_name and col not in numeric]
+        grouped = df.groupby(self.depth_name, sort=False)
+        merged = pd.concat([grouped[numeric].mean(), grouped[other].first()], axis=1)
+        return merged.reset_index()[df.columns]
+
+    def __len__(self):
+        return len(self.depth)
+
+    @property
+    def min_depth(self) -> float:
+        return self.depth[0] if len(self.depth) else np.nan
+
+    @property
+    def max_depth(self) -> float:
+        return self.depth[-1] if len(self.depth) else np.nan
+
+    def interval_slice(self, top: float, bottom: float, pad: int = 0) -> slice:
+        """
+        Позиционный срез строк с глубинами в [top, bottom].
+
+        pad - число дополнительных строк с каждой стороны интервала
+        (нужно для интерполяции на границах).
+        """
+        start = np.searchsorted(self.depth, top, side='left')
+        stop = np.searchsorted(self.depth, bottom, side='right')
+        return slice(max(start - pad, 0), min(stop + pad, len(self.depth)))
+
+    def interval(self, top: float, bottom: float) -> pd.DataFrame:
+        """
+        Строки с глубинами в [top, bottom] (срез, без копирования данных).
+        """
+        return self.frame.iloc[self.interval_slice(top, bottom)]
+
+    def nearest(self, depths) -> np.ndarray:
+        """
+        Индексы строк с ближайшей глубиной для каждого значения `depths`.
+        """
+        depths = np.asarray(depths)
+        if len(self.depth) == 0:
+            return np.zeros(depths.shape, dtype=np.intp)
+        right = np.clip(np.searchsorted(self.depth, depths), 1, len(self.depth) - 1) \
+            if len(self.depth) > 1 else np.zeros(depths.shape, dtype=np.intp)
+        left = np.maximum(right - 1, 0)
+        take_left = np.abs(depths - self.depth[left]) <= np.abs(self.depth[right] - depths)
+        return np.where(take_left, left, right)
+
+    def at_depths(self, depths, columns: list, tolerance: float = None) -> pd.DataFrame:
+        """
+        Значения колонок `columns` с ближайшей глубины таблицы для каждого значения `depths`.
+
+        Если ближайшая глубина отстоит больше чем на `tolerance` (м), значение - NaN.
+        """
+        depths = np.asarray(depths, dtype=np.float64)
+        if len(self.depth) == 0:
+            return pd.DataFrame({col: np.full(depths.shape, np.nan) for col in columns})
+        idx = self.nearest(depths)
+        result = {col: self.frame[col].to_numpy()[idx] for col in columns}
+        if tolerance is not None:
+            far = np.abs(self.depth[idx] - depths) > tolerance
+            if far.any():
+                result = {col: np.where(far, np.nan, values.astype(np.result_type(values.dtype, np.float32)))
+                          for col, values in result.items()}
+        return pd.DataFrame(result)
+
+    def interp(self, depths, columns: list) -> pd.DataFrame:
+        """
+        Линейная интерполяция колонок `columns` на глубины `depths`.
+
+        Используется только участок таблицы, покрывающий диапазон `depths`
+        (плюс по одной строке с каждой стороны).
+        """
+        depths = np.asarray(depths)
+        window = self.interval_slice(np.nanmin(depths), np.nanmax(depths), pad=1) \
+            if len(depths) else slice(0, 0)
+        x = self.depth[window]
+        result = {}
+        for col in columns:
+            values = self.frame[col].to_numpy()[window]
+            interpolated = np.interp(depths, x, values)
+            result[col] = interpolated.astype(np.float32) if values.dtype == np.float32 else interpolated
+        return pd.DataFrame(result)
+
+    def upscale(self, window: float, columns: list, at=None) -> pd.DataFrame:
+        """
+        Осреднение колонок `columns` в окне размером `window` (м) вокруг глубин `at`.
+
+        Моделирует вертикальное разрешение прибора: вместо значения в точке
+        берется среднее по окну. При window <= 0 выполняется обычная интерполяция.
+
+        Parameters:
+        window (float): Размер окна осреднения, м.
+        columns (list): Колонки для осреднения.
+        at: Глубины, на которые выполняется осреднение (по умолчанию глубины таблицы).
+
+        Returns:
+        pd.DataFrame: Осредненные значения в порядке `at`.
+        """
+        at = self.depth if at is None else np.asarray(at)
+        if window <= 0:
+            return self.interp(at, columns)
+        result = {}
+        for col in columns:
+            values = self.frame[col].to_numpy()
+            upscaled = window_mean(self.depth, values, window, at)
+            result[col] = upscaled.astype(np.float32) if values.dtype == np.float32 else upscaled
+        return pd.DataFrame(result)
+
+    def window_features(self, columns: list, window: float, stats=None, lag: float = None) -> pd.DataFrame:
+        """
+        Скользящие статистики колонок `columns` в окне `window` (м) для каждой глубины таблицы.
+
+        Размер окна в отсчетах определяется по медианному шагу глубин.
+        Названия колонок результата: '<колонка>_<статистика>_<окно>m'.
+
+        Parameters:
+        columns (list): Колонки (кривые ГИС).
+        window (float): Размер окна, м.
+        stats (tuple): Статистики из ROLLING_STATS (по умолчанию все).
+        lag (float): Смещение для значений выше/ниже по стволу, м (по умолчанию половина окна).
+
+        Returns:
+        pd.DataFrame: Признаки (float32) в порядке строк таблицы.
+        """
+        step = float(np.median(np.diff(self.depth))) if len(self.depth) > 1 else 1.0
+        n_window = max(int(round(window / step)), 1) // 2 * 2 + 1
+        n_lag = max(int(round((window / 2 if lag is None else lag) / step)), 1)
+        result = {}
+        for col in columns:
+            features = rolling_features(self.frame[col].to_numpy(), n_window, stats, self.depth, n_lag)
+            for stat, values in features.items():
+                result[f'{col}_{stat}_{window:g}m'] = values.astype(np.float32)
+        return pd.DataFrame(result)
+
+
+def window_mean(depth, values, window: float, at=None) -> np.ndarray:
+    """
+    Среднее значение кривой в окне [d - window/2, d + window/2] для каждой глубины d.
+
+    Границы окон находятся бинарным поиском, суммы - через префиксные суммы,
+    поэтому сложность линейна по числу отсчетов и не зависит от размера окна.
+    Пропуски (NaN) не учитываются; если в окне нет значений, результат NaN.
+
+    Parameters:
+    depth (np.ndarray): Отсортированные по возрастанию глубины отсчетов.
+    values (np.ndarray): Значения кривой на этих глубинах.
+    window (float): Размер окна осреднения, м.
+    at (np.ndarray): Глубины, для которых вычисляется среднее (по умолчанию depth).
+
+    Returns:
+    np.ndarray: Осредненные значения (float64).
+    """
+    depth = np.asarray(depth)
+    values = np.asarray(values, dtype=np.float64)
+    at = depth if at is None else np.asarray(at)
+
+    valid = ~np.isnan(values)
+    # Центрирование уменьшает ошибку округления префиксных сумм на длинных кривых
+    offset = values[valid].mean() if valid.any() else 0.0
+    csum = np.zeros(len(values) + 1)
+    np.cumsum(np.where(valid, values - offset, 0.0), out=csum[1:])
+    ccount = np.zeros(len(values) + 1, dtype=np.int64)
+    np.cumsum(valid, out=ccount[1:])
+
+    lo = np.searchsorted(depth, at - window / 2, side='left')
+    hi = np.searchsorted(depth, at + window / 2, side='right')
+    count = ccount[hi] - ccount[lo]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = (csum[hi] - csum[lo]) / count + offset
+    mean[count == 0] = np.nan
+    return mean
+
+
+# Статистики, доступные в rolling_features
+ROLLING_STATS = ('mean', 'std', 'min', 'max', 'grad', 'lag_up', 'lag_down')
+
+
+def rolling_features(values, window: int, stats=None, depth=None, lag: int = None) -> dict:
+    """
+    Скользящие статистики кривой в центрированном окне из `window` отсчетов.
+
+    Окна для минимума и максимума строятся представлением numpy.lib.stride_tricks.sliding_window_view
+    без копирования данных и без циклов по строкам; среднее и стандартное отклонение
+    вычисляются через префиксные суммы за время, не зависящее от размера окна.
+    На краях кривая продолжается крайними значениями.
+
+    Parameters:
+    values (np.ndarray): Значения кривой.
+    window (int): Размер окна в отсчетах (нечетный).
+    stats (tuple): Статистики из ROLLING_STATS (по умолчанию все).
+        'grad' - производная по глубине, 'lag_up'/'lag_down' - значения на `lag` отсчетов выше/ниже.
+    depth (np.ndarray): Глубины отсчетов для 'grad' (по умолчанию шаг 1).
+    lag (int): Смещение для 'lag_up'/'lag_down' в отсчетах (по умолчанию половина окна).
+
+    Returns:
+    dict: Название статистики -> массив (float64) той же длины, что и `values`.
+    """
+    from numpy.lib.stride_tricks import sliding_window_view
+
+    stats = ROLLING_STATS if stats is None else stats
+    values = np.asarray(values, dtype=np.float64)
+    half = window // 2
+    lag = max(half, 1) if lag is None else lag
+    n = len(values)
+    if n == 0:
+        return {stat: values.copy() for stat in stats}
+    padded = np.pad(values, half, mode='edge')
+
+    result = {}
+    if 'mean' in stats or 'std' in stats:
+        valid = ~np.isnan(padded)
+        # Центрирование уменьшает ошибку округления префиксных сумм на длинных кривых
+        offset = padded[valid].mean() if valid.any() else 0.0
+        centered = np.where(valid, padded - offset, 0.0)
+        csum = np.concatenate([[0.0], np.cumsum(centered)])
+        csum2 = np.concatenate([[0.0], np.cumsum(centered ** 2)])
+        ccount = np.concatenate([[0], np.cumsum(valid)])
+        count = ccount[window:window + n] - ccount[:n]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = (csum[window:window + n] - csum[:n]) / count
+            var = (csum2[window:window + n] - csum2[:n]) / count - mean ** 2
+        if 'mean' in stats:
+            result['mean'] = mean + offset
+        if 'std' in stats:
+            result['std'] = np.sqrt(np.clip(var, 0, None))
+    # Представление (window, n): строка k - кривая, сдвинутая на k отсчетов, поэтому минимум
+    # и максимум по окну считаются за window проходов по непрерывной памяти.
+    # Пропуски заменяются на ±inf, чтобы не учитываться в минимуме и максимуме
+    if 'min' in stats:
+        result['min'] = sliding_window_view(np.where(np.isnan(padded), np.inf, padded), n).min(axis=0)
+        result['min'][np.isinf(result['min'])] = np.nan
+    if 'max' in stats:
+        result['max'] = sliding_window_view(np.where(np.isnan(padded), -np.inf, padded), n).max(axis=0)
+        result['max'][np.isinf(result['max'])] = np.nan
+    if 'grad' in stats:
+        if n < 2:
+            result['grad'] = np.zeros(n)
+        elif depth is None:
+            result['grad'] = np.gradient(values)
+        else:
+            result['grad'] = np.gradient(values, np.asarray(depth, dtype=np.float64))
+    if 'lag_up' in stats or 'lag_down' in stats:
+        padded_lag = np.pad(values, lag, mode='edge')
+        result['lag_up'] = padded_lag[:n]
+        result['lag_down'] = padded_lag[2 * lag:2 * lag + n]
+    return {stat: result[stat] for stat in stats}
+
+
+def _xcorr(a, b, max_lag: int) -> np.ndarray:
+    """
+    Взаимная корреляция через FFT: r[k] = sum_j a[j] * b[j + k] для k в [-max_lag, max_lag].
+    """
+    size = 1 << (len(a) + len(b) - 1).bit_length()
+    r = np.fft.irfft(np.conj(np.fft.rfft(a, size)) * np.fft.rfft(b, size), size)
+    return r[np.arange(-max_lag, max_lag + 1) % size]
+
+
+def find_depth_shift(core_depth, core_values, log_depth, log_values, max_shift: float = 3.0,
+                     step: float = None, min_overlap: float = 0.5):
+    """
+    Подбор сдвига глубин керна относительно кривой ГИС по максимуму корреляции.
+
+    Кривая ГИС и измерения на керне переносятся на равномерную сетку с шагом `step`,
+    после чего коэффициент корреляции Пирсона для всех сдвигов от -max_shift до max_shift
+    вычисляется одной взаимной корреляцией через FFT. Выбирается сдвиг с максимальным
+    модулем корреляции (связь свойства с кривой может быть обратной).
+
+    Parameters:
+    core_depth, core_values: Глубины и значения измерений на керне.
+    log_depth, log_values: Отсортированные глубины и значения опорной кривой ГИС.
+    max_shift (float): Максимальный сдвиг, м.
+    step (float): Шаг сетки, м (по умолчанию медианный шаг ГИС).
+    min_overlap (float): Минимальная доля образцов, попадающих в интервал ГИС при сдвиге.
+
+    Returns:
+    tuple: (сдвиг, м; корреляция при этом сдвиге; массив сдвигов; массив корреляций).
+        Исправленные глубины керна: core_depth + сдвиг.
+    """
+    core_depth = np.asarray(core_depth, dtype=np.float64)
+    core_values = np.asarray(core_values, dtype=np.float64)
+    keep = ~(np.isnan(core_depth) | np.isnan(core_values))
+    core_depth, core_values = core_depth[keep], core_values[keep]
+    log_depth = np.asarray(log_depth, dtype=np.float64)
+    log_values = np.asarray(log_values, dtype=np.float64)
+    if len(core_depth) < 3 or len(log_depth) < 2:
+        return 0.0, np.nan, np.zeros(1), np.full(1, np.nan)
+    if step is None:
+        step = float(np.median(np.diff(log_depth)))
+    max_lag = int(round(max_shift / step))
+
+    # Равномерная сетка, покрывающая керн с запасом на максимальный сдвиг
+    top = core_depth.min() - max_lag * step
+    n_grid = int(np.ceil((core_depth.max() + max_lag * step - top) / step)) + 1
+    grid = top + step * np.arange(n_grid)
+
+    inside = (grid >= log_depth[0]) & (grid <= log_depth[-1])
+    g = np.interp(grid, log_depth, np.where(np.isnan(log_values), np.nanmean(log_values), log_values))
+    g_valid = (inside & ~np.isnan(np.interp(grid, log_depth, log_values))).astype(np.float64)
+    g = (g - g[g_valid > 0].mean()) * g_valid if g_valid.any() else g * 0
+
+    # Образцы керна раскладываются по ячейкам сетки (с суммированием в одной ячейке)
+    idx = np.clip(np.rint((core_depth - top) / step).astype(np.int64), 0, n_grid - 1)
+    c = core_values - core_values.mean()
+    m_grid = np.bincount(idx, minlength=n_grid).astype(np.float64)
+    c_grid = np.bincount(idx, weights=c, minlength=n_grid)
+    c2_grid = np.bincount(idx, weights=c * c, minlength=n_grid)
+
+    n = _xcorr(m_grid, g_valid, max_lag)
+    s_c = _xcorr(c_grid, g_valid, max_lag)
+    s_cc = _xcorr(c2_grid, g_valid, max_lag)
+    s_g = _xcorr(m_grid, g, max_lag)
+    s_gg = _xcorr(m_grid, g * g, max_lag)
+    s_cg = _xcorr(c_grid, g, max_lag)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        r = (n * s_cg - s_c * s_g) / np.sqrt(np.clip(n * s_cc - s_c ** 2, 0, None) 
+                                              * np.clip(n * s_gg - s_g ** 2, 0, None))
+    r[np.rint(n) < max(3, min_overlap * len(core_depth))] = np.nan
+
+    shifts = step * np.arange(-max_lag, max_lag + 1)
+    if np.all(np.isnan(r)):
+        return 0.0, np.nan, shifts, r
+    best = int(np.nanargmax(np.abs(r)))
+    return float(shifts[best]), float(r[best]), shifts, r
+
+
+def find_depth_shifts(core_depth, core_values, log_depth, log_values, max_shift: float = 3.0,
+                      step: float = None, interval: float = None) -> pd.DataFrame:
+    """
+    Подбор сдвига глубин керна для всей скважины или по интервалам длиной `interval` м.
+
+    Returns:
+    pd.DataFrame: Колонки 'top', 'bottom', 'n', 'shift', 'r' - по строке на интервал.
+    """
+    core_depth = np.asarray(core_depth, dtype=np.float64)
+    core_values = np.asarray(core_values, dtype=np.float64)
+    if interval:
+        edges = np.arange(np.nanmin(core_depth), np.nanmax(core_depth) + interval, interval)
+    else:
+        edges = np.array([np.nanmin(core_depth), np.nanmax(core_depth)])
+    rows = []
+    for top, bottom in zip(edges[:-1], edges[1:]):
+        in_interval = (core_depth >= top) & ((core_depth < bottom) | (bottom == edges[-1]))
+        shift, r, _, _ = find_depth_shift(core_depth[in_interval], core_values[in_interval],
+                                          log_depth, log_values, max_shift=max_shift, step=step)
+        rows.append({'top': top, 'bottom': bottom, 'n': int(in_interval.sum()), 'shift': shift, 'r': r})
+    return pd.DataFrame(rows)
+
+
+def apply_depth_shifts(core_depth, shifts: pd.DataFrame) -> np.ndarray:
+    """
+    Сдвигает глубины керна на значения из таблицы find_depth_shifts.
+    """
+    core_depth = np.asarray(core_depth, dtype=np.float64)
+    pos = np.clip(np.searchsorted(shifts['top'].to_numpy(), core_depth, side='right') - 1, 0, len(shifts) - 1)
+    return core_depth + shifts['shift'].to_numpy()[pos]
+
+
+def codes_mask(values, allowed) -> np.ndarray:
+    """
+    Маска принадлежности кодов (например, типов пород) множеству `allowed`.
+
+    Допустимые коды сортируются один раз, проверка выполняется бинарным поиском.
+    """
+    values = np.asarray(values)
+    allowed = np.unique(np.asarray(allowed))
+    if len(allowed) == 0:
+        return np.zeros(values.shape, dtype=bool)
+    pos = np.clip(np.searchsorted(allowed, values), 0, len(allowed) - 1)
+    return allowed[pos] == values
+
+
+def code_counts(values) -> pd.Series:
+    """
+    Число строк с каждым кодом (например, типом пород), по возрастанию кода. Пропуски не учитываются.
+
+    Целочисленные коды считаются за один проход np.bincount (без сортировки
+    и приведения к строкам), остальные значения - через np.unique.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    values = values[~np.isnan(values)]
+    if len(values) == 0:
+        return pd.Series(dtype=np.int64)
+    low, high = values.min(), values.max()
+    if high - low <= 10 * len(values) + 1024 and np.array_equal(values, np.floor(values)):
+        counts = np.bincount((values - low).astype(np.int64))
+        codes = np.flatnonzero(counts)
+        return pd.Series(counts[codes], index=(codes + int(low)).astype(np.int64))
+    codes, counts = np.unique(values, return_counts=True)
+    return pd.Series(counts, index=codes)
+
+
+def code_coverage(core_counts: pd.Series, gis_counts: pd.Series) -> pd.DataFrame:
+    """
+    Сравнение представленности кодов в данных керна и ГИС (по результатам code_counts).
+
+    Returns:
+    pd.DataFrame: Индекс - код; колонки 'Керн', 'ГИС' (число строк) и 'Керн, %', 'ГИС, %' (доли).
+    """
+    table = pd.concat({'Керн': core_counts, 'ГИС': gis_counts}, axis=1).fillna(0).astype(np.int64).sort_index()
+    for col in ('Керн', 'ГИС'):
+        total = table[col].sum()
+        table[f'{col}, %'] = 100 * table[col] / total if total else 0.0
+    return table
+
+
+def minmax_indices(values, max_points: int) -> np.ndarray:
+    """
+    Номера строк для отображения кривой не более чем `max_points` точками.
+
+    Ряд делится на равные участки, на каждом сохраняются точки минимума и максимума,
+    поэтому выбросы и пики кривой остаются на графике. Пропуски не выбираются.
+
+    Returns:
+    np.ndarray: Номера строк по возрастанию.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    n = len(values)
+    if n <= max_points:
+        return np.arange(n)
+    bucket = int(np.ceil(n / max(max_points // 2, 1)))
+    n_buckets = int(np.ceil(n / bucket))
+    padded = np.full(n_buckets * bucket, np.nan)
+    padded[:n] = values
+    blocks = padded.reshape(n_buckets, bucket)
+    valid = ~np.isnan(blocks)
+    low = np.argmin(np.where(valid, blocks, np.inf), axis=1)
+    high = np.argmax(np.where(valid, blocks, -np.inf), axis=1)
+    starts = np.arange(n_buckets) * bucket
+    has_values = valid.any(axis=1)
+    return np.unique(np.concatenate([(starts + low)[has_values], (starts + high)[has_values]]))